@@ -6,8 +6,29 @@ Top-level package for elib_run.
 from pkg_resources import DistributionNotFound, get_distribution
 
 # noinspection PyProtectedMember
+from elib_run._run._coprocess import (
+    Coprocess, CoprocessError, CoprocessPool, CoprocessTimeoutError, Framing, LengthPrefixedFraming, LineFraming,
+    SentinelFraming,
+)
+from elib_run._run._executor import Executor, LocalExecutor, SocketExecutor
+from elib_run._run._graph import CommandGraph, Node, NodeResult
+from elib_run._run._governor import Governor, GovernorMetrics, configure_governor, governor_metrics
+from elib_run._run._handle import RunHandle, start
+from elib_run._run._history import HistoryStore, JobStats
+from elib_run._run._limits import ResourceLimits
+from elib_run._run._parsers import CallableParser, JsonLinesParser, LineParser, RegexParser
+from elib_run._run._pty import PtyExecutor
+from elib_run._run._recording import Recorder, RecordingNotFoundError, recording
+from elib_run._run._result import RunResult
+from elib_run._run._retry import Attempt, RetryPolicy
 from elib_run._run._run import run
-from ._exc import ELIBRunError, ExecutableNotFoundError
+from elib_run._run._sampler import ResourceSample, ResourceSampler
+from elib_run._run._scheduler import BatchJob, BatchScheduler
+from elib_run._run._shard import ShardedResult, run_sharded
+from elib_run._run._shutdown import active_runs, install_signal_handlers, shutdown, uninstall_signal_handlers
+from elib_run._run._timings import LineTimings, Silence
+from elib_run._run._trigger import Trigger
+from ._exc import ELIBRunError, ExecutableNotFoundError, ShutdownError
 from ._find_exe import find_executable
 
 try:
@@ -19,7 +40,20 @@ except DistributionNotFound:  # pragma: no cover
 __author__ = """etcher"""
 __email__ = 'etcher@daribouca.net'
 
-__all__ = ['run', 'find_executable', 'ELIBRunError', 'ExecutableNotFoundError']
+__all__ = [
+    'run', 'start', 'RunHandle', 'RunResult', 'Trigger', 'ResourceLimits', 'RetryPolicy', 'Attempt',
+    'LineParser', 'RegexParser', 'JsonLinesParser', 'CallableParser',
+    'Executor', 'LocalExecutor', 'SocketExecutor', 'PtyExecutor', 'ResourceSample', 'ResourceSampler',
+    'LineTimings', 'Silence',
+    'CoprocessPool', 'Coprocess', 'CoprocessError', 'CoprocessTimeoutError', 'Framing', 'LineFraming',
+    'LengthPrefixedFraming', 'SentinelFraming',
+    'CommandGraph', 'Node', 'NodeResult', 'run_sharded', 'ShardedResult',
+    'HistoryStore', 'JobStats', 'BatchScheduler', 'BatchJob',
+    'Governor', 'GovernorMetrics', 'configure_governor', 'governor_metrics',
+    'recording', 'Recorder', 'RecordingNotFoundError',
+    'shutdown', 'install_signal_handlers', 'uninstall_signal_handlers', 'active_runs', 'ShutdownError',
+    'find_executable', 'ELIBRunError', 'ExecutableNotFoundError',
+]
 
 
 # pylint: disable=unused-argument,missing-docstring
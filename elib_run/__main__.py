@@ -0,0 +1,9 @@
+# coding=utf-8
+"""
+Runs a batch of commands in parallel: see "python -m elib_run --help"
+"""
+import sys
+
+from elib_run._cli import main
+
+sys.exit(main())
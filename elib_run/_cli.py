@@ -0,0 +1,241 @@
+# coding=utf-8
+"""
+Command-line entry point: runs a batch of commands in parallel ("python -m elib_run" or "elib-run")
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import pathlib
+import shlex
+import shutil
+import sys
+import time
+import typing
+
+# noinspection PyCompatibility
+import dataclasses
+
+from elib_run._exc import ELIBRunError, ExecutableNotFoundError, ProcessTimeoutError
+from elib_run._run._run import run
+
+# Same conventions as "timeout" and shells
+_RETURN_CODE_TIMEOUT = 124
+_RETURN_CODE_NOT_FOUND = 127
+_RETURN_CODE_NOT_EXECUTABLE = 126
+_RETURN_CODE_ERROR = 125
+
+
+@dataclasses.dataclass
+class BatchCommand:
+    """
+    Command of a batch, with its options and (once run) its outcome
+    """
+    cmd: typing.Union[str, typing.List[str]]
+    cwd: str = '.'
+    timeout: typing.Optional[float] = None
+    filters: typing.Optional[typing.List[str]] = None
+    output: str = ''
+    return_code: typing.Optional[int] = None
+    duration: float = 0.0
+    error: typing.Optional[str] = None
+
+    @property
+    def display(self) -> str:
+        """
+        :return: command line, for display
+        :rtype: str
+        """
+        return self.cmd if isinstance(self.cmd, str) else ' '.join(self.cmd)
+
+    def summary(self) -> typing.Dict[str, typing.Any]:
+        """
+        :return: JSON-serializable outcome of the command
+        :rtype: dict
+        """
+        return {
+            'cmd': self.cmd,
+            'cwd': self.cwd,
+            'return_code': self.return_code,
+            'duration': round(self.duration, 6),
+            'error': self.error,
+        }
+
+
+def parse_line(line: str, defaults: argparse.Namespace) -> typing.Optional[BatchCommand]:
+    """
+    Parses a line of a batch file
+
+    Lines are either a command, or a JSON object with a "cmd" (string or list), and optionally "cwd", "timeout" and
+    "filters". Empty lines and lines starting with "#" are ignored.
+
+    :param line: line to parse
+    :type line: str
+    :param defaults: command-line options, for the values a line does not give
+    :type defaults: argparse.Namespace
+    :return: command, or None for ignored lines
+    :rtype: optional BatchCommand
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    options: typing.Dict[str, typing.Any] = {'cmd': line}
+    if line.startswith('{'):
+        try:
+            options = json.loads(line)
+        except ValueError as error:
+            raise ValueError(f'invalid JSON line: {line}: {error}')
+        if not isinstance(options.get('cmd'), (str, list)):
+            raise ValueError(f'missing "cmd" in JSON line: {line}')
+        unknown = set(options) - {'cmd', 'cwd', 'timeout', 'filters'}
+        if unknown:
+            raise ValueError(f'unknown keys in JSON line: {", ".join(sorted(unknown))}')
+    return BatchCommand(
+        cmd=options['cmd'],
+        cwd=options.get('cwd', defaults.cwd),
+        timeout=options.get('timeout', defaults.timeout),
+        filters=options.get('filters', defaults.filters),
+    )
+
+
+def resolve_command(cmd: typing.Union[str, typing.List[str]], cwd: str) -> typing.List[typing.Union[str, pathlib.Path]]:
+    """
+    Splits a command like a shell would, and resolves its executable like a shell would
+
+    Paths to the executable (absolute, or relative to "cwd") are used as is; names are looked up in PATH, and left
+    for "run" to find (in the Python scripts directory, with an ".exe" extension) if they are not there.
+
+    :param cmd: command line, or list of arguments
+    :type cmd: str or list of str
+    :param cwd: working directory of the command
+    :type cwd: str
+    :return: arguments, with the executable as a pathlib.Path if it was found
+    :rtype: list
+    """
+    if isinstance(cmd, str):
+        argv = shlex.split(cmd, posix=os.name != 'nt')
+        if os.name == 'nt':
+            argv = [arg[1:-1] if len(arg) > 1 and arg[0] == arg[-1] == '"' else arg for arg in argv]
+    else:
+        argv = list(cmd)
+    if not argv:
+        raise ValueError('empty command')
+    exe_name, *args = argv
+    if os.sep in exe_name or (os.altsep and os.altsep in exe_name):
+        return [pathlib.Path(cwd, exe_name)] + args
+    exe_path = shutil.which(exe_name)
+    if exe_path is not None:
+        return [pathlib.Path(exe_path)] + args
+    return argv
+
+
+def run_command(command: BatchCommand) -> BatchCommand:
+    """
+    Runs a command of the batch, recording its outcome (failures included) instead of raising
+
+    :param command: command to run
+    :type command: BatchCommand
+    :return: the same command
+    :rtype: BatchCommand
+    """
+    kwargs: typing.Dict[str, typing.Any] = {'cwd': command.cwd, 'filters': command.filters}
+    if command.timeout is not None:
+        kwargs['timeout'] = command.timeout
+    start = time.monotonic()
+    try:
+        argv = resolve_command(command.cmd, command.cwd)
+        command.output, command.return_code = run(argv, mute=True, failure_ok=True, **kwargs)
+    except ExecutableNotFoundError as error:
+        command.return_code, command.error = _RETURN_CODE_NOT_FOUND, str(error)
+    except ProcessTimeoutError as error:
+        command.return_code, command.error = _RETURN_CODE_TIMEOUT, str(error)
+    except OSError as error:
+        # failed to spawn: missing file or working directory, not an executable, permission denied
+        not_found = isinstance(error, FileNotFoundError)
+        command.return_code = _RETURN_CODE_NOT_FOUND if not_found else _RETURN_CODE_NOT_EXECUTABLE
+        command.error = str(error)
+    except (ELIBRunError, TypeError, ValueError) as error:
+        command.return_code, command.error = _RETURN_CODE_ERROR, str(error)
+    command.duration = time.monotonic() - start
+    return command
+
+
+def _print_block(command: BatchCommand, stream: typing.TextIO):
+    status = f'return code {command.return_code}' if command.error is None else command.error
+    lines = [f'==> {command.display} ({status}, {command.duration:.2f}s)']
+    if command.output:
+        lines.append(command.output)
+    stream.write('\n'.join(lines) + '\n')
+    stream.flush()
+
+
+def _parse_args(argv: typing.Optional[typing.List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='elib-run',
+        description='Runs commands in parallel, printing the output of each command as a block when it completes. '
+                    'Commands come from the arguments, from a file, or from the standard input; one per line, or '
+                    'as JSON lines with "cmd", "cwd", "timeout" and "filters".',
+    )
+    parser.add_argument('commands', nargs='*', help='commands to run')
+    parser.add_argument('-f', '--file', help='file to read commands from ("-" for the standard input)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='maximum number of commands running at once (default: number of CPUs)')
+    parser.add_argument('--cwd', default='.', help='default working directory')
+    parser.add_argument('--timeout', type=float, help='default timeout, in seconds')
+    parser.add_argument('--filter', dest='filters', action='append',
+                        help='default regex of lines to filter out of the output (may be repeated)')
+    parser.add_argument('--summary', help='file to write a JSON summary to ("-" for the standard output)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the output of the commands')
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    return args
+
+
+def _read_lines(args: argparse.Namespace) -> typing.List[str]:
+    lines = list(args.commands)
+    if args.file == '-' or (args.file is None and not args.commands):
+        lines.extend(sys.stdin.read().splitlines())
+    elif args.file is not None:
+        with open(args.file, encoding='utf8') as batch_file:
+            lines.extend(batch_file.read().splitlines())
+    return lines
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    """
+    Runs the command-line interface
+
+    :param argv: command-line arguments (defaults to sys.argv)
+    :type argv: optional list of str
+    :return: 0 if all commands succeeded, 1 otherwise, 2 for usage errors
+    :rtype: int
+    """
+    args = _parse_args(argv)
+    try:
+        commands = [command for command in (parse_line(line, args) for line in _read_lines(args)) if command]
+    except (OSError, ValueError) as error:
+        sys.stderr.write(f'elib-run: {error}\n')
+        return 2
+
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(run_command, command) for command in commands]
+        for future in concurrent.futures.as_completed(futures):
+            if not args.quiet:
+                _print_block(future.result(), sys.stdout)
+    duration = time.monotonic() - start
+
+    failed = sum(1 for command in commands if command.return_code != 0)
+    if args.summary is not None:
+        summary = json.dumps({
+            'commands': [command.summary() for command in commands],
+            'duration': round(duration, 6),
+            'failed': failed,
+        }, indent=1)
+        if args.summary == '-':
+            sys.stdout.write(summary + '\n')
+        else:
+            with open(args.summary, 'w', encoding='utf8') as summary_file:
+                summary_file.write(summary + '\n')
+    return 1 if failed else 0
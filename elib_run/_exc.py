@@ -18,10 +18,21 @@ class ExecutableNotFoundError(ELIBRunError):
 
 
 class ProcessTimeoutError(ELIBRunError):
-    """Raised when a process runs for longer than a given timeout"""
+    """
+    Raised when a process runs for longer than a given timeout ("wall" kind), or produces no output for longer
+    than a given timeout ("idle" kind)
+    """
 
-    def __init__(self, exe_name: str, timeout: float, msg: typing.Optional[str] = None) -> None:
+    def __init__(self, exe_name: str, timeout: float, msg: typing.Optional[str] = None, kind: str = 'wall') -> None:
         self.exe_name = exe_name
-        super(ProcessTimeoutError, self).__init__(
-            f'process timeout: {exe_name} ran for more than {timeout} seconds ({msg})'
-        )
+        self.timeout = timeout
+        self.kind = kind
+        if kind == 'idle':
+            description = f'produced no output for more than {timeout} seconds'
+        else:
+            description = f'ran for more than {timeout} seconds'
+        super(ProcessTimeoutError, self).__init__(f'process timeout: {exe_name} {description} ({msg})')
+
+
+class ShutdownError(ELIBRunError):
+    """Raised when a run is started after "shutdown" was called"""
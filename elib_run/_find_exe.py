@@ -7,10 +7,13 @@ Finds an executable on the system
 import logging
 import os
 import sys
+import threading
 import typing
 from pathlib import Path
 
+# Read and written from any thread calling "run": always go through the lock
 _KNOWN_EXECUTABLES: typing.Dict[str, Path] = {}
+_KNOWN_EXECUTABLES_LOCK = threading.Lock()
 
 _LOGGER = logging.getLogger('elib_run')
 
@@ -39,8 +42,10 @@ def find_executable(executable: str, *paths: str) -> typing.Optional[Path]:
     if not executable.endswith('.exe'):
         executable = f'{executable}.exe'
 
-    if executable in _KNOWN_EXECUTABLES:
-        return _KNOWN_EXECUTABLES[executable]
+    with _KNOWN_EXECUTABLES_LOCK:
+        known_path = _KNOWN_EXECUTABLES.get(executable)
+    if known_path is not None:
+        return known_path
 
     output = f'{executable}'
 
@@ -57,6 +62,7 @@ def find_executable(executable: str, *paths: str) -> typing.Optional[Path]:
             _LOGGER.error('%s -> not found', output)
             return None
 
-    _KNOWN_EXECUTABLES[executable] = executable_path
+    with _KNOWN_EXECUTABLES_LOCK:
+        _KNOWN_EXECUTABLES[executable] = executable_path
     _LOGGER.info('%s -> %s', output, str(executable_path))
     return executable_path
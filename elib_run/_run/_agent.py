@@ -0,0 +1,176 @@
+# coding=utf-8
+"""
+Stand-in agent for SocketExecutor: spawns the processes it is asked for on this machine, and streams their output
+
+Run it with "python -m elib_run._run._agent [--host HOST] [--port PORT]"; it prints "listening on HOST:PORT" once
+ready. LocalAgent starts one in a sub-process.
+
+The agent runs whatever it is sent, without authentication: it only listens on loopback addresses.
+"""
+import argparse
+import ipaddress
+import json
+import os
+import pathlib
+import socketserver
+import subprocess
+import sys
+import threading
+import typing
+
+from elib_run._exc import ELIBRunError
+from elib_run._run._executor import (
+    FRAME_ERROR, FRAME_EXIT, FRAME_KILL, FRAME_OUTPUT, FRAME_SPAWN, FRAME_STARTED, SocketExecutor, recv_frame,
+    send_frame,
+)
+
+_READ_SIZE = 65536
+_PACKAGE_ROOT = pathlib.Path(__file__).parent.parent.parent
+
+
+class _AgentHandler(socketserver.BaseRequestHandler):
+    """
+    Handles one connection, i.e. one process
+    """
+
+    def _watch_kill(self, process: subprocess.Popen):
+        try:
+            while True:
+                kind, _ = recv_frame(self.request)
+                if kind == FRAME_KILL:
+                    process.kill()
+        except OSError:
+            # connection closed: a client gone before the process exited cannot kill it anymore
+            if process.poll() is None:
+                process.kill()
+
+    def handle(self):
+        kind, payload = recv_frame(self.request)
+        if kind != FRAME_SPAWN:
+            send_frame(self.request, FRAME_ERROR, f'expected a spawn frame, got {kind!r}'.encode('utf8'))
+            return
+        spec = json.loads(payload.decode('utf8'))
+        try:
+            process = subprocess.Popen(
+                spec['argv'], cwd=spec['cwd'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0,
+            )
+        except OSError as error:
+            send_frame(self.request, FRAME_ERROR, str(error).encode('utf8'))
+            return
+        send_frame(self.request, FRAME_STARTED, json.dumps({'pid': process.pid}).encode('utf8'))
+        threading.Thread(target=self._watch_kill, args=(process,), daemon=True).start()
+        try:
+            with process.stdout:
+                while True:
+                    data = os.read(process.stdout.fileno(), _READ_SIZE)
+                    if not data:
+                        break
+                    send_frame(self.request, FRAME_OUTPUT, data)
+            return_code = process.wait()
+            send_frame(self.request, FRAME_EXIT, json.dumps({'return_code': return_code}).encode('utf8'))
+        except OSError:
+            # the client is gone: nobody reads the output anymore
+            process.kill()
+            process.wait()
+
+
+class AgentServer(socketserver.ThreadingTCPServer):
+    """
+    Agent listening on a TCP socket, handling each connection in its own thread
+
+    Only loopback addresses are accepted, since any local client may run any command through the agent.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: typing.Tuple[str, int] = ('127.0.0.1', 0)) -> None:
+        host = address[0]
+        if host != 'localhost':
+            try:
+                loopback = ipaddress.ip_address(host).is_loopback
+            except ValueError:
+                loopback = False
+            if not loopback:
+                raise ValueError(f'expected a loopback address, got {host!r}')
+        super(AgentServer, self).__init__(address, _AgentHandler)
+
+
+class LocalAgent:
+    """
+    Runs the stand-in agent in a sub-process of this machine, for tests and benchmarks
+
+    Use as a context manager; "executor" is a SocketExecutor connected to it.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.process: typing.Optional[subprocess.Popen] = None
+        self.address: typing.Optional[typing.Tuple[str, int]] = None
+
+    def start(self) -> 'LocalAgent':
+        """
+        Starts the agent, and waits for it to listen
+        """
+        # run this very copy of elib_run, installed or not
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, (str(_PACKAGE_ROOT), env.get('PYTHONPATH'))))
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'elib_run._run._agent', '--host', self.host, '--port', str(self.port)],
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+        line = self.process.stdout.readline().decode('utf8').strip()  # type: ignore
+        if not line.startswith('listening on '):
+            self.stop()
+            raise ELIBRunError(f'agent failed to start: {line}')
+        host, port = line[len('listening on '):].rsplit(':', 1)
+        self.address = (host, int(port))
+        return self
+
+    def stop(self):
+        """
+        Stops the agent
+        """
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process.stdout.close()  # type: ignore
+            self.process = None
+
+    @property
+    def executor(self) -> SocketExecutor:
+        """
+        :return: executor connected to this agent
+        :rtype: SocketExecutor
+        """
+        if self.address is None:
+            raise ELIBRunError('agent not started')
+        return SocketExecutor(self.address)
+
+    def __enter__(self) -> 'LocalAgent':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main(argv: typing.Optional[typing.List[str]] = None):  # pragma: no cover
+    """
+    Runs the agent until interrupted
+    """
+    parser = argparse.ArgumentParser(description='elib_run stand-in agent')
+    parser.add_argument('--host', default='127.0.0.1', help='loopback address to listen on')
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args(argv)
+    with AgentServer((args.host, args.port)) as server:
+        host, port = server.server_address[:2]
+        print(f'listening on {host}:{port}', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -3,13 +3,16 @@
 Responsible for reading and parsing output from a running sub-process
 """
 import logging
-import re
+import time
 import typing
 
 # noinspection PyProtectedMember
+from elib_run._run._decoder import StreamDecoder
+from elib_run._run._executor import StreamCapture
+from elib_run._run._patterns import compile_pattern
 from elib_run._run._run_context import RunContext
 
-_LOGGER_PROCESS = logging.getLogger('elib_run.process')
+_LOGGER = logging.getLogger('elib_run')
 
 
 def filter_line(line: str, context: RunContext) -> typing.Optional[str]:
@@ -25,60 +28,180 @@ def filter_line(line: str, context: RunContext) -> typing.Optional[str]:
     """
     if context.filters is not None:
         for filter_ in context.filters:
-            if re.match(filter_, line):
+            if compile_pattern(filter_).match(line):
                 return None
     return line
 
 
-def decode_and_filter(line: bytes, context: RunContext) -> typing.Optional[str]:
+def filter_decoded_line(line: str, context: RunContext) -> typing.Optional[str]:
     """
-    Decodes a line that was captured from the running process using a given encoding (defaults to UTF8)
+    Runs a decoded line into the filters, and output the line back (stripped) if no filter catches it.
 
-    Runs that line into the filters, and output the decoded line back if no filter catches it.
-
-    :param line: line to parse
+    :param line: line to filter
     :type line: str
     :param context: run context
     :type context: RunContext
     :return: optional line
     :rtype: str
     """
-    line_str: str = line.decode(context.console_encoding, errors='replace')
-    filtered_line: typing.Optional[str] = filter_line(line_str, context)
+    filtered_line: typing.Optional[str] = filter_line(line, context)
     if filtered_line:
         return filtered_line.rstrip()
 
     return None
 
 
+def parse_line(line: str, context: RunContext):
+    """
+    Runs a line of output into the parsers of the context, collecting the records they return
+
+    :param line: line to parse
+    :type line: str
+    :param context: run context
+    :type context: RunContext
+    """
+    for parser in context.parsers:
+        record = parser.parse(line)
+        if record is not None:
+            context.parsed_records.setdefault(parser.name, []).append(record)
+
+
+def check_triggers(line: str, context: RunContext) -> bool:
+    """
+    Runs a line of output into the triggers of the context
+
+    Callback triggers are called right away; the first "stop" or "kill" trigger that matches is stored in the
+    context for the monitor to act upon.
+
+    :param line: line to check
+    :type line: str
+    :param context: run context
+    :type context: RunContext
+    :return: True if the capture should stop
+    :rtype: bool
+    """
+    if context.triggers is not None:
+        for trigger in context.triggers:
+            if trigger.matches(line):
+                _LOGGER.debug('%s: trigger "%s" matched: %s', context.exe_short_name, trigger.pattern, line)
+                if trigger.action == 'callback':
+                    trigger.callback(line)
+                else:
+                    context.fired_trigger = trigger
+                    return True
+    return False
+
+
+def process_line(line_str: str, context: RunContext) -> bool:
+    """
+    Parses, filters, logs and buffers a decoded line of output
+
+    :param line_str: decoded line
+    :type line_str: str
+    :param context: run context
+    :type context: RunContext
+    :return: True if a trigger asks to stop reading
+    :rtype: bool
+    """
+    # Parse before filtering, so that machine-readable lines can be parsed and still kept out of the output
+    if context.parsers:
+        parse_line(line_str.rstrip(), context)
+
+    line = filter_decoded_line(line_str, context)
+
+    if line:
+        if not context.mute:
+
+            # Print in real time
+            context.process_logger.log_line(line)
+
+        # Buffer the line
+        context.process_output_chunks.append(line)
+        if context.line_timings is not None:
+            context.line_timings.append(time.monotonic() - context.start_time)
+
+        # Stop reading if a trigger asks for it
+        if context.fired_trigger is None:
+            return check_triggers(line, context)
+
+    return False
+
+
+def read_output(context: RunContext) -> typing.Tuple[typing.Any, bytes]:
+    """
+    Reads the next chunk of raw output from the running process, without waiting
+
+    :param context: run context
+    :type context: RunContext
+    :return: stream the chunk comes from (None if the capture does not tell them apart), and raw output (empty if
+        there is none)
+    :rtype: tuple
+    """
+    if isinstance(context.capture, StreamCapture):
+        chunk = context.capture.read_chunk(block=False)
+        return (None, b'') if chunk is None else chunk
+    return None, context.capture.readline(block=False)
+
+
+def get_decoder(stream: typing.Any, context: RunContext) -> StreamDecoder:
+    """
+    Returns the decoder of a stream of the running process, creating it on first use
+
+    Each stream has its own decoder, so that a line left unterminated on one stream is not joined with the output
+    of the other.
+
+    :param stream: stream, as returned by "read_output"
+    :type stream: any
+    :param context: run context
+    :type context: RunContext
+    :return: decoder
+    :rtype: StreamDecoder
+    """
+    decoder = context.decoders.get(stream)
+    if decoder is None:
+        decoder = context.decoders[stream] = StreamDecoder(context.console_encoding)
+    return decoder
+
+
 def capture_output_from_running_process(context: RunContext) -> None:
     """
     Parses output from a running sub-process
 
-    Decodes and filters the process output line by line, buffering it
+    Decodes (see StreamDecoder) and filters the process output line by line, buffering it
 
-    If "mute" is False, sends the output back in real time
+    If "mute" is False, sends the output back in real time, in batches (see ProcessLogger)
 
     :param context: run context
     :type context: _RunContext
     """
-    # Get the raw output one line at a time
-    _output = context.capture.readline(block=False)
-
+    # Get the raw output one chunk at a time
+    stream, _output = read_output(context)
     if _output:
+        context.last_output_time = time.monotonic()
 
-        line = decode_and_filter(_output, context)
-
-        if line:
-            if not context.mute:
+    while _output:
 
-                # Print in real time
-                _LOGGER_PROCESS.debug(line)
+        stop = False
+        for line_str in get_decoder(stream, context).feed(_output):
+            stop = process_line(line_str, context) or stop
 
-            # Buffer the line
-            context.process_output_chunks.append(line)
+        if stop:
+            break
 
         # Get additional output if any
-        return capture_output_from_running_process(context)
+        stream, _output = read_output(context)
 
-    return None
+    if not context.mute:
+        context.process_logger.flush_if_due()
+
+
+def flush_captured_output(context: RunContext) -> None:
+    """
+    Processes the last, unterminated line of output of every stream once the process is done
+
+    :param context: run context
+    :type context: _RunContext
+    """
+    for decoder in list(context.decoders.values()):
+        for line_str in decoder.flush():
+            process_line(line_str, context)
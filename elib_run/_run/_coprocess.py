@@ -0,0 +1,436 @@
+# coding=utf-8
+"""
+Pool of long-lived sub-processes answering requests over stdin/stdout, for tools with a batch or server mode
+"""
+import logging
+import struct
+import subprocess
+import threading
+import time
+import typing
+
+from elib_run._exc import ELIBRunError
+from elib_run._run._run import CommandType, _parse_cmd
+
+_LOGGER = logging.getLogger('elib_run')
+_LOGGER_PROCESS = logging.getLogger('elib_run.process')
+
+Payload = typing.Union[bytes, str]
+
+
+class CoprocessError(ELIBRunError):
+    """Raised when a coprocess dies or does not answer a request"""
+
+
+class CoprocessTimeoutError(CoprocessError):
+    """Raised when a coprocess does not answer a request in time (the coprocess is killed)"""
+
+
+class Framing:
+    """
+    Base class for the framing of requests and responses exchanged with a coprocess
+    """
+
+    def encode(self, request: bytes) -> bytes:
+        """
+        :param request: request payload
+        :type request: bytes
+        :return: bytes to write to the standard input of the coprocess
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def read(self, stream: typing.BinaryIO) -> bytes:
+        """
+        Reads a response
+
+        :param stream: standard output of the coprocess
+        :type stream: binary file
+        :return: response payload
+        :rtype: bytes
+        :raises EOFError: if the stream ended before the response was complete
+        """
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}()'
+
+
+class LineFraming(Framing):
+    """
+    One line per request, one line per response
+    """
+
+    def encode(self, request: bytes) -> bytes:
+        return request if request.endswith(b'\n') else request + b'\n'
+
+    def read(self, stream: typing.BinaryIO) -> bytes:
+        line = stream.readline()
+        if not line.endswith(b'\n'):
+            raise EOFError
+        return line.rstrip(b'\r\n')
+
+
+class LengthPrefixedFraming(Framing):
+    """
+    Requests and responses prefixed with their length, as a 4 bytes big-endian unsigned integer
+    """
+    _HEADER = struct.Struct('>I')
+
+    def encode(self, request: bytes) -> bytes:
+        return self._HEADER.pack(len(request)) + request
+
+    def read(self, stream: typing.BinaryIO) -> bytes:
+        header = stream.read(self._HEADER.size)
+        if len(header) < self._HEADER.size:
+            raise EOFError
+        size, = self._HEADER.unpack(header)
+        payload = stream.read(size)
+        if len(payload) < size:
+            raise EOFError
+        return payload
+
+
+class SentinelFraming(Framing):
+    """
+    One line per request; responses span several lines, and end with a sentinel line (not included)
+    """
+
+    def __init__(self, sentinel: Payload) -> None:
+        if isinstance(sentinel, str):
+            sentinel = sentinel.encode('utf8')
+        if not isinstance(sentinel, bytes):
+            raise TypeError(f'expected bytes or a string, got "{type(sentinel)}"')
+        self.sentinel = sentinel.rstrip(b'\r\n')
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.sentinel!r})'
+
+    def encode(self, request: bytes) -> bytes:
+        return request if request.endswith(b'\n') else request + b'\n'
+
+    def read(self, stream: typing.BinaryIO) -> bytes:
+        lines = []
+        while True:
+            line = stream.readline()
+            if not line.endswith(b'\n'):
+                raise EOFError
+            if line.rstrip(b'\r\n') == self.sentinel:
+                return b''.join(lines)
+            lines.append(line)
+
+
+class Coprocess:
+    """
+    Long-lived sub-process answering requests over stdin/stdout
+
+    Its standard error is logged (at DEBUG level) by a background thread.
+    """
+
+    def __init__(self, argv: typing.List[str], framing: Framing, cwd: str = '.') -> None:
+        self.argv = argv
+        self.framing = framing
+        self.cwd = cwd
+        self.process: typing.Optional[subprocess.Popen] = None
+        self.last_used = time.monotonic()
+        self.requests = 0
+
+    def __repr__(self) -> str:
+        pid = self.process.pid if self.process is not None else None
+        return f'{self.__class__.__name__}({self.argv[0]!r}, pid={pid}, requests={self.requests})'
+
+    @property
+    def name(self) -> str:
+        """
+        :return: executable name
+        :rtype: str
+        """
+        return self.argv[0]
+
+    @property
+    def alive(self) -> bool:
+        """
+        :return: True if the process is running
+        :rtype: bool
+        """
+        return self.process is not None and self.process.poll() is None
+
+    def _log_stderr(self, stream: typing.BinaryIO):
+        with stream:
+            for line in stream:
+                _LOGGER_PROCESS.debug('%s: %s', self.name, line.decode('utf8', errors='replace').rstrip())
+
+    def start(self):
+        """
+        Starts the process
+        """
+        try:
+            self.process = subprocess.Popen(
+                self.argv, cwd=self.cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+        except OSError as error:
+            raise CoprocessError(f'{self.name}: failed to start: {error}')
+        threading.Thread(target=self._log_stderr, args=(self.process.stderr,), daemon=True).start()
+        self.last_used = time.monotonic()
+        self.requests = 0
+        _LOGGER.debug('%s: coprocess started (pid %s)', self.name, self.process.pid)
+
+    def close(self, timeout: float = 5.0):
+        """
+        Closes the standard input of the process, waits for it to exit, and kills it if it does not
+
+        :param timeout: time to wait for the process to exit, in seconds
+        :type timeout: float
+        """
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()  # type: ignore
+        except OSError:
+            pass
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        process.stdout.close()  # type: ignore
+        _LOGGER.debug('%s: coprocess stopped (pid %s)', self.name, process.pid)
+
+    def restart(self):
+        """
+        Stops the process if it is running, and starts a new one
+        """
+        self.close(timeout=0)
+        self.start()
+
+    def request(self, payload: bytes, timeout: typing.Optional[float] = None) -> bytes:
+        """
+        Sends a request, and reads the response
+
+        The process is killed if it does not answer within "timeout".
+
+        :param payload: request
+        :type payload: bytes
+        :param timeout: maximum time to wait for the response, in seconds
+        :type timeout: optional float
+        :return: response
+        :rtype: bytes
+        """
+        if not self.alive:
+            raise CoprocessError(f'{self.name}: process is not running')
+        process = self.process
+        timed_out = threading.Event()
+
+        def _kill():
+            timed_out.set()
+            process.kill()  # type: ignore
+
+        timer = threading.Timer(timeout, _kill) if timeout is not None else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        try:
+            process.stdin.write(self.framing.encode(payload))  # type: ignore
+            process.stdin.flush()  # type: ignore
+            response = self.framing.read(process.stdout)  # type: ignore
+        except (OSError, EOFError):
+            if timed_out.is_set():
+                raise CoprocessTimeoutError(f'{self.name}: no response after {timeout} seconds')
+            raise CoprocessError(f'{self.name}: process died (return code: {process.wait()})')  # type: ignore
+        finally:
+            if timer is not None:
+                timer.cancel()
+        self.last_used = time.monotonic()
+        self.requests += 1
+        return response
+
+
+class CoprocessPool:  # pylint: disable=too-many-instance-attributes
+    """
+    Pool of long-lived instances of an executable answering requests, to pay its startup cost once per worker
+
+    - workers are started on demand, up to "size"
+    - a worker that died is restarted, and the request is sent again once
+    - a worker idle for longer than "health_interval" is checked with "health_check" (if given) before being
+      used, and restarted if the check fails
+    - workers idle for longer than "idle_timeout" are stopped, by a background thread running while some are idle
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 cmd: CommandType,
+                 *paths: str,
+                 size: int = 2,
+                 framing: typing.Optional[Framing] = None,
+                 cwd: str = '.',
+                 request_timeout: typing.Optional[float] = 60.0,
+                 health_check: typing.Optional[typing.Callable[[Coprocess], bool]] = None,
+                 health_interval: float = 30.0,
+                 idle_timeout: typing.Optional[float] = 300.0,
+                 encoding: str = 'utf8',
+                 ) -> None:
+        if not isinstance(size, int) or size < 1:
+            raise ValueError(f'expected a positive size, got {size!r}')
+        exe_path, args_list = _parse_cmd(cmd, *paths)
+        self.argv = [str(exe_path.absolute())] + args_list
+        self.size = size
+        self.framing = framing if framing is not None else LineFraming()
+        if not isinstance(self.framing, Framing):
+            raise TypeError(f'expected a Framing, got "{type(self.framing)}"')
+        self.cwd = cwd
+        self.request_timeout = request_timeout
+        self.health_check = health_check
+        self.health_interval = health_interval
+        self.idle_timeout = idle_timeout
+        self.encoding = encoding
+        self.restarts = 0
+        self._idle: typing.List[Coprocess] = []
+        self._busy = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._reaper: typing.Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.argv[0]!r}, size={self.size}, workers={self.workers})'
+
+    def __enter__(self) -> 'CoprocessPool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def workers(self) -> int:
+        """
+        :return: number of running workers
+        :rtype: int
+        """
+        with self._condition:
+            return len(self._idle) + self._busy
+
+    def _acquire(self) -> Coprocess:
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise CoprocessError('pool is closed')
+                if self._idle:
+                    worker = self._idle.pop()
+                    break
+                if self._busy < self.size:
+                    worker = Coprocess(self.argv, self.framing, self.cwd)
+                    break
+                self._condition.wait()
+            self._busy += 1
+        try:
+            if worker.process is None:
+                worker.start()
+            elif not worker.alive or not self._healthy(worker):
+                self._restart(worker)
+        except BaseException:
+            self._release(worker, keep=False)
+            raise
+        return worker
+
+    def _healthy(self, worker: Coprocess) -> bool:
+        if self.health_check is None or time.monotonic() - worker.last_used < self.health_interval:
+            return True
+        try:
+            return bool(self.health_check(worker))
+        except ELIBRunError:
+            return False
+
+    def _restart(self, worker: Coprocess):
+        _LOGGER.warning('%s: restarting coprocess', worker.name)
+        with self._condition:
+            self.restarts += 1
+        worker.restart()
+
+    def _release(self, worker: Coprocess, keep: bool = True):
+        with self._condition:
+            self._busy -= 1
+            keep = keep and not self._closed
+            if keep:
+                self._idle.append(worker)
+                if self.idle_timeout is not None and self._reaper is None:
+                    self._reaper = threading.Thread(target=self._reap, name='elib_run coprocess reaper', daemon=True)
+                    self._reaper.start()
+            self._condition.notify()
+        if not keep:
+            # killing and reaping the process can take a while: not while holding the lock
+            worker.close(timeout=0)
+        self.evict_idle()
+
+    def _reap(self):
+        while True:
+            with self._condition:
+                if self._closed or not self._idle:
+                    self._reaper = None
+                    return
+                oldest = min(worker.last_used for worker in self._idle)
+            delay = oldest + self.idle_timeout - time.monotonic()  # type: ignore
+            if delay > 0:
+                self._stopped.wait(delay)
+            else:
+                self.evict_idle()
+
+    def evict_idle(self):
+        """
+        Stops the workers that have been idle for longer than "idle_timeout"
+        """
+        if self.idle_timeout is None:
+            return
+        now = time.monotonic()
+        with self._condition:
+            evicted = [worker for worker in self._idle if now - worker.last_used > self.idle_timeout]
+            self._idle = [worker for worker in self._idle if worker not in evicted]
+        for worker in evicted:
+            _LOGGER.debug('%s: evicting idle coprocess', worker.name)
+            worker.close()
+
+    def request(self, payload: Payload, timeout: typing.Optional[float] = None) -> Payload:
+        """
+        Sends a request to an idle worker (waiting for one if necessary), and returns its response
+
+        If the worker died, it is restarted and the request sent once more; if it timed out, it is stopped and
+        CoprocessTimeoutError is raised.
+
+        :param payload: request; if a string, it is encoded, and the response decoded, with "encoding"
+        :type payload: bytes or str
+        :param timeout: maximum time to wait for the response (defaults to "request_timeout")
+        :type timeout: optional float
+        :return: response
+        :rtype: bytes or str
+        """
+        raw_payload = payload.encode(self.encoding) if isinstance(payload, str) else payload
+        if not isinstance(raw_payload, bytes):
+            raise TypeError(f'expected bytes or a string, got "{type(payload)}"')
+        timeout = self.request_timeout if timeout is None else timeout
+        worker = self._acquire()
+        keep = False
+        try:
+            try:
+                response = worker.request(raw_payload, timeout)
+            except CoprocessTimeoutError:
+                raise
+            except CoprocessError as error:
+                _LOGGER.warning('%s', error)
+                self._restart(worker)
+                response = worker.request(raw_payload, timeout)
+            keep = True
+        finally:
+            self._release(worker, keep)
+        return response.decode(self.encoding) if isinstance(payload, str) else response
+
+    def close(self):
+        """
+        Stops all workers; requests in progress complete, and their worker is stopped afterwards
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        self._stopped.set()
+        for worker in idle:
+            worker.close()
@@ -0,0 +1,111 @@
+# coding=utf-8
+"""
+Decodes the output of a sub-process into lines, across read boundaries
+"""
+import codecs
+import locale
+import typing
+
+AUTO_ENCODING = 'auto'
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+_DETECTION_SIZE = 4
+
+
+def detect_encoding(head: bytes) -> str:
+    """
+    Guesses the encoding of a byte stream from its first bytes
+
+    Looks for a BOM first, then for the NUL bytes of BOM-less UTF-16, and falls back to the locale encoding.
+
+    :param head: first bytes of the stream
+    :type head: bytes
+    :return: encoding name
+    :rtype: str
+    """
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    if len(head) >= 2:
+        if head[0] and not head[1]:
+            return 'utf-16-le'
+        if not head[0] and head[1]:
+            return 'utf-16-be'
+    return locale.getpreferredencoding(False)
+
+
+def check_encoding(encoding: str):
+    """
+    Raises ValueError for unknown encodings
+
+    :param encoding: encoding name, or "auto"
+    :type encoding: str
+    """
+    if not isinstance(encoding, str):
+        raise TypeError(f'expected a string, got "{type(encoding)}"')
+    if encoding != AUTO_ENCODING:
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            raise ValueError(f'unknown encoding: {encoding}')
+
+
+class StreamDecoder:
+    """
+    Decodes the output of a sub-process into lines, across read boundaries
+
+    Uses an incremental decoder, so that multibyte sequences (and UTF-16 line feeds) split between two reads are
+    decoded correctly; partial lines are held until their line feed arrives, or until the stream ends.
+
+    With the "auto" encoding, the encoding is detected from the first bytes of the stream (see "detect_encoding").
+    """
+
+    def __init__(self, encoding: str = 'utf8') -> None:
+        check_encoding(encoding)
+        self.encoding: typing.Optional[str] = None if encoding == AUTO_ENCODING else encoding
+        self._decoder: typing.Optional[codecs.IncrementalDecoder] = None
+        self._head = b''
+        self._pending = ''
+
+    def _decode(self, data: bytes, final: bool) -> str:
+        if self._decoder is None:
+            if self.encoding is None:
+                self._head += data
+                if len(self._head) < _DETECTION_SIZE and not final:
+                    return ''
+                data, self._head = self._head, b''
+                self.encoding = detect_encoding(data)
+            self._decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        return self._decoder.decode(data, final)
+
+    def feed(self, data: bytes) -> typing.List[str]:
+        """
+        Decodes a chunk of output
+
+        :param data: raw output
+        :type data: bytes
+        :return: lines completed by this chunk, without their line feed
+        :rtype: list of str
+        """
+        text = self._pending + self._decode(data, final=False)
+        *lines, self._pending = text.split('\n')
+        return lines
+
+    def flush(self) -> typing.List[str]:
+        """
+        Decodes whatever is left once the stream has ended
+
+        :return: remaining lines
+        :rtype: list of str
+        """
+        text = self._pending + self._decode(b'', final=True)
+        self._pending = ''
+        if not text:
+            return []
+        return text.split('\n')
@@ -0,0 +1,307 @@
+# coding=utf-8
+"""
+Executors: how the process of a run context is spawned, streamed, waited for and killed
+"""
+import json
+import queue
+import socket
+import struct
+import threading
+import typing
+
+import sarge
+
+from elib_run._exc import ELIBRunError
+
+# Frames exchanged with an agent: 1 byte of type, 4 bytes of big-endian payload length, payload
+FRAME_HEADER = struct.Struct('>cI')
+FRAME_SPAWN = b'S'  # client -> agent, JSON: {"argv": [...], "cwd": "..."}
+FRAME_KILL = b'K'  # client -> agent, empty
+FRAME_STARTED = b'P'  # agent -> client, JSON: {"pid": ...}
+FRAME_ERROR = b'E'  # agent -> client, utf8 error message
+FRAME_OUTPUT = b'O'  # agent -> client, raw output
+FRAME_EXIT = b'X'  # agent -> client, JSON: {"return_code": ...}
+
+
+def send_frame(sock: socket.socket, kind: bytes, payload: bytes = b''):
+    """
+    Sends a frame
+
+    :param sock: connected socket
+    :type sock: socket.socket
+    :param kind: frame type (one byte)
+    :type kind: bytes
+    :param payload: frame payload
+    :type payload: bytes
+    """
+    sock.sendall(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        data += chunk
+    return data
+
+
+def recv_frame(sock: socket.socket) -> typing.Tuple[bytes, bytes]:
+    """
+    Receives a frame
+
+    :param sock: connected socket
+    :type sock: socket.socket
+    :return: frame type and payload
+    :rtype: tuple of bytes, bytes
+    """
+    kind, size = FRAME_HEADER.unpack(_recv_exactly(sock, FRAME_HEADER.size))
+    return kind, _recv_exactly(sock, size)
+
+
+class Executor:
+    """
+    Base class for executors
+
+    An executor creates the process of a run context, as a pair of objects:
+
+        - a command, which spawns the process ("run(async_=True)"), waits for it ("poll()", "wait()",
+          "returncode") and kills it ("terminate()")
+        - a capture, which streams its output ("readline(block=False)" returning bytes, and "threads", the threads
+          to join to drain it)
+
+    sarge.Command and sarge.Capture are the reference implementation (see LocalExecutor).
+    """
+
+    def create_process(self, context) -> typing.Tuple[typing.Any, typing.Any]:
+        """
+        Creates (without starting it) the process of a run context
+
+        :param context: run context
+        :type context: RunContext
+        :return: command and capture
+        :rtype: tuple
+        """
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}()'
+
+
+class StreamCapture(sarge.Capture):
+    """
+    sarge.Capture that keeps track of the stream (stdout or stderr) every chunk of output comes from
+
+    sarge.Capture queues the output of both streams together, and "readline" joins the chunks of one stream with
+    the chunks of the other until it finds a line feed. "read_chunk" returns every chunk as it was read, along with
+    the index of its stream, so that each stream can be decoded on its own; "readline" returns the next chunk, of
+    either stream.
+    """
+
+    def reader(self, stream, ready):
+        """
+        Reads a stream of the process into the queue, one line at a time, until it ends
+
+        :param stream: output stream of the process
+        :type stream: file
+        :param ready: set once the thread runs
+        :type ready: threading.Event
+        """
+        index = self.streams.index(stream)
+        ready.set()
+        with stream:
+            for chunk in iter(stream.readline, b''):
+                self.buffer.put_nowait((index, chunk))
+
+    def read_chunk(self, block: bool = True,
+                   timeout: typing.Optional[float] = None) -> typing.Optional[typing.Tuple[int, bytes]]:
+        """
+        Reads the next chunk of output
+
+        :param block: wait for output if there is none yet (and the streams are still open)
+        :type block: bool
+        :param timeout: maximum time to wait, in seconds (defaults to the capture timeout)
+        :type timeout: optional float
+        :return: index of the stream and raw output, or None if there is none
+        :rtype: optional tuple of int, bytes
+        """
+        if not self.streams_open():
+            block = False
+        try:
+            return self.buffer.get(block, (timeout or self.timeout) if block else None)
+        except queue.Empty:
+            return None
+
+    def readline(self, size: int = -1, block: bool = True,  # pylint: disable=unused-argument
+                 timeout: typing.Optional[float] = None) -> bytes:
+        """
+        Reads the next chunk of output, of either stream
+
+        :param size: ignored, chunks are read whole
+        :type size: int
+        :param block: wait for output if there is none yet (and the streams are still open)
+        :type block: bool
+        :param timeout: maximum time to wait, in seconds (defaults to the capture timeout)
+        :type timeout: optional float
+        :return: raw output, empty if there is none
+        :rtype: bytes
+        """
+        chunk = self.read_chunk(block, timeout)
+        return b'' if chunk is None else chunk[1]
+
+
+class LocalExecutor(Executor):
+    """
+    Runs processes on this machine, through sarge (default)
+
+    Stdout and stderr are decoded separately if the capture of the context is a StreamCapture, as it is for "run"
+    and "start".
+    """
+
+    def create_process(self, context) -> typing.Tuple[sarge.Command, sarge.Capture]:
+        kwargs = {}
+        if context.limits is not None:
+            kwargs['preexec_fn'] = context.limits.apply
+        command = sarge.Command(
+            [context.exe_path_as_str] + context.args_list,
+            stdout=context.capture,
+            stderr=context.capture,
+            shell=False,
+            cwd=context.cwd,
+            **kwargs,
+        )
+        return command, context.capture
+
+
+LOCAL_EXECUTOR = LocalExecutor()
+
+
+class _RemoteProcess:  # pylint: disable=too-many-instance-attributes
+    """
+    Process running behind an agent; acts as both the command and the capture of a run context
+    """
+
+    def __init__(self, address: typing.Tuple[str, int], argv: typing.List[str], cwd: str,
+                 connect_timeout: float) -> None:
+        self._address = address
+        self._argv = argv
+        self._cwd = cwd
+        self._connect_timeout = connect_timeout
+        self._socket: typing.Optional[socket.socket] = None
+        self._output: 'queue.Queue[bytes]' = queue.Queue()
+        self._done = threading.Event()
+        self.pid: typing.Optional[int] = None
+        self.returncode: typing.Optional[int] = None
+        self.threads: typing.List[threading.Thread] = []
+
+    def run(self, async_: bool = False):  # pylint: disable=unused-argument
+        """
+        Asks the agent to spawn the process
+        """
+        try:
+            self._socket = socket.create_connection(self._address, timeout=self._connect_timeout)
+            self._socket.settimeout(None)
+            send_frame(self._socket, FRAME_SPAWN, json.dumps({'argv': self._argv, 'cwd': self._cwd}).encode('utf8'))
+            kind, payload = recv_frame(self._socket)
+        except OSError as error:
+            raise ELIBRunError(f'agent at {self._address}: {error}')
+        if kind == FRAME_ERROR:
+            self._socket.close()
+            raise ELIBRunError(f'agent at {self._address}: {payload.decode("utf8")}')
+        self.pid = json.loads(payload.decode('utf8'))['pid']
+        thread = threading.Thread(target=self._receive, daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def _receive(self):
+        return_code = -1
+        try:
+            while True:
+                kind, payload = recv_frame(self._socket)  # type: ignore
+                if kind == FRAME_OUTPUT:
+                    self._output.put(payload)
+                elif kind == FRAME_EXIT:
+                    return_code = json.loads(payload.decode('utf8'))['return_code']
+                    break
+        except OSError:
+            pass
+        finally:
+            self._socket.close()  # type: ignore
+            self.returncode = return_code
+            self._done.set()
+
+    def readline(self, block: bool = False) -> bytes:
+        """
+        :return: next chunk of output received from the agent, or b'' if none is available
+        :rtype: bytes
+        """
+        try:
+            return self._output.get(block=block)
+        except queue.Empty:
+            return b''
+
+    def poll(self) -> typing.Optional[int]:
+        """
+        :return: return code, or None if the process is still running
+        :rtype: optional int
+        """
+        return self.returncode
+
+    def wait(self, timeout: typing.Optional[float] = None):
+        """
+        Waits for the process to exit
+        """
+        self._done.wait(timeout)
+
+    def terminate(self):
+        """
+        Asks the agent to kill the process
+        """
+        if self._socket is not None and not self._done.is_set():
+            try:
+                send_frame(self._socket, FRAME_KILL)
+            except OSError:
+                pass
+
+    kill = terminate
+
+    def close(self):
+        """
+        Nothing to close; the connection is closed when the process exits
+        """
+
+
+class SocketExecutor(Executor):
+    """
+    Runs processes through an agent listening on a TCP socket
+
+    Each process gets its own connection: the executor sends the command line and working directory, and the agent
+    streams back the output and the return code (see "elib_run._run._agent" for the stand-in agent, and the frame
+    definitions above for the protocol).
+
+    The executable is still resolved on this machine; resource limits are not supported.
+    """
+
+    def __init__(self, address: typing.Tuple[str, int], connect_timeout: float = 10.0) -> None:
+        host, port = address
+        if not isinstance(host, str):
+            raise TypeError(f'expected a string, got "{type(host)}"')
+        if not isinstance(port, int):
+            raise TypeError(f'expected an int, got "{type(port)}"')
+        self.address = (host, port)
+        self.connect_timeout = connect_timeout
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.address!r})'
+
+    def create_process(self, context) -> typing.Tuple[_RemoteProcess, _RemoteProcess]:
+        if context.limits is not None:
+            raise ELIBRunError('resource limits are not supported by SocketExecutor')
+        process = _RemoteProcess(
+            self.address,
+            [context.exe_path_as_str] + context.args_list,
+            context.cwd,
+            self.connect_timeout,
+        )
+        return process, process
@@ -0,0 +1,245 @@
+# coding=utf-8
+"""
+Process-wide admission control for sub-processes
+"""
+import itertools
+import logging
+import threading
+import time
+import typing
+from collections import defaultdict, deque
+
+# noinspection PyCompatibility
+import dataclasses
+
+_LOGGER = logging.getLogger('elib_run')
+
+DEFAULT_GROUP = 'default'
+
+# default of "configure": leaves the current limit as it is (None means unlimited)
+_UNCHANGED: typing.Any = object()
+
+
+@dataclasses.dataclass
+class GovernorMetrics:
+    """
+    Snapshot of the governor activity
+    """
+    admitted: int = 0
+    waiting: int = 0
+    in_flight: float = 0
+    total_wait: float = 0
+    max_wait: float = 0
+
+    @property
+    def mean_wait(self) -> float:
+        """
+        :return: mean time spent waiting for admission, in seconds
+        :rtype: float
+        """
+        return self.total_wait / self.admitted if self.admitted else 0.0
+
+
+@dataclasses.dataclass
+class Ticket:
+    """
+    Admission ticket for a single sub-process
+    """
+    weight: float
+    priority: int
+    group: str
+    sequence: int
+    enqueued_at: float
+    admitted_at: float = 0
+
+
+class Governor:
+    """
+    Process-wide admission control for sub-processes
+
+    Limits the total weight of the sub-processes in flight to "max_in_flight" (unlimited if None).
+
+    Waiting sub-processes are admitted by priority (lowest value first); among equal priorities, the group with the
+    least weight in flight goes first, so that a burst from one group of callers does not starve the others.
+    Ties are admitted in arrival order.
+
+    Waiting tickets are queued by priority and group, and each waits on its own condition: only the ticket next in
+    line is woken up, so that admitting one among many waiters costs no more than the number of groups.
+    """
+
+    def __init__(self, max_in_flight: typing.Optional[float] = None) -> None:
+        self._lock = threading.Lock()
+        self._max_in_flight = max_in_flight
+        self._in_flight: float = 0
+        self._group_usage: typing.Dict[str, float] = defaultdict(float)
+        # priority -> group -> tickets, in arrival order
+        self._queues: typing.Dict[int, typing.Dict[str, typing.Deque[Ticket]]] = {}
+        self._wakeups: typing.Dict[int, threading.Condition] = {}
+        self._sequence = itertools.count()
+        self._metrics = GovernorMetrics()
+        self.weights: typing.Dict[str, float] = {}
+
+    def configure(self,
+                  max_in_flight: typing.Optional[float] = _UNCHANGED,
+                  weights: typing.Optional[typing.Dict[str, float]] = None,
+                  ):
+        """
+        Changes the governor settings; the ones not given are left as they are
+
+        :param max_in_flight: maximum total weight of sub-processes in flight (unlimited if None)
+        :type max_in_flight: optional float
+        :param weights: weight per executable name (e.g. {"cl.exe": 4}), defaults to 1
+        :type weights: optional dict
+        """
+        if max_in_flight is not _UNCHANGED and max_in_flight is not None and max_in_flight <= 0:
+            raise ValueError(f'expected a positive value, got {max_in_flight}')
+        with self._lock:
+            if max_in_flight is not _UNCHANGED:
+                self._max_in_flight = max_in_flight
+            if weights is not None:
+                self.weights = dict(weights)
+            self._wake_next()
+
+    @property
+    def max_in_flight(self) -> typing.Optional[float]:
+        """
+        :return: maximum total weight of sub-processes in flight
+        :rtype: optional float
+        """
+        return self._max_in_flight
+
+    @property
+    def metrics(self) -> GovernorMetrics:
+        """
+        :return: snapshot of the governor activity
+        :rtype: GovernorMetrics
+        """
+        with self._lock:
+            return dataclasses.replace(self._metrics, waiting=len(self._wakeups), in_flight=self._in_flight)
+
+    def weight_for(self, exe_name: str) -> float:
+        """
+        :param exe_name: executable name
+        :type exe_name: str
+        :return: configured weight for this executable (defaults to 1)
+        :rtype: float
+        """
+        return self.weights.get(exe_name, 1)
+
+    def _next_ticket(self) -> typing.Optional[Ticket]:
+        if not self._queues:
+            return None
+        groups = self._queues[min(self._queues)]
+        queue = min(
+            groups.values(),
+            key=lambda tickets: (self._group_usage.get(tickets[0].group, 0), tickets[0].sequence)
+        )
+        return queue[0]
+
+    def _enqueue(self, ticket: Ticket) -> threading.Condition:
+        self._queues.setdefault(ticket.priority, {}).setdefault(ticket.group, deque()).append(ticket)
+        wakeup = threading.Condition(self._lock)
+        self._wakeups[ticket.sequence] = wakeup
+        return wakeup
+
+    def _dequeue(self, ticket: Ticket):
+        del self._wakeups[ticket.sequence]
+        groups = self._queues[ticket.priority]
+        queue = groups[ticket.group]
+        if queue[0] is ticket:
+            queue.popleft()
+        else:
+            queue.remove(ticket)
+        if not queue:
+            del groups[ticket.group]
+            if not groups:
+                del self._queues[ticket.priority]
+
+    def _wake_next(self):
+        ticket = self._next_ticket()
+        if ticket is not None and self._fits(ticket):
+            self._wakeups[ticket.sequence].notify()
+
+    def _fits(self, ticket: Ticket) -> bool:
+        if self._max_in_flight is None or not self._in_flight:
+            # a ticket heavier than the limit may still run alone
+            return True
+        return self._in_flight + ticket.weight <= self._max_in_flight
+
+    def acquire(self, weight: float = 1, priority: int = 0, group: str = DEFAULT_GROUP) -> Ticket:
+        """
+        Waits until a sub-process may be started
+
+        :param weight: weight of the sub-process
+        :type weight: float
+        :param priority: priority of the sub-process (lowest value first)
+        :type priority: int
+        :param group: group of callers the sub-process belongs to
+        :type group: str
+        :return: admission ticket, to be released once the sub-process is done
+        :rtype: Ticket
+        """
+        if not isinstance(weight, (int, float)):
+            raise TypeError(f'expected a number, got "{type(weight)}"')
+        if weight <= 0:
+            raise ValueError(f'expected a positive weight, got {weight}')
+        with self._lock:
+            ticket = Ticket(weight, priority, group, next(self._sequence), time.monotonic())
+            wakeup = self._enqueue(ticket)
+            try:
+                while not (self._next_ticket() is ticket and self._fits(ticket)):
+                    wakeup.wait()
+                self._in_flight += ticket.weight
+                self._group_usage[ticket.group] += ticket.weight
+                ticket.admitted_at = time.monotonic()
+                wait = ticket.admitted_at - ticket.enqueued_at
+                self._metrics.admitted += 1
+                self._metrics.total_wait += wait
+                self._metrics.max_wait = max(self._metrics.max_wait, wait)
+            finally:
+                # admitted, or interrupted while waiting: either way the next ticket in line may fit now
+                self._dequeue(ticket)
+                self._wake_next()
+        if wait > 1:
+            _LOGGER.debug('admitted after waiting %.2f seconds (group: %s, priority: %s)', wait, group, priority)
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """
+        Releases the capacity held by a ticket
+
+        :param ticket: ticket returned by "acquire"
+        :type ticket: Ticket
+        """
+        with self._lock:
+            self._in_flight -= ticket.weight
+            self._group_usage[ticket.group] -= ticket.weight
+            if not self._group_usage[ticket.group]:
+                del self._group_usage[ticket.group]
+            self._wake_next()
+
+
+GOVERNOR = Governor()
+
+
+def configure_governor(max_in_flight: typing.Optional[float] = _UNCHANGED,
+                       weights: typing.Optional[typing.Dict[str, float]] = None,
+                       ):
+    """
+    Configures the process-wide governor all "run" and "start" calls go through; the settings not given are left
+    as they are
+
+    :param max_in_flight: maximum total weight of sub-processes in flight (unlimited if None)
+    :type max_in_flight: optional float
+    :param weights: weight per executable name (e.g. {"cl.exe": 4}), defaults to 1
+    :type weights: optional dict
+    """
+    GOVERNOR.configure(max_in_flight, weights)
+
+
+def governor_metrics() -> GovernorMetrics:
+    """
+    :return: snapshot of the process-wide governor activity
+    :rtype: GovernorMetrics
+    """
+    return GOVERNOR.metrics
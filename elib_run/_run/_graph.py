@@ -0,0 +1,275 @@
+# coding=utf-8
+"""
+Runs a graph of commands in dependency order, in parallel, skipping the ones whose inputs did not change
+"""
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import typing
+
+# noinspection PyCompatibility
+import dataclasses
+
+from elib_run._exc import ELIBRunError
+from elib_run._run._result import RunResult
+from elib_run._run._run import CommandType, run
+
+_LOGGER = logging.getLogger('elib_run')
+
+_READ_SIZE = 1024 * 1024
+
+PathType = typing.Union[str, pathlib.Path]
+
+
+@dataclasses.dataclass
+class Node:
+    """
+    Command in a graph
+
+    Attributes:
+        name: unique name of the node
+        cmd: command, as given to "run"
+        deps: names of the nodes that must succeed before this one runs
+        inputs: files read by the command; if given, the node is skipped when they (and the command) did not
+            change since its last successful run
+        outputs: files written by the command; the node is not skipped if any of them is missing
+        options: keyword arguments for "run"
+    """
+    name: str
+    cmd: CommandType
+    deps: typing.Tuple[str, ...] = ()
+    inputs: typing.Tuple[PathType, ...] = ()
+    outputs: typing.Tuple[PathType, ...] = ()
+    options: typing.Dict[str, typing.Any] = dataclasses.field(default_factory=dict)
+
+    def fingerprint(self) -> typing.Optional[str]:
+        """
+        :return: hash of the command and of the content of the inputs, or None if the node has no inputs
+        :rtype: optional str
+        """
+        if not self.inputs:
+            return None
+        digest = hashlib.sha256(repr(self.cmd).encode('utf8'))
+        for path in sorted(str(path) for path in self.inputs):
+            digest.update(path.encode('utf8'))
+            try:
+                with open(path, 'rb') as input_file:
+                    chunk = input_file.read(_READ_SIZE)
+                    while chunk:
+                        digest.update(chunk)
+                        chunk = input_file.read(_READ_SIZE)
+            except OSError:
+                # missing inputs never match a previous run
+                return None
+        return digest.hexdigest()
+
+
+@dataclasses.dataclass
+class NodeResult:
+    """
+    Outcome of a node
+
+    Attributes:
+        name: name of the node
+        status: "success", "failed", "skipped" (up to date) or "cancelled" (a dependency failed)
+        result: result of the run, if the command ran
+        error: exception raised by the run, if any
+        duration: time spent running the command, in seconds
+    """
+    name: str
+    status: str
+    result: typing.Optional[RunResult] = None
+    error: typing.Optional[Exception] = None
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:  # pylint: disable=invalid-name
+        """
+        :return: True if the node succeeded or was up to date
+        :rtype: bool
+        """
+        return self.status in ('success', 'skipped')
+
+
+class CommandGraph:
+    """
+    Graph of commands run in dependency order
+
+    - nodes whose dependencies are done run in parallel, up to "workers" at a time
+    - a node with inputs is skipped when its command and the content of its inputs match its last successful run,
+      and its outputs exist; fingerprints are kept in "state_file" (a JSON file) between runs
+    - when a node fails, only the nodes depending on it (directly or not) are cancelled; the others keep running
+
+    Commands run through "run", with "failure_ok" forced to True: failures are reported in the node results.
+    """
+
+    def __init__(self, state_file: typing.Optional[PathType] = None, workers: typing.Optional[int] = None) -> None:
+        self.state_file = pathlib.Path(state_file) if state_file is not None else None
+        self.workers = workers or os.cpu_count() or 1
+        self.nodes: typing.Dict[str, Node] = {}
+        self._state: typing.Dict[str, str] = {}
+        self._state_lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({len(self.nodes)} nodes, workers={self.workers})'
+
+    # pylint: disable=too-many-arguments
+    def add(self,
+            name: str,
+            cmd: CommandType,
+            deps: typing.Iterable[str] = (),
+            inputs: typing.Iterable[PathType] = (),
+            outputs: typing.Iterable[PathType] = (),
+            **options: typing.Any,
+            ) -> Node:
+        """
+        Adds a command to the graph
+
+        :param name: unique name of the node
+        :type name: str
+        :param cmd: command, as given to "run"
+        :type cmd: str, pathlib.Path or list
+        :param deps: names of the nodes that must succeed before this one runs
+        :type deps: iterable of str
+        :param inputs: files read by the command
+        :type inputs: iterable of str or pathlib.Path
+        :param outputs: files written by the command
+        :type outputs: iterable of str or pathlib.Path
+        :param options: keyword arguments for "run"
+        :return: the node
+        :rtype: Node
+        """
+        if not isinstance(name, str):
+            raise TypeError(f'expected a string, got "{type(name)}"')
+        if name in self.nodes:
+            raise ValueError(f'duplicate node: {name}')
+        node = Node(name, cmd, tuple(deps), tuple(inputs), tuple(outputs), options)
+        self.nodes[name] = node
+        return node
+
+    def _check(self):
+        for node in self.nodes.values():
+            for dep in node.deps:
+                if dep not in self.nodes:
+                    raise ValueError(f'{node.name}: unknown dependency: {dep}')
+        # Kahn's algorithm: whatever cannot be ordered is part of (or depends on) a cycle
+        pending_deps = {name: len(node.deps) for name, node in self.nodes.items()}
+        dependents = self._dependents()
+        ready = [name for name, count in pending_deps.items() if not count]
+        while ready:
+            for dependent in dependents[ready.pop()]:
+                pending_deps[dependent] -= 1
+                if not pending_deps[dependent]:
+                    ready.append(dependent)
+        unordered = sorted(name for name, count in pending_deps.items() if count)
+        if unordered:
+            raise ValueError(f'dependency cycle between: {", ".join(unordered)}')
+
+    def _dependents(self) -> typing.Dict[str, typing.List[str]]:
+        dependents: typing.Dict[str, typing.List[str]] = {name: [] for name in self.nodes}
+        for node in self.nodes.values():
+            for dep in node.deps:
+                dependents[dep].append(node.name)
+        return dependents
+
+    def _load_state(self):
+        self._state = {}
+        if self.state_file is not None and self.state_file.exists():
+            try:
+                self._state = json.loads(self.state_file.read_text(encoding='utf8'))
+            except ValueError:
+                _LOGGER.warning('%s: ignoring corrupt state file', self.state_file)
+
+    def _save_state(self):
+        if self.state_file is not None:
+            with self._state_lock:
+                content = json.dumps(self._state, indent=1, sort_keys=True)
+            self.state_file.write_text(content, encoding='utf8')
+
+    def _up_to_date(self, node: Node, fingerprint: typing.Optional[str]) -> bool:
+        return (
+            fingerprint is not None
+            and self._state.get(node.name) == fingerprint
+            and all(pathlib.Path(output).exists() for output in node.outputs)
+        )
+
+    def _run_node(self, node: Node) -> NodeResult:
+        fingerprint = node.fingerprint()
+        with self._state_lock:
+            if self._up_to_date(node, fingerprint):
+                _LOGGER.info('%s: up to date', node.name)
+                return NodeResult(node.name, 'skipped')
+        start = time.monotonic()
+        options = dict(node.options, failure_ok=True)
+        try:
+            result = run(node.cmd, **options)
+        except ELIBRunError as error:
+            return NodeResult(node.name, 'failed', error=error, duration=time.monotonic() - start)
+        duration = time.monotonic() - start
+        if result.return_code != 0:
+            return NodeResult(node.name, 'failed', result=result, duration=duration)
+        with self._state_lock:
+            if fingerprint is not None:
+                self._state[node.name] = fingerprint
+            else:
+                self._state.pop(node.name, None)
+        return NodeResult(node.name, 'success', result=result, duration=duration)
+
+    def run(self) -> typing.Dict[str, NodeResult]:
+        """
+        Runs all the nodes
+
+        :return: outcome of every node, by name
+        :rtype: dict of str, NodeResult
+        """
+        self._check()
+        self._load_state()
+        dependents = self._dependents()
+        pending_deps = {name: set(node.deps) for name, node in self.nodes.items()}
+        results: typing.Dict[str, NodeResult] = {}
+
+        def _cancel(name: str):
+            for dependent in dependents[name]:
+                if dependent not in results:
+                    _LOGGER.warning('%s: cancelled, because %s failed', dependent, name)
+                    results[dependent] = NodeResult(dependent, 'cancelled')
+                    _cancel(dependent)
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+                running: typing.Dict[concurrent.futures.Future, str] = {}
+                ready = [name for name, deps in pending_deps.items() if not deps]
+                while True:
+                    for name in ready:
+                        if name not in results:
+                            running[pool.submit(self._run_node, self.nodes[name])] = name
+                    ready = []
+                    if not running:
+                        break
+                    done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        error = future.exception()
+                        if error is not None:
+                            # not a run failure: wrong options, or a bug; fails the node like one
+                            _LOGGER.error('%s: %r', name, error)
+                            node_result = NodeResult(name, 'failed', error=error)
+                        else:
+                            node_result = future.result()
+                        results[name] = node_result
+                        if node_result.ok:
+                            for dependent in dependents[name]:
+                                pending_deps[dependent].discard(name)
+                                if not pending_deps[dependent]:
+                                    ready.append(dependent)
+                        else:
+                            _cancel(name)
+        finally:
+            self._save_state()
+
+        return {name: results[name] for name in self.nodes}
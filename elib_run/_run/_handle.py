@@ -0,0 +1,289 @@
+# coding=utf-8
+"""
+Handles on sub-processes running in the background
+"""
+import logging
+import threading
+import time
+import typing
+
+from elib_run._exc import ProcessTimeoutError
+# noinspection PyProtectedMember
+from elib_run._run._executor import Executor
+from elib_run._run._governor import DEFAULT_GROUP, GOVERNOR, Ticket
+from elib_run._run._limits import ResourceLimits
+from elib_run._run._monitor_running_process import check_running_process, release_context
+from elib_run._run._result import RunResult
+from elib_run._run._run import (
+    _DEFAULT_PROCESS_TIMEOUT, CommandType, ParserType, _acquire, _build_context, _start_context, check_error,
+)
+from elib_run._run._run_context import RunContext
+from elib_run._run._trigger import Trigger
+
+_LOGGER = logging.getLogger('elib_run')
+
+_COLLECTOR_INTERVAL = 0.01
+
+
+class RunHandle:
+    """
+    Handle on a sub-process running in the background
+
+    Output is collected by a single thread shared between all handles.
+
+    The governor ticket, if any, is released as soon as the process is done.
+    """
+
+    def __init__(self, context: RunContext, ticket: typing.Optional[Ticket] = None) -> None:
+        self.context = context
+        self._ticket = ticket
+        self._lock = threading.RLock()
+        self._finished = threading.Event()
+        self._error: typing.Optional[Exception] = None
+        self._result: typing.Optional[RunResult] = None
+
+    def __repr__(self) -> str:
+        return f'RunHandle({self.context.cmd_as_string}, finished={self.finished})'
+
+    @property
+    def finished(self) -> bool:
+        """
+        :return: True if the process is done running (or if a trigger stopped the monitoring)
+        :rtype: bool
+        """
+        return self._finished.is_set()
+
+    def _pump(self) -> bool:
+        with self._lock:
+            if not self._finished.is_set():
+                try:
+                    done = check_running_process(self.context)
+                except ProcessTimeoutError as error:
+                    self._error = error
+                    done = True
+                except Exception as error:  # pylint: disable=broad-except
+                    # a trigger callback, a parser or a recorder failed: nothing collects the output anymore
+                    _LOGGER.exception('%s: failed to collect output', self.context.exe_short_name)
+                    self._error = error
+                    self._stop_process()
+                    done = True
+                if done:
+                    self._finish()
+            return self._finished.is_set()
+
+    def _stop_process(self):
+        try:
+            if self.context.started and not self.context.process_finished():
+                self.context.kill_process()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception('%s: failed to kill process', self.context.exe_short_name)
+
+    def _finish(self):
+        try:
+            self.context.process_logger.flush()
+        finally:
+            release_context(self.context)
+            self._release()
+            self._finished.set()
+
+    def _release(self):
+        if self._ticket is not None:
+            GOVERNOR.release(self._ticket)
+            self._ticket = None
+
+    def poll(self) -> typing.Optional[int]:
+        """
+        Collects pending output and checks whether the process is done
+
+        :return: return code if the process is done, None otherwise
+        :rtype: optional int
+        """
+        if self._pump():
+            return self.context.return_code
+        return None
+
+    def wait(self, timeout: typing.Optional[float] = None) -> typing.Optional[int]:
+        """
+        Waits for the process to be done
+
+        :param timeout: maximum time to wait for, in seconds (defaults to waiting forever)
+        :type timeout: optional float
+        :return: return code if the process is done, None if "timeout" expired first
+        :rtype: optional int
+        :raises Exception: the error that stopped the output collection, if any (e.g. ProcessTimeoutError)
+        """
+        if not self._finished.wait(timeout):
+            return None
+        if self._error is not None:
+            raise self._error
+        return self.context.return_code
+
+    def kill(self) -> int:
+        """
+        Kills the process and collects its remaining output
+
+        A process left running by a "stop" trigger is killed as well; the run still reports the success of the
+        trigger, and the return code of the killed process is returned.
+
+        :return: process return code
+        :rtype: int
+        """
+        with self._lock:
+            if not self._finished.is_set():
+                self.context.kill_process()
+                self._pump()
+            elif self.context.started and not self.context.process_finished():
+                self.context.kill_process()
+                return self.context.command.returncode
+        return self.context.return_code
+
+    @property
+    def output_so_far(self) -> str:
+        """
+        :return: output collected so far
+        :rtype: str
+        """
+        with self._lock:
+            return self.context.process_output_as_str
+
+    def result(self) -> RunResult:
+        """
+        Waits for the process to be done, then checks its return code like "run" does (once: the result is kept)
+
+        :return: command output and return code
+        :rtype: RunResult
+        """
+        self.wait()
+        with self._lock:
+            if self._result is None:
+                check_error(self.context)
+                self._result = RunResult(self.context)
+            return self._result
+
+
+class _Collector:
+    """
+    Collects output for all running handles from a single daemon thread
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._handles: typing.List[RunHandle] = []
+        self._lock = threading.Lock()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def register(self, handle: RunHandle):
+        """
+        Adds a handle to the collection loop, starting the thread if necessary
+
+        :param handle: handle to collect output for
+        :type handle: RunHandle
+        """
+        with self._lock:
+            self._handles.append(handle)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='elib_run collector', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                if not self._handles:
+                    self._thread = None
+                    return
+                handles = list(self._handles)
+            for handle in handles:
+                try:
+                    done = handle._pump()  # pylint: disable=protected-access
+                except Exception as error:  # pylint: disable=broad-except
+                    _LOGGER.exception('%s: failed to collect output', handle.context.exe_short_name)
+                    handle._error = error  # pylint: disable=protected-access
+                    handle._finish()  # pylint: disable=protected-access
+                    done = True
+                if done:
+                    with self._lock:
+                        self._handles.remove(handle)
+            time.sleep(self.interval)
+
+
+_COLLECTOR = _Collector(_COLLECTOR_INTERVAL)
+
+
+def start(cmd: CommandType,
+          *paths: str,
+          cwd: str = '.',
+          mute: bool = False,
+          filters: typing.Optional[typing.Union[typing.Iterable[str], str]] = None,
+          failure_ok: bool = False,
+          timeout: float = _DEFAULT_PROCESS_TIMEOUT,
+          triggers: typing.Optional[typing.Union[typing.Iterable[Trigger], Trigger]] = None,
+          limits: typing.Optional[ResourceLimits] = None,
+          priority: int = 0,
+          group: str = DEFAULT_GROUP,
+          weight: typing.Optional[float] = None,
+          parsers: typing.Optional[typing.Iterable[ParserType]] = None,
+          encoding: str = 'utf8',
+          storage: str = 'list',
+          executor: typing.Optional[Executor] = None,
+          sample_interval: typing.Optional[float] = None,
+          timestamps: bool = False,
+          idle_timeout: typing.Optional[float] = None,
+          ) -> RunHandle:
+    """
+    Starts a command in the background and returns a handle on it
+
+    Takes the same arguments as "run"; "failure_ok" is only checked when calling "RunHandle.result"
+
+    Args:
+        cmd: command to execute, either as a string, or as a pre-split list of arguments (skips parsing)
+        paths: paths to search executable in
+        cwd: working directory (defaults to ".")
+        mute: if true, output will not be printed
+        filters: gives a list of partial strings to filter out from the output (stdout or stderr)
+        failure_ok: if False (default), a return code different than 0 will exit the application
+        timeout: sub-process timeout
+        triggers: output-match triggers that stop, kill or call back as soon as a line matches
+        limits: resource limits applied to the process before it executes (POSIX only; see ResourceLimits about threads)
+        priority: admission priority when the process-wide governor is saturated (lowest value first)
+        group: group of callers this run belongs to, for fair sharing in the process-wide governor
+        weight: weight of this run in the process-wide governor (defaults to the weight configured for the executable)
+        parsers: line parsers (LineParser or callables); their records are collected in the result as output streams
+        encoding: encoding of the process output, or "auto" to detect it from a BOM (falls back to the locale encoding)
+        storage: output storage: "list", "compact" (repeated lines collapsed), "zlib" or "lzma" (also compressed),
+            "indexed" (line offsets for random access into very large output, spilled to disk)
+        executor: executor spawning the process (defaults to the local one, running it through sarge)
+        sample_interval: samples CPU, memory and threads of the process (and descendants) at this interval, in seconds
+        timestamps: records the time at which each line of output is captured (see RunResult.timings)
+        idle_timeout: kills the process if it produces no output for this long, in seconds (timeout kind: "idle")
+
+    Returns: handle on the running process
+    """
+    context = _build_context(
+        cmd,
+        *paths,
+        cwd=cwd,
+        mute=mute,
+        filters=filters,
+        failure_ok=failure_ok,
+        timeout=timeout,
+        triggers=triggers,
+        limits=limits,
+        parsers=parsers,
+        encoding=encoding,
+        storage=storage,
+        executor=executor,
+        sample_interval=sample_interval,
+        timestamps=timestamps,
+        idle_timeout=idle_timeout,
+    )
+
+    ticket = _acquire(context, weight, priority, group)
+    try:
+        _start_context(context)
+    except BaseException:
+        GOVERNOR.release(ticket)
+        raise
+    handle = RunHandle(context, ticket)
+    _COLLECTOR.register(handle)
+
+    return handle
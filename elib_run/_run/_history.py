@@ -0,0 +1,133 @@
+# coding=utf-8
+"""
+Local store of the duration and peak memory of past runs, by command
+"""
+import os
+import pathlib
+import shlex
+import sqlite3
+import threading
+import time
+import typing
+
+# noinspection PyCompatibility
+import dataclasses
+
+# estimates are based on the most recent runs only, so that they follow changes in the commands
+_RECENT_RUNS = 10
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    duration REAL NOT NULL,
+    peak_rss INTEGER,
+    return_code INTEGER NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_key ON runs (key, id);
+'''
+
+
+def history_key(exe_path: pathlib.Path, args_list: typing.Sequence[str]) -> str:
+    """
+    Builds the key a command is stored under: the resolved executable, and its quoted arguments
+
+    :param exe_path: path to the executable
+    :type exe_path: pathlib.Path
+    :param args_list: arguments
+    :type args_list: sequence of str
+    :return: key
+    :rtype: str
+    """
+    exe = os.path.normcase(str(exe_path.resolve()))
+    return ' '.join([shlex.quote(exe)] + [shlex.quote(arg) for arg in args_list])
+
+
+@dataclasses.dataclass
+class JobStats:
+    """
+    Statistics of the recent runs of a command
+
+    Attributes:
+        runs: number of runs the statistics are based on
+        duration: mean duration, in seconds
+        max_duration: longest duration, in seconds
+        peak_rss: highest resident memory, in bytes (None if it was never sampled)
+    """
+    runs: int
+    duration: float
+    max_duration: float
+    peak_rss: typing.Optional[int] = None
+
+
+class HistoryStore:
+    """
+    SQLite database of the duration and peak memory of past runs, keyed by command (see "history_key")
+
+    Can be shared between threads, and between processes (SQLite locks the file).
+    """
+
+    def __init__(self, path: typing.Union[str, pathlib.Path] = ':memory:') -> None:
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.path!r})'
+
+    def __enter__(self) -> 'HistoryStore':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, key: str, duration: float, peak_rss: typing.Optional[int] = None, return_code: int = 0):
+        """
+        Adds a run
+
+        :param key: command key
+        :type key: str
+        :param duration: duration of the run, in seconds
+        :type duration: float
+        :param peak_rss: highest resident memory of the process, in bytes, if known
+        :type peak_rss: optional int
+        :param return_code: return code of the process
+        :type return_code: int
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT INTO runs (key, duration, peak_rss, return_code, recorded_at) VALUES (?, ?, ?, ?, ?)',
+                (key, duration, peak_rss or None, return_code, time.time()),
+            )
+
+    def stats(self, key: str) -> typing.Optional[JobStats]:
+        """
+        :param key: command key
+        :type key: str
+        :return: statistics of the recent runs of the command, or None if it never ran
+        :rtype: optional JobStats
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT duration, peak_rss FROM runs WHERE key = ? ORDER BY id DESC LIMIT ?', (key, _RECENT_RUNS),
+            ).fetchall()
+        if not rows:
+            return None
+        durations = [duration for duration, _ in rows]
+        peaks = [peak_rss for _, peak_rss in rows if peak_rss is not None]
+        return JobStats(
+            runs=len(rows),
+            duration=sum(durations) / len(durations),
+            max_duration=max(durations),
+            peak_rss=max(peaks) if peaks else None,
+        )
+
+    def close(self):
+        """
+        Closes the database
+        """
+        with self._lock:
+            self._connection.close()
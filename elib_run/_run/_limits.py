@@ -0,0 +1,151 @@
+# coding=utf-8
+"""
+Resource limits applied to a sub-process before it executes
+"""
+import ctypes
+import os
+import platform
+import signal
+import typing
+
+# noinspection PyCompatibility
+import dataclasses
+
+from elib_run._exc import ELIBRunError
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # not available on Windows
+    resource = None  # type: ignore
+
+# ioprio_set syscall numbers, per machine
+_IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'amd64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'arm64': 30,
+    'armv7l': 314,
+    'ppc64le': 273,
+}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_BEST_EFFORT = 2
+_IOPRIO_CLASS_SHIFT = 13
+
+_MEMORY_ERRORS = ('MemoryError', 'Cannot allocate memory', 'bad_alloc', 'out of memory')
+_OPEN_FILES_ERRORS = ('Too many open files', 'EMFILE')
+
+
+def _resolve_syscall() -> typing.Callable[..., int]:
+    # loading libc takes locks and allocates: done in the parent, so that the child only makes the call
+    return ctypes.CDLL(None, use_errno=True).syscall
+
+
+def _ioprio_set(syscall: typing.Callable[..., int], level: int):
+    number = _IOPRIO_SET_SYSCALLS[platform.machine().lower()]
+    if syscall(number, _IOPRIO_WHO_PROCESS, 0, (_IOPRIO_CLASS_BEST_EFFORT << _IOPRIO_CLASS_SHIFT) | level) != 0:
+        raise OSError(ctypes.get_errno(), 'ioprio_set failed')
+
+
+@dataclasses.dataclass
+class ResourceLimits:
+    """
+    Resource limits applied to a sub-process before it executes (POSIX only)
+
+    The limits are applied by "preexec_fn", in the child, between fork and exec. That is not safe in a program
+    running other threads (or on a free-threaded interpreter): the child only has a copy of the thread that forked,
+    and deadlocks if it needs a lock another thread held at that time. Programs starting processes from several
+    threads should rather apply limits with a wrapper executable (e.g. "prlimit", "nice", "taskset").
+
+    Attributes:
+        address_space: maximum size of the process virtual memory, in bytes (RLIMIT_AS)
+        cpu_time: maximum CPU time, in seconds (RLIMIT_CPU)
+        open_files: maximum number of open file descriptors (RLIMIT_NOFILE)
+        nice: niceness increment
+        ionice: best-effort I/O priority level, from 0 (highest) to 7 (lowest) (Linux only)
+        cpu_affinity: CPUs the process is allowed to run on (Linux only)
+    """
+    address_space: typing.Optional[int] = None
+    cpu_time: typing.Optional[int] = None
+    open_files: typing.Optional[int] = None
+    nice: typing.Optional[int] = None
+    ionice: typing.Optional[int] = None
+    cpu_affinity: typing.Optional[typing.Iterable[int]] = None
+    _syscall: typing.Optional[typing.Callable[..., int]] = dataclasses.field(
+        default=None, init=False, repr=False, compare=False,
+    )
+
+    def _check_positive_int(self, name: str):
+        value = getattr(self, name)
+        if value is not None:
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise TypeError(f'{name}: expected an int, got "{type(value)}"')
+            if value <= 0:
+                raise ValueError(f'{name}: expected a positive value, got {value}')
+
+    def _check_platform(self):
+        if resource is None:
+            raise ELIBRunError('resource limits are not supported on this platform')
+        if self.ionice is not None and platform.machine().lower() not in _IOPRIO_SET_SYSCALLS:
+            raise ELIBRunError(f'ionice is not supported on this platform: {platform.machine()}')
+        if self.cpu_affinity is not None and not hasattr(os, 'sched_setaffinity'):
+            raise ELIBRunError('CPU affinity is not supported on this platform')
+
+    def __post_init__(self):
+        self._check_positive_int('address_space')
+        self._check_positive_int('cpu_time')
+        self._check_positive_int('open_files')
+        if self.nice is not None and (not isinstance(self.nice, int) or isinstance(self.nice, bool)):
+            raise TypeError(f'nice: expected an int, got "{type(self.nice)}"')
+        if self.ionice is not None and self.ionice not in range(8):
+            raise ValueError(f'ionice: expected a level between 0 and 7, got {self.ionice}')
+        if self.cpu_affinity is not None:
+            self.cpu_affinity = list(self.cpu_affinity)
+            if not self.cpu_affinity:
+                raise ValueError('cpu_affinity: expected at least one CPU')
+        self._check_platform()
+        if self.ionice is not None:
+            self._syscall = _resolve_syscall()
+
+    def apply(self):
+        """
+        Applies the limits to the current process
+
+        Runs in the child process, between fork and exec.
+        """
+        if self.address_space is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (self.address_space, self.address_space))
+        if self.cpu_time is not None:
+            # the soft limit sends SIGXCPU, the hard limit SIGKILL one second later
+            resource.setrlimit(resource.RLIMIT_CPU, (self.cpu_time, self.cpu_time + 1))
+        if self.open_files is not None:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (self.open_files, self.open_files))
+        if self.nice is not None:
+            os.nice(self.nice)
+        if self.ionice is not None:
+            _ioprio_set(self._syscall, self.ionice)  # type: ignore
+        if self.cpu_affinity is not None:
+            os.sched_setaffinity(0, self.cpu_affinity)  # type: ignore
+
+    def limit_hit(self, return_code: int, output: str) -> typing.Optional[str]:
+        """
+        Guesses which limit, if any, made the process fail
+
+        :param return_code: process return code
+        :type return_code: int
+        :param output: process output
+        :type output: str
+        :return: name of the limit that was hit ("address_space", "cpu_time" or "open_files"), or None
+        :rtype: optional str
+        """
+        if return_code == 0:
+            return None
+        if self.cpu_time is not None and return_code in (-signal.SIGXCPU, -signal.SIGKILL):
+            return 'cpu_time'
+        if self.address_space is not None and any(error in output for error in _MEMORY_ERRORS):
+            return 'address_space'
+        if self.open_files is not None and any(error in output for error in _OPEN_FILES_ERRORS):
+            return 'open_files'
+        return None
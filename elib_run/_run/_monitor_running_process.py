@@ -3,31 +3,139 @@
 Runs an infinite loop that waits for the process to either exit on its or time out
 """
 
+import logging
+import threading
+import time
+
 from elib_run._exc import ProcessTimeoutError
 # noinspection PyProtectedMember
-from elib_run._run._capture_output import capture_output_from_running_process
+from elib_run._run._capture_output import capture_output_from_running_process, flush_captured_output
 from elib_run._run._run_context import RunContext
+from elib_run._run._shutdown import detach, unregister
 
+_LOGGER_PROCESS = logging.getLogger('elib_run.process')
 
-def monitor_running_process(context: RunContext):
+_MONITOR_INTERVAL = 0.001
+_DISCARD_INTERVAL = 0.05
+
+
+def handle_fired_trigger(context: RunContext):
     """
-    Runs an infinite loop that waits for the process to either exit on its or time out
+    Acts upon the trigger that stopped the output capture
 
-    Captures all output from the running process
+    A "stop" trigger leaves the process running and reports success, while a "kill" trigger terminates it and
+    reports its return code.
 
     :param context: run context
     :type context: RunContext
     """
-    while True:
+    if context.fired_trigger.action == 'kill':
+        _LOGGER_PROCESS.info('%s: trigger matched, killing process', context.exe_short_name)
+        context.kill_process()
+        flush_captured_output(context)
+        context.return_code = context.command.returncode
+    else:
+        _LOGGER_PROCESS.info('%s: trigger matched, leaving process running', context.exe_short_name)
+        context.return_code = 0
+
+
+def check_running_process(context: RunContext) -> bool:
+    """
+    Captures pending output from the running process, and checks whether it is done
+
+    A process that runs for longer than its timeout, or that produces no output for longer than its idle timeout,
+    is killed.
+
+    :param context: run context
+    :type context: RunContext
+    :return: True if the process exited, or if a trigger stopped the monitoring
+    :rtype: bool
+    """
+    capture_output_from_running_process(context)
+    context.sample_resources()
+
+    if context.fired_trigger is not None:
+        handle_fired_trigger(context)
+        return True
+
+    if context.process_finished():
+        # Collect whatever the process wrote right before exiting
+        context.wait_for_output()
         capture_output_from_running_process(context)
+        flush_captured_output(context)
+        context.return_code = context.command.returncode
+        context.check_limit_hit()
+        return True
+
+    timeout_kind = context.process_timed_out()
+    if timeout_kind:
+        context.kill_process()
+        context.return_code = -1
+        raise ProcessTimeoutError(
+            exe_name=context.exe_short_name,
+            timeout=context.idle_timeout if timeout_kind == 'idle' else context.timeout,
+            kind=timeout_kind,
+        )
+
+    return False
+
+
+def _discard(context: RunContext):
+    capture = context.capture
+    try:
+        while True:
+            while capture.readline(block=False):
+                pass
+            if context.process_finished():
+                return
+            time.sleep(_DISCARD_INTERVAL)
+    except Exception:  # pylint: disable=broad-except
+        # the process is gone, or its executor cannot be reached anymore
+        _LOGGER_PROCESS.debug('%s: stopped discarding output', context.exe_short_name, exc_info=True)
+
+
+def discard_output(context: RunContext):
+    """
+    Reads and drops the output of a process that is not monitored anymore, until it exits
 
-        if context.process_finished():
-            context.return_code = context.command.returncode
-            break
+    Otherwise, its output would pile up in the capture for as long as it runs.
 
-        if context.process_timed_out():
-            context.return_code = -1
-            raise ProcessTimeoutError(
-                exe_name=context.exe_short_name,
-                timeout=context.timeout,
-            )
+    :param context: run context
+    :type context: RunContext
+    """
+    threading.Thread(target=_discard, args=(context,), name='elib_run discard', daemon=True).start()
+
+
+def release_context(context: RunContext):
+    """
+    Removes the context from the shutdown registry once it is not monitored anymore
+
+    A process left running by a "stop" trigger stays known to "shutdown" until it exits, and its output is
+    discarded.
+
+    :param context: run context
+    :type context: RunContext
+    """
+    if context.fired_trigger is not None and context.fired_trigger.action == 'stop':
+        detach(context)
+        discard_output(context)
+    else:
+        unregister(context)
+
+
+def monitor_running_process(context: RunContext):
+    """
+    Runs an infinite loop that waits for the process to either exit on its or time out
+
+    Captures all output from the running process
+
+    :param context: run context
+    :type context: RunContext
+    """
+    try:
+        while not check_running_process(context):
+            # yield to the other threads (many may be monitoring their own process) instead of spinning on poll()
+            time.sleep(_MONITOR_INTERVAL)
+    finally:
+        context.process_logger.flush()
+        release_context(context)
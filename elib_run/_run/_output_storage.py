@@ -0,0 +1,351 @@
+# coding=utf-8
+"""
+Compact storage for the captured output of highly repetitive sub-processes, and indexed storage for very large output
+"""
+import array
+import itertools
+import lzma
+import sys
+import tempfile
+import threading
+import typing
+import zlib
+
+from elib_run._run._patterns import compile_pattern
+
+STORAGE_MODES = ('list', 'compact', 'zlib', 'lzma', 'indexed')
+
+_COMPRESSORS: typing.Dict[str, typing.Tuple[typing.Callable[[bytes], bytes], typing.Callable[[bytes], bytes]]] = {
+    'zlib': (zlib.compress, zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+_DEFAULT_BLOCK_SIZE = 4096
+
+_DEFAULT_SPILL_SIZE = 16 * 1024 * 1024
+
+# number of lines decoded at once when scanning an indexed output
+_SCAN_BLOCK = 4096
+
+
+class CompactOutput:
+    """
+    List-like storage for lines of output that collapses repetitions
+
+    - identical consecutive lines are stored once, with a repeat count (run-length encoding)
+    - repeated lines share a single string object (interning)
+    - with a "compression" ("zlib" or "lzma"), every "block_size" distinct entries are sealed into a compressed
+      block, and decompressed on access
+    """
+
+    def __init__(self, compression: typing.Optional[str] = None, block_size: int = _DEFAULT_BLOCK_SIZE) -> None:
+        if compression is not None and compression not in _COMPRESSORS:
+            raise ValueError(f'unknown compression "{compression}", expected one of: {", ".join(_COMPRESSORS)}')
+        self.compression = compression
+        self.block_size = block_size
+        self._blocks: typing.List[typing.Tuple[bytes, int]] = []
+        self._lines: typing.List[str] = []
+        self._counts = array.array('L')
+        self._interned: typing.Dict[str, str] = {}
+        self._length = 0
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self._length} lines, {len(self._blocks)} sealed blocks)'
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for block, _ in self._blocks:
+            yield from self._iter_block(block)
+        for line, count in zip(self._lines, self._counts):
+            yield from itertools.repeat(line, count)
+
+    def __getitem__(self, index: typing.Union[int, slice]) -> typing.Union[str, typing.List[str]]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step < 0:
+                return list(self)[index]
+            return list(itertools.islice(self._iter_from(start), 0, max(stop - start, 0), step))
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('output index out of range')
+        return next(self._iter_from(index))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (list, CompactOutput)):
+            return len(self) == len(other) and all(left == right for left, right in zip(self, other))
+        return NotImplemented
+
+    def _iter_block(self, block: bytes) -> typing.Iterator[str]:
+        _, decompress = _COMPRESSORS[self.compression]  # type: ignore
+        for entry in decompress(block).decode('utf8').split('\n'):
+            count, line = entry.split('\t', 1)
+            yield from itertools.repeat(line, int(count))
+
+    def _iter_from(self, index: int) -> typing.Iterator[str]:
+        # the line counts of the blocks and entries skip whatever comes before "index" without decompressing it
+        for block, count in self._blocks:
+            if index >= count:
+                index -= count
+                continue
+            yield from itertools.islice(self._iter_block(block), index, None)
+            index = 0
+        for line, count in zip(self._lines, self._counts):
+            if index >= count:
+                index -= count
+                continue
+            yield from itertools.repeat(line, count - index)
+            index = 0
+
+    def _seal(self):
+        compress, _ = _COMPRESSORS[self.compression]  # type: ignore
+        payload = '\n'.join(f'{count}\t{line}' for line, count in zip(self._lines, self._counts))
+        self._blocks.append((compress(payload.encode('utf8')), sum(self._counts)))
+        self._lines = []
+        self._counts = array.array('L')
+        self._interned = {}
+
+    def append(self, line: str):
+        """
+        Adds a line of output
+
+        :param line: line to add
+        :type line: str
+        """
+        self._length += 1
+        if self._lines and self._lines[-1] == line:
+            self._counts[-1] += 1
+            return
+        self._lines.append(self._interned.setdefault(line, line))
+        self._counts.append(1)
+        if self.compression is not None and len(self._lines) >= self.block_size:
+            self._seal()
+
+    @property
+    def stored_size(self) -> int:
+        """
+        :return: approximate number of bytes used to store the output
+        :rtype: int
+        """
+        return (
+            sum(len(block) for block, _ in self._blocks)
+            + sum(sys.getsizeof(line) for line in self._interned.values())
+            + sys.getsizeof(self._lines)
+            + self._counts.itemsize * len(self._counts)
+        )
+
+
+class IndexedOutput:
+    """
+    List-like storage for lines of output, kept encoded, with the offset of every line
+
+    Lines are stored as UTF-8 bytes in a buffer that spills to a temporary file once it grows over "spill_size";
+    the start offset of every line is kept in an array of 8 bytes integers. Accessing a line, a slice, or the last
+    lines reads and decodes only the bytes they span.
+    """
+
+    def __init__(self, spill_size: int = _DEFAULT_SPILL_SIZE) -> None:
+        self.spill_size = spill_size
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=spill_size)  # pylint: disable=consider-using-with
+        self._offsets = array.array('Q', [0])
+        self._lock = threading.Lock()
+        self._spilled = False
+
+    def __repr__(self) -> str:
+        location = 'on disk' if self.spilled else 'in memory'
+        return f'{self.__class__.__name__}({len(self)} lines, {self._offsets[-1]} bytes {location})'
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for start in range(0, len(self), _SCAN_BLOCK):
+            yield from self._read_lines(start, min(start + _SCAN_BLOCK, len(self)))
+
+    def __getitem__(self, index: typing.Union[int, slice]) -> typing.Union[str, typing.List[str]]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[line_index] for line_index in range(start, stop, step)]
+            return self._read_lines(start, max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('output index out of range')
+        return self._read_lines(index, index + 1)[0]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (list, CompactOutput, IndexedOutput)):
+            return len(self) == len(other) and all(left == right for left, right in zip(self, other))
+        return NotImplemented
+
+    def _read(self, start: int, end: int) -> bytes:
+        with self._lock:
+            self._buffer.seek(start)
+            data = self._buffer.read(end - start)
+            self._buffer.seek(0, 2)
+        return data
+
+    def _read_lines(self, start: int, stop: int) -> typing.List[str]:
+        if start >= stop:
+            return []
+        offsets = self._offsets
+        base = offsets[start]
+        data = self._read(base, offsets[stop] - 1)
+        # offsets, rather than splitting on line feeds, so that lines can contain any character
+        return [
+            data[offsets[index] - base:offsets[index + 1] - base - 1].decode('utf8')
+            for index in range(start, stop)
+        ]
+
+    def append(self, line: str):
+        """
+        Adds a line of output
+
+        :param line: line to add
+        :type line: str
+        """
+        data = line.encode('utf8') + b'\n'
+        with self._lock:
+            self._buffer.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+            if not self._spilled and self._offsets[-1] > self.spill_size:
+                self._buffer.rollover()
+                self._spilled = True
+
+    def find(self, pattern: typing.Union[str, typing.Pattern], start: int = 0) -> typing.Optional[int]:
+        """
+        Searches for the first line matching a regex, anywhere in the line
+
+        :param pattern: regex
+        :type pattern: str or compiled regex
+        :param start: index of the line to start from
+        :type start: int
+        :return: index of the first matching line, or None
+        :rtype: optional int
+        """
+        regex = compile_pattern(pattern) if isinstance(pattern, str) else pattern
+        for block_start in range(max(start, 0), len(self), _SCAN_BLOCK):
+            for index, line in enumerate(self._read_lines(block_start, min(block_start + _SCAN_BLOCK, len(self))),
+                                         block_start):
+                if regex.search(line):
+                    return index
+        return None
+
+    def tail(self, count: int) -> typing.List[str]:
+        """
+        :param count: number of lines
+        :type count: int
+        :return: last "count" lines
+        :rtype: list of str
+        """
+        return self._read_lines(max(len(self) - count, 0), len(self))
+
+    def as_str(self) -> str:
+        """
+        :return: all lines, joined with line feeds, decoded at once
+        :rtype: str
+        """
+        if not self:
+            return ''
+        return self._read(0, self._offsets[-1] - 1).decode('utf8')
+
+    @property
+    def spilled(self) -> bool:
+        """
+        :return: True if the output was moved to a temporary file
+        :rtype: bool
+        """
+        return self._spilled
+
+    @property
+    def stored_size(self) -> int:
+        """
+        :return: approximate number of bytes used to store the output (in memory or on disk)
+        :rtype: int
+        """
+        return self._offsets[-1] + self._offsets.itemsize * len(self._offsets)
+
+    def close(self):
+        """
+        Releases the buffer (and deletes the temporary file, if any)
+        """
+        self._buffer.close()
+
+
+OutputStorage = typing.Union[typing.List[str], CompactOutput, IndexedOutput]
+
+
+def find_line(lines: OutputStorage, pattern: typing.Union[str, typing.Pattern], start: int = 0) -> typing.Optional[int]:
+    """
+    Searches for the first line matching a regex, anywhere in the line, in any output storage
+
+    :param lines: output storage
+    :type lines: list, CompactOutput or IndexedOutput
+    :param pattern: regex
+    :type pattern: str or compiled regex
+    :param start: index of the line to start from
+    :type start: int
+    :return: index of the first matching line, or None
+    :rtype: optional int
+    """
+    if isinstance(lines, IndexedOutput):
+        return lines.find(pattern, start)
+    regex = compile_pattern(pattern) if isinstance(pattern, str) else pattern
+    for index, line in enumerate(itertools.islice(lines, max(start, 0), None), max(start, 0)):
+        if regex.search(line):
+            return index
+    return None
+
+
+def tail_lines(lines: OutputStorage, count: int) -> typing.List[str]:
+    """
+    :param lines: output storage
+    :type lines: list, CompactOutput or IndexedOutput
+    :param count: number of lines
+    :type count: int
+    :return: last "count" lines
+    :rtype: list of str
+    """
+    if not isinstance(count, int):
+        raise TypeError(f'expected an int, got "{type(count)}"')
+    if count < 0:
+        raise ValueError(f'expected a positive count, got {count}')
+    if isinstance(lines, IndexedOutput):
+        return lines.tail(count)
+    return list(lines[max(len(lines) - count, 0):])
+
+
+def output_as_str(lines: OutputStorage) -> str:
+    """
+    :param lines: output storage
+    :type lines: list, CompactOutput or IndexedOutput
+    :return: all lines, joined with line feeds
+    :rtype: str
+    """
+    if isinstance(lines, IndexedOutput):
+        return lines.as_str()
+    return '\n'.join(lines)
+
+
+def new_output_storage(mode: str) -> OutputStorage:
+    """
+    Creates the storage for the output of a sub-process
+
+    :param mode: "list" (plain list), "compact" (run-length encoding and interning), "zlib" or "lzma" (compact, and
+        compressed in blocks), "indexed" (encoded, with line offsets for random access; spills to disk)
+    :type mode: str
+    :return: storage
+    :rtype: list, CompactOutput or IndexedOutput
+    """
+    if mode == 'list':
+        return []
+    if mode == 'compact':
+        return CompactOutput()
+    if mode in _COMPRESSORS:
+        return CompactOutput(compression=mode)
+    if mode == 'indexed':
+        return IndexedOutput()
+    raise ValueError(f'unknown storage "{mode}", expected one of: {", ".join(STORAGE_MODES)}')
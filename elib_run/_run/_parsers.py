@@ -0,0 +1,88 @@
+# coding=utf-8
+"""
+Line parsers that extract structured records from the output of a sub-process while it is captured
+"""
+import json
+import typing
+
+from elib_run._run._patterns import compile_pattern
+
+
+class LineParser:
+    """
+    Base class for line parsers
+
+    Subclasses implement "parse", returning a record for lines they recognize, and None for the others.
+    Records are collected in the run result under the name of the parser.
+    """
+
+    def __init__(self, name: str) -> None:
+        if not isinstance(name, str):
+            raise TypeError(f'expected a string, got "{type(name)}"')
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.name!r})'
+
+    def parse(self, line: str) -> typing.Optional[typing.Any]:
+        """
+        :param line: line of output
+        :type line: str
+        :return: record for this line, or None
+        :rtype: optional any
+        """
+        raise NotImplementedError
+
+
+class RegexParser(LineParser):
+    """
+    Parses lines matching a regex, returning its named groups as a dict
+
+    The regex is matched at the beginning of the line, like filters.
+    """
+
+    def __init__(self, pattern: str, name: typing.Optional[str] = None) -> None:
+        if not isinstance(pattern, str):
+            raise TypeError(f'expected a string, got "{type(pattern)}"')
+        super(RegexParser, self).__init__(name or pattern)
+        self.pattern = compile_pattern(pattern)
+
+    def parse(self, line: str) -> typing.Optional[typing.Dict[str, str]]:
+        match = self.pattern.match(line)
+        if match is None:
+            return None
+        return match.groupdict()
+
+
+class JsonLinesParser(LineParser):
+    """
+    Parses lines holding a JSON object or array
+    """
+
+    def __init__(self, name: str = 'json') -> None:
+        super(JsonLinesParser, self).__init__(name)
+
+    def parse(self, line: str) -> typing.Optional[typing.Any]:
+        line = line.lstrip()
+        if not line.startswith(('{', '[')):
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+
+class CallableParser(LineParser):
+    """
+    Parses lines with a custom callable, which returns a record or None
+    """
+
+    def __init__(self, func: typing.Callable[[str], typing.Optional[typing.Any]],
+                 name: typing.Optional[str] = None) -> None:
+        if not callable(func):
+            raise TypeError(f'expected a callable, got "{type(func)}"')
+        super(CallableParser, self).__init__(name or getattr(func, '__name__', repr(func)))
+        self.func = func
+
+    def parse(self, line: str) -> typing.Optional[typing.Any]:
+        return self.func(line)
@@ -0,0 +1,20 @@
+# coding=utf-8
+"""
+Compiles and caches the regular expressions used to inspect process output
+"""
+import functools
+import re
+import typing
+
+
+@functools.lru_cache(maxsize=None)
+def compile_pattern(pattern: str) -> typing.Pattern:
+    """
+    Compiles a regex once, and returns the cached compiled object on subsequent calls
+
+    :param pattern: regex to compile
+    :type pattern: str
+    :return: compiled regex
+    :rtype: typing.Pattern
+    """
+    return re.compile(pattern)
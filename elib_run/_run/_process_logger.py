@@ -0,0 +1,96 @@
+# coding=utf-8
+"""
+Sends the output of a running sub-process to the "elib_run.process" logger in batches
+"""
+import logging
+import math
+import time
+import typing
+
+_LOGGER_PROCESS = logging.getLogger('elib_run.process')
+
+_DEFAULT_INTERVAL = 0.1
+_DEFAULT_MAX_LINES = 500
+_DEFAULT_BUDGET = 0.25
+
+
+class ProcessLogger:
+    """
+    Sends the output of a running sub-process to the "elib_run.process" logger in batches
+
+    Lines are grouped into a single log record per "interval" (in seconds) or per "max_lines" lines, whichever
+    comes first.
+
+    The time spent in the logging handlers is measured; when logging every line would take more than "budget"
+    (as a fraction of the elapsed time), the batch is sampled and a summary of the suppressed lines is logged
+    instead. This only affects the real-time log; the output buffer always keeps every line.
+    """
+
+    def __init__(self,
+                 logger: logging.Logger = _LOGGER_PROCESS,
+                 interval: float = _DEFAULT_INTERVAL,
+                 max_lines: int = _DEFAULT_MAX_LINES,
+                 budget: float = _DEFAULT_BUDGET,
+                 ) -> None:
+        self.logger = logger
+        self.interval = interval
+        self.max_lines = max_lines
+        self.budget = budget
+        self.suppressed_count = 0
+        self._pending: typing.List[str] = []
+        self._last_flush: float = 0
+        self._cost_per_line: float = 0
+
+    def log_line(self, line: str):
+        """
+        Queues a line to be logged, flushing the batch if it is due
+
+        :param line: line to log
+        :type line: str
+        """
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        self._pending.append(line)
+        if len(self._pending) >= self.max_lines:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """
+        Flushes the batch if "interval" has elapsed since the last flush
+        """
+        if self._pending and time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def _sample(self, elapsed: float) -> typing.List[str]:
+        if not self._cost_per_line:
+            return self._pending
+        allowed = max(1, int(self.budget * max(elapsed, self.interval) / self._cost_per_line))
+        if len(self._pending) <= allowed:
+            return self._pending
+        step = math.ceil(len(self._pending) / allowed)
+        return self._pending[::step]
+
+    def flush(self):
+        """
+        Logs all pending lines as a single record
+        """
+        if not self._pending:
+            return
+
+        now = time.monotonic()
+        lines = self._sample(now - self._last_flush)
+        suppressed = len(self._pending) - len(lines)
+        self._pending = []
+
+        message = '\n'.join(lines)
+        if suppressed:
+            self.suppressed_count += suppressed
+            message += f'\n[{suppressed} lines suppressed]'
+
+        self.logger.debug(message)
+
+        self._last_flush = time.monotonic()
+        cost_per_line = (self._last_flush - now) / len(lines)
+        self._cost_per_line = (self._cost_per_line + cost_per_line) / 2 if self._cost_per_line else cost_per_line
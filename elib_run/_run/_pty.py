@@ -0,0 +1,209 @@
+# coding=utf-8
+"""
+Runs processes in a pseudo-terminal, so that they line-buffer their output instead of block-buffering it
+"""
+import os
+import queue
+import re
+import struct
+import subprocess
+import threading
+import typing
+
+from elib_run._exc import ELIBRunError
+from elib_run._run._executor import LocalExecutor
+
+try:
+    import fcntl
+    import pty
+    import termios
+except ImportError:  # pragma: no cover
+    pty = None  # type: ignore
+
+_READ_SIZE = 65536
+
+# CSI sequences (colors, cursor movements, ...), OSC sequences (window title, ...) and two-character escapes
+_ANSI_SEQUENCE = re.compile(rb'\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[@-Z\\-_]')
+
+
+def clean_terminal_line(line: bytes) -> bytes:
+    """
+    Makes a line written for a terminal readable as plain text
+
+    Removes ANSI escape sequences, and keeps only what is left visible after carriage returns (progress bars and
+    spinners rewrite the same line over and over).
+
+    :param line: line, without its line feed
+    :type line: bytes
+    :return: cleaned line
+    :rtype: bytes
+    """
+    line = _ANSI_SEQUENCE.sub(b'', line)
+    if b'\r' in line:
+        segments = [segment for segment in line.split(b'\r') if segment]
+        line = segments[-1] if segments else b''
+    return line
+
+
+class _PtyProcess:  # pylint: disable=too-many-instance-attributes
+    """
+    Process running in a pseudo-terminal; acts as both the command and the capture of a run context
+    """
+
+    def __init__(self, argv: typing.List[str], cwd: str, window_size: typing.Tuple[int, int], strip_control: bool,
+                 preexec_fn: typing.Optional[typing.Callable[[], None]]) -> None:
+        self.argv = argv
+        self.cwd = cwd
+        self.window_size = window_size
+        self.strip_control = strip_control
+        self.preexec_fn = preexec_fn
+        self.process: typing.Optional[subprocess.Popen] = None
+        self.threads: typing.List[threading.Thread] = []
+        self._lines: 'queue.Queue[bytes]' = queue.Queue()
+
+    def _open_terminal(self) -> typing.Tuple[int, int]:
+        master, slave = pty.openpty()
+        columns, rows = self.window_size
+        fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', rows, columns, 0, 0))
+        # no "\n" -> "\r\n" translation: lines come out like they would through a pipe
+        attributes = termios.tcgetattr(slave)
+        attributes[1] &= ~termios.ONLCR
+        termios.tcsetattr(slave, termios.TCSANOW, attributes)
+        return master, slave
+
+    def run(self, async_: bool = False):  # pylint: disable=unused-argument
+        """
+        Starts the process, with its standard output and error connected to a new pseudo-terminal
+        """
+        master, slave = self._open_terminal()
+        try:
+            self.process = subprocess.Popen(
+                self.argv,
+                cwd=self.cwd,
+                stdin=subprocess.DEVNULL,
+                stdout=slave,
+                stderr=slave,
+                start_new_session=True,
+                preexec_fn=self.preexec_fn,  # pylint: disable=subprocess-popen-preexec-fn
+            )
+        except BaseException:
+            os.close(master)
+            raise
+        finally:
+            os.close(slave)
+        thread = threading.Thread(target=self._read, args=(master,), daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def _queue_line(self, line: bytes, end: bytes):
+        if self.strip_control:
+            line = clean_terminal_line(line)
+        self._lines.put(line + end)
+
+    def _read(self, master: int):
+        pending = b''
+        try:
+            while True:
+                try:
+                    data = os.read(master, _READ_SIZE)
+                except OSError:
+                    # EIO once the process (and its children) closed the terminal
+                    break
+                if not data:
+                    break
+                *lines, pending = (pending + data).split(b'\n')
+                for line in lines:
+                    self._queue_line(line, b'\n')
+        finally:
+            os.close(master)
+            if pending:
+                self._queue_line(pending, b'')
+
+    def readline(self, block: bool = False) -> bytes:
+        """
+        :return: next line of output, or b'' if none is available
+        :rtype: bytes
+        """
+        try:
+            return self._lines.get(block=block)
+        except queue.Empty:
+            return b''
+
+    @property
+    def returncode(self) -> typing.Optional[int]:
+        """
+        :return: return code, or None if the process is still running
+        :rtype: optional int
+        """
+        return self.process.returncode if self.process is not None else None
+
+    def poll(self) -> typing.Optional[int]:
+        """
+        :return: return code, or None if the process is still running
+        :rtype: optional int
+        """
+        return self.process.poll()  # type: ignore
+
+    def wait(self, timeout: typing.Optional[float] = None) -> int:
+        """
+        Waits for the process to exit
+        """
+        return self.process.wait(timeout)  # type: ignore
+
+    def terminate(self):
+        """
+        Terminates the process
+        """
+        self.process.terminate()  # type: ignore
+
+    def kill(self):
+        """
+        Kills the process
+        """
+        self.process.kill()  # type: ignore
+
+    def close(self):
+        """
+        Nothing to close; the terminal is closed once the process exits
+        """
+
+
+class PtyExecutor(LocalExecutor):
+    """
+    Runs processes on this machine in a pseudo-terminal (POSIX only)
+
+    Most programs block-buffer their output when it goes to a pipe, and line-buffer it when it goes to a terminal:
+    through a pseudo-terminal, lines are captured as soon as they are printed.
+
+    With "strip_control" (default), ANSI escape sequences (colors, cursor movements) are removed, and lines
+    rewritten with carriage returns (progress bars) are reduced to their final state. Standard output and error are
+    merged, like they are with the default executor; standard input is not connected.
+    """
+
+    def __init__(self, columns: int = 160, rows: int = 48, strip_control: bool = True) -> None:
+        if pty is None:
+            raise ELIBRunError('pseudo-terminals are not supported on this platform')
+        for value in (columns, rows):
+            if not isinstance(value, int):
+                raise TypeError(f'expected an int, got "{type(value)}"')
+            if value <= 0:
+                raise ValueError(f'expected a positive window size, got {value}')
+        self.columns = columns
+        self.rows = rows
+        self.strip_control = strip_control
+
+    def __repr__(self) -> str:
+        return (
+            f'{self.__class__.__name__}(columns={self.columns}, rows={self.rows}, '
+            f'strip_control={self.strip_control})'
+        )
+
+    def create_process(self, context) -> typing.Tuple[_PtyProcess, _PtyProcess]:  # type: ignore
+        process = _PtyProcess(
+            [context.exe_path_as_str] + context.args_list,
+            context.cwd,
+            (self.columns, self.rows),
+            self.strip_control,
+            context.limits.apply if context.limits is not None else None,
+        )
+        return process, process
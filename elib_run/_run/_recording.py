@@ -0,0 +1,361 @@
+# coding=utf-8
+"""
+Records the output of sub-processes to a fixture file, and replays it without spawning anything
+"""
+import base64
+import contextlib
+import json
+import logging
+import pathlib
+import threading
+import time
+import typing
+
+import sarge
+
+from elib_run._exc import ELIBRunError
+from elib_run._run._executor import StreamCapture
+
+_LOGGER = logging.getLogger('elib_run')
+
+RECORDING_MODES = ('record', 'replay', 'auto')
+PACING_MODES = ('instant', 'original')
+
+_FIXTURE_VERSION = 1
+
+RecordingKey = typing.Tuple[str, ...]
+Chunk = typing.Tuple[float, bytes]
+
+
+class RecordingNotFoundError(ELIBRunError):
+    """Raised when replaying a command that was not recorded"""
+
+    def __init__(self, key: RecordingKey) -> None:
+        self.key = key
+        super(RecordingNotFoundError, self).__init__(f'no recording found for command: {" ".join(key)}')
+
+
+class _Recording:
+    """
+    Output chunks (with their time offset since the start of the process) and return code of a single run
+    """
+
+    def __init__(self, key: RecordingKey, chunks: typing.List[Chunk], return_code: int) -> None:
+        self.key = key
+        self.chunks = chunks
+        self.return_code = return_code
+
+    def to_json(self) -> dict:
+        """
+        :return: JSON-serializable representation
+        :rtype: dict
+        """
+        return {
+            'key': list(self.key),
+            'return_code': self.return_code,
+            'chunks': [[offset, base64.b64encode(data).decode('ascii')] for offset, data in self.chunks],
+        }
+
+    @classmethod
+    def from_json(cls, value: dict) -> '_Recording':
+        """
+        :param value: JSON representation
+        :type value: dict
+        :return: recording
+        :rtype: _Recording
+        """
+        return cls(
+            tuple(value['key']),
+            [(offset, base64.b64decode(data)) for offset, data in value['chunks']],
+            value['return_code'],
+        )
+
+
+class _RecordingCapture:
+    """
+    Wraps a sarge.Capture, recording every chunk that is read from it
+    """
+
+    def __init__(self, capture: sarge.Capture) -> None:
+        self._capture = capture
+        self.chunks: typing.List[Chunk] = []
+        self.start_time = time.monotonic()
+
+    def __getattr__(self, item):
+        return getattr(self._capture, item)
+
+    def readline(self, *args, **kwargs) -> bytes:
+        """
+        Reads a line from the wrapped capture, and records it
+        """
+        data = self._capture.readline(*args, **kwargs)
+        if data:
+            self.chunks.append((time.monotonic() - self.start_time, data))
+        return data
+
+
+class _RecordingStreamCapture(_RecordingCapture, StreamCapture):  # pylint: disable=abstract-method
+    """
+    Wraps a StreamCapture, recording every chunk that is read from it, whatever its stream
+    """
+
+    def __init__(self, capture: StreamCapture) -> None:  # pylint: disable=super-init-not-called
+        _RecordingCapture.__init__(self, capture)
+
+    def read_chunk(self, *args, **kwargs) -> typing.Optional[typing.Tuple[int, bytes]]:
+        """
+        Reads a chunk from the wrapped capture, and records it
+        """
+        chunk = self._capture.read_chunk(*args, **kwargs)
+        if chunk is not None:
+            self.chunks.append((time.monotonic() - self.start_time, chunk[1]))
+        return chunk
+
+
+class _RecordingCommand:
+    """
+    Wraps a sarge.Command, saving the recording once the process is done
+    """
+
+    def __init__(self, command: sarge.Command, capture: _RecordingCapture, recorder: 'Recorder',
+                 key: RecordingKey) -> None:
+        self._command = command
+        self._capture = capture
+        self._recorder = recorder
+        self._key = key
+        self._saved = False
+
+    def __getattr__(self, item):
+        return getattr(self._command, item)
+
+    def poll(self) -> typing.Optional[int]:
+        """
+        Polls the wrapped command, saving the recording once the process is done
+        """
+        return_code = self._command.poll()
+        if return_code is not None and not self._saved:
+            self._saved = True
+            # the chunks list is shared, and keeps growing with the output drained after the process exited
+            self._recorder.add(_Recording(self._key, self._capture.chunks, return_code))
+        return return_code
+
+
+class _ReplayCommand:
+    """
+    Stands in for a sarge.Command, serving a recording back instead of spawning a process
+    """
+
+    def __init__(self, recording: _Recording, pacing: str) -> None:
+        self._recording = recording
+        self._pacing = pacing
+        self._position = 0
+        self._start_time = 0.0
+        self._killed = False
+        self.returncode: typing.Optional[int] = None
+        self.threads: typing.List[threading.Thread] = []
+
+    def run(self, async_: bool = False):  # pylint: disable=unused-argument
+        """
+        "Starts" the replay
+        """
+        self._start_time = time.monotonic()
+
+    def readline(self, block: bool = False) -> bytes:  # pylint: disable=unused-argument
+        """
+        :return: next recorded chunk, if it is due
+        :rtype: bytes
+        """
+        if self._killed or self._position >= len(self._recording.chunks):
+            return b''
+        offset, data = self._recording.chunks[self._position]
+        if self._pacing == 'original' and time.monotonic() - self._start_time < offset:
+            return b''
+        self._position += 1
+        return data
+
+    def poll(self) -> typing.Optional[int]:
+        """
+        :return: recorded return code once all chunks have been served
+        :rtype: optional int
+        """
+        if self.returncode is None and self._position >= len(self._recording.chunks):
+            self.returncode = self._recording.return_code
+        return self.returncode
+
+    def wait(self):
+        """
+        Serves all remaining chunks
+        """
+        self._pacing = 'instant'
+
+    def terminate(self):
+        """
+        Stops serving chunks
+        """
+        self._killed = True
+        if self.returncode is None:
+            self.returncode = -15
+
+    kill = terminate
+
+    def close(self):
+        """
+        Nothing to close
+        """
+
+
+class Recorder:
+    """
+    Records the output of sub-processes to a fixture file, and replays it without spawning anything
+
+    Runs are identified by their executable name and arguments; when the same command runs several times, the
+    recordings are replayed in order (the last one is replayed again once they are exhausted).
+
+    Modes:
+
+        - "record": run the commands, and record them
+        - "replay": replay recorded commands, raising RecordingNotFoundError for the others
+        - "auto": replay recorded commands, and run and record the others
+
+    Pacing (replay only):
+
+        - "instant": serve all the output right away
+        - "original": serve the output at the pace it was recorded
+    """
+
+    def __init__(self, path: typing.Union[str, pathlib.Path], mode: str = 'auto', pacing: str = 'instant') -> None:
+        if mode not in RECORDING_MODES:
+            raise ValueError(f'unknown mode "{mode}", expected one of: {", ".join(RECORDING_MODES)}')
+        if pacing not in PACING_MODES:
+            raise ValueError(f'unknown pacing "{pacing}", expected one of: {", ".join(PACING_MODES)}')
+        self.path = pathlib.Path(path)
+        self.mode = mode
+        self.pacing = pacing
+        self._lock = threading.Lock()
+        self._recordings: typing.Dict[RecordingKey, typing.List[_Recording]] = {}
+        self._replay_positions: typing.Dict[RecordingKey, int] = {}
+        self._dirty = False
+        if mode != 'record' and self.path.exists():
+            self.load()
+
+    def __repr__(self) -> str:
+        return f'Recorder({str(self.path)!r}, mode={self.mode!r}, pacing={self.pacing!r})'
+
+    def load(self):
+        """
+        Reads the recordings from the fixture file
+        """
+        content = json.loads(self.path.read_text(encoding='utf8'))
+        if content.get('version') != _FIXTURE_VERSION:
+            raise ELIBRunError(f'{self.path}: unsupported fixture version: {content.get("version")}')
+        with self._lock:
+            self._recordings = {}
+            for value in content['runs']:
+                recording = _Recording.from_json(value)
+                self._recordings.setdefault(recording.key, []).append(recording)
+
+    def save(self):
+        """
+        Writes the recordings to the fixture file
+        """
+        with self._lock:
+            runs = [recording.to_json() for recordings in self._recordings.values() for recording in recordings]
+            self._dirty = False
+        self.path.write_text(json.dumps({'version': _FIXTURE_VERSION, 'runs': runs}, indent=1), encoding='utf8')
+        _LOGGER.debug('%s: saved %s recordings', self.path, len(runs))
+
+    def add(self, recording: _Recording):
+        """
+        Adds a recording
+
+        :param recording: recording to add
+        :type recording: _Recording
+        """
+        with self._lock:
+            self._recordings.setdefault(recording.key, []).append(recording)
+            self._dirty = True
+
+    def _next_recording(self, key: RecordingKey) -> typing.Optional[_Recording]:
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if not recordings:
+                return None
+            position = self._replay_positions.get(key, 0)
+            self._replay_positions[key] = position + 1
+            return recordings[min(position, len(recordings) - 1)]
+
+    def attach(self, context):
+        """
+        Hooks into a run context that is about to start its process
+
+        In replay, the command and capture of the context are replaced by a stand-in serving the recording; in
+        record, they are wrapped to record the output.
+
+        :param context: run context
+        :type context: RunContext
+        """
+        key: RecordingKey = (context.exe_short_name, *context.args_list)
+        if self.mode != 'record':
+            recording = self._next_recording(key)
+            if recording is not None:
+                _LOGGER.debug('replaying: %s', ' '.join(key))
+                replay = _ReplayCommand(recording, self.pacing)
+                context.set_process(replay, replay)
+                return
+            if self.mode == 'replay':
+                raise RecordingNotFoundError(key)
+        _LOGGER.debug('recording: %s', ' '.join(key))
+        # the executor creates the capture along with the command: wrap that one, not the default sarge.Capture
+        command = context.command
+        if isinstance(context.capture, StreamCapture):
+            capture: _RecordingCapture = _RecordingStreamCapture(context.capture)
+        else:
+            capture = _RecordingCapture(context.capture)
+        context.set_process(_RecordingCommand(command, capture, self, key), capture)
+
+    @property
+    def dirty(self) -> bool:
+        """
+        :return: True if recordings were added since the last save
+        :rtype: bool
+        """
+        return self._dirty
+
+
+_ACTIVE_RECORDER: typing.Optional[Recorder] = None
+
+
+def active_recorder() -> typing.Optional[Recorder]:
+    """
+    :return: recorder installed by "recording", if any
+    :rtype: optional Recorder
+    """
+    return _ACTIVE_RECORDER
+
+
+@contextlib.contextmanager
+def recording(path: typing.Union[str, pathlib.Path], mode: str = 'auto', pacing: str = 'instant'):
+    """
+    Records or replays all the sub-processes started with "run" or "start" within this context
+
+    The fixture file is written when leaving the context, if anything was recorded.
+
+    :param path: fixture file
+    :type path: str or pathlib.Path
+    :param mode: "record", "replay" or "auto" (see Recorder)
+    :type mode: str
+    :param pacing: "instant" or "original" (see Recorder)
+    :type pacing: str
+    :return: recorder
+    :rtype: Recorder
+    """
+    global _ACTIVE_RECORDER  # pylint: disable=global-statement
+    previous = _ACTIVE_RECORDER
+    recorder = Recorder(path, mode, pacing)
+    _ACTIVE_RECORDER = recorder
+    try:
+        yield recorder
+    finally:
+        _ACTIVE_RECORDER = previous
+        if recorder.dirty:
+            recorder.save()
@@ -0,0 +1,152 @@
+# coding=utf-8
+"""
+Result of a sub-process run
+"""
+import typing
+
+from elib_run._run._output_storage import OutputStorage, find_line, tail_lines
+from elib_run._run._retry import Attempt
+from elib_run._run._run_context import RunContext
+from elib_run._run._sampler import ResourceSample
+from elib_run._run._timings import LineTimings
+
+
+class RunResult(tuple):
+    """
+    Result of a sub-process run
+
+    Behaves like the "(output, return_code)" tuple that "run" has always returned, and gives access to the
+    run context for everything else.
+
+    With the default "list" storage, the output string is built once. With the other storages, it is built from
+    the storage every time it is accessed, and never kept: the result only holds the compact storage.
+    """
+
+    context: RunContext
+    _lazy: bool
+
+    def __new__(cls, context: RunContext) -> 'RunResult':
+        lazy = not isinstance(context.process_output_chunks, list)
+        output = None if lazy else context.process_output_as_str
+        result = super(RunResult, cls).__new__(cls, (output, context.return_code))
+        result.context = context
+        result._lazy = lazy
+        return result
+
+    def _as_tuple(self) -> typing.Tuple[str, int]:
+        if self._lazy:
+            return self.context.process_output_as_str, typing.cast(int, super(RunResult, self).__getitem__(1))
+        return typing.cast(typing.Tuple[str, int], tuple(super(RunResult, self).__iter__()))
+
+    def __getitem__(self, index):  # type: ignore
+        if self._lazy:
+            return self._as_tuple()[index]
+        return super(RunResult, self).__getitem__(index)
+
+    def __iter__(self) -> typing.Iterator:
+        return iter(self._as_tuple())
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._as_tuple()
+
+    def __eq__(self, other: object) -> bool:
+        return self._as_tuple() == other
+
+    def __ne__(self, other: object) -> bool:
+        return self._as_tuple() != other
+
+    def __hash__(self) -> int:
+        return hash(self._as_tuple())
+
+    def __repr__(self) -> str:
+        return repr(self._as_tuple())
+
+    @property
+    def output(self) -> str:
+        """
+        :return: process output
+        :rtype: str
+        """
+        return typing.cast(str, self[0])
+
+    @property
+    def return_code(self) -> int:
+        """
+        :return: process return code
+        :rtype: int
+        """
+        return typing.cast(int, self[1])
+
+    @property
+    def limit_hit(self) -> typing.Optional[str]:
+        """
+        :return: name of the resource limit that made the process fail, if any
+        :rtype: optional str
+        """
+        return self.context.limit_hit
+
+    @property
+    def attempts(self) -> typing.List[Attempt]:
+        """
+        :return: outcome and duration of every attempt at running the process
+        :rtype: list of Attempt
+        """
+        return self.context.attempts
+
+    @property
+    def records(self) -> typing.Dict[str, typing.List[typing.Any]]:
+        """
+        :return: records collected by the line parsers, by parser name
+        :rtype: dict
+        """
+        return self.context.parsed_records
+
+    @property
+    def samples(self) -> typing.List[ResourceSample]:
+        """
+        :return: CPU and memory usage of the process over time (empty unless "sample_interval" was given)
+        :rtype: list of ResourceSample
+        """
+        if self.context.sampler is None:
+            return []
+        return self.context.sampler.samples
+
+    @property
+    def timings(self) -> typing.Optional[LineTimings]:
+        """
+        :return: time at which each line of output was captured (None unless "timestamps" was set)
+        :rtype: optional LineTimings
+        """
+        return self.context.line_timings
+
+    @property
+    def lines(self) -> OutputStorage:
+        """
+        Lines of output, as stored; with the "indexed" storage, indexing and slicing read only the lines asked for
+
+        :return: process output, line by line
+        :rtype: list, CompactOutput or IndexedOutput
+        """
+        return self.context.process_output_chunks
+
+    def find(self, pattern: typing.Union[str, typing.Pattern], start: int = 0) -> typing.Optional[int]:
+        """
+        Searches the output for the first line matching a regex (anywhere in the line)
+
+        :param pattern: regex
+        :type pattern: str or compiled regex
+        :param start: index of the line to start from
+        :type start: int
+        :return: index of the first matching line in "lines", or None
+        :rtype: optional int
+        """
+        return find_line(self.lines, pattern, start)
+
+    def tail(self, count: int) -> typing.List[str]:
+        """
+        :param count: number of lines
+        :type count: int
+        :return: last "count" lines of output
+        :rtype: list of str
+        """
+        return tail_lines(self.lines, count)
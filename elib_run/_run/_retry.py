@@ -0,0 +1,96 @@
+# coding=utf-8
+"""
+Retry policy for sub-processes that fail transiently
+"""
+import random
+import typing
+
+# noinspection PyCompatibility
+import dataclasses
+
+from elib_run._run._patterns import compile_pattern
+
+
+@dataclasses.dataclass
+class Attempt:
+    """
+    Outcome of a single attempt at running a sub-process
+    """
+    return_code: int
+    duration: float
+    delay: float = 0
+    timed_out: bool = False
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    """
+    Retries a sub-process that fails with given return codes, or whose output matches given regexes
+
+    Patterns are matched at the beginning of each line of output, like filters.
+
+    The delay before attempt "n" (starting at 1 for the first retry) is "backoff * factor ** (n - 1)", capped to
+    "max_backoff", then randomized by +/- "jitter" (as a fraction of the delay).
+
+    Attributes:
+        return_codes: return codes to retry on (any non-zero return code if both this and "patterns" are empty)
+        patterns: regexes to retry on when the process fails
+        max_attempts: maximum number of attempts, including the first one
+        backoff: delay before the first retry, in seconds
+        factor: multiplier applied to the delay after each retry
+        max_backoff: maximum delay between two attempts, in seconds
+        jitter: randomization of the delay, as a fraction of the delay
+        retry_on_timeout: also retry processes that ran for longer than their timeout
+    """
+    return_codes: typing.Iterable[int] = ()
+    patterns: typing.Iterable[str] = ()
+    max_attempts: int = 3
+    backoff: float = 1.0
+    factor: float = 2.0
+    max_backoff: float = 60.0
+    jitter: float = 0.1
+    retry_on_timeout: bool = False
+
+    def __post_init__(self):
+        self.return_codes = frozenset(self.return_codes)
+        self.patterns = tuple(self.patterns)
+        for index, pattern in enumerate(self.patterns):
+            if not isinstance(pattern, str):
+                raise TypeError(f'expected a string, got "{type(pattern)}" at index {index}')
+        if not isinstance(self.max_attempts, int) or self.max_attempts < 1:
+            raise ValueError(f'expected a positive int, got {self.max_attempts}')
+        if self.backoff < 0 or self.max_backoff < 0 or self.factor < 1:
+            raise ValueError('backoff and max_backoff must be positive, and factor at least 1')
+        if not 0 <= self.jitter <= 1:
+            raise ValueError(f'expected a jitter between 0 and 1, got {self.jitter}')
+
+    def _output_matches(self, output_lines: typing.Iterable[str]) -> bool:
+        patterns = [compile_pattern(pattern) for pattern in self.patterns]
+        return any(pattern.match(line) for line in output_lines for pattern in patterns)
+
+    def should_retry(self, attempt_number: int, return_code: int, output_lines: typing.Iterable[str]) -> bool:
+        """
+        :param attempt_number: number of the attempt that just ended, starting at 1
+        :type attempt_number: int
+        :param return_code: return code of that attempt
+        :type return_code: int
+        :param output_lines: output of that attempt
+        :type output_lines: iterable of str
+        :return: True if another attempt should be made
+        :rtype: bool
+        """
+        if return_code == 0 or attempt_number >= self.max_attempts:
+            return False
+        if not self.return_codes and not self.patterns:
+            return True
+        return return_code in self.return_codes or bool(self.patterns and self._output_matches(output_lines))
+
+    def delay(self, retry_number: int) -> float:
+        """
+        :param retry_number: number of the retry, starting at 1
+        :type retry_number: int
+        :return: delay before that retry, in seconds
+        :rtype: float
+        """
+        delay = min(self.backoff * self.factor ** (retry_number - 1), self.max_backoff)
+        return max(0.0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
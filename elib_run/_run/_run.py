@@ -2,22 +2,36 @@
 """
 Manages runners
 """
+import functools
 import logging
 import pathlib
 import shlex
 import sys
+import time
 import typing
 
-import sarge
-
-from elib_run._exc import ExecutableNotFoundError
+from elib_run._exc import ExecutableNotFoundError, ProcessTimeoutError
 from elib_run._find_exe import find_executable
+from elib_run._run._executor import Executor, StreamCapture
+from elib_run._run._governor import DEFAULT_GROUP, GOVERNOR, Ticket
+from elib_run._run._history import HistoryStore, history_key
+from elib_run._run._limits import ResourceLimits
 from elib_run._run._monitor_running_process import monitor_running_process
+from elib_run._run._parsers import CallableParser, LineParser
+from elib_run._run._result import RunResult
+from elib_run._run._retry import Attempt, RetryPolicy
 from elib_run._run._run_context import RunContext
+from elib_run._run._sampler import ResourceSampler
+from elib_run._run._timings import LineTimings
+from elib_run._run._trigger import Trigger
 
 _DEFAULT_PROCESS_TIMEOUT = float(60)
+_PARSE_CACHE_SIZE = 512
 _LOGGER_PROCESS = logging.getLogger('elib_run.process')
 
+ParserType = typing.Union[LineParser, typing.Callable[[str], typing.Optional[typing.Any]]]
+CommandType = typing.Union[str, pathlib.Path, typing.Sequence[typing.Union[str, pathlib.Path]]]
+
 
 def _exit(context: RunContext):
     if context.mute:
@@ -47,7 +61,7 @@ def check_error(context: RunContext) -> int:
             context.result_buffer += f'{context.cmd_as_string}: command failed: {context.return_code}'
 
         _LOGGER_PROCESS.error(context.result_buffer)
-        _LOGGER_PROCESS.error(repr(context))
+        _LOGGER_PROCESS.debug(repr(context))
 
         if not context.failure_ok:
             _exit(context)
@@ -74,68 +88,276 @@ def _sanitize_filters(filters: typing.Optional[typing.Union[typing.Iterable[str]
     return filters
 
 
-def _parse_cmd(cmd: str, *paths: str) -> typing.Tuple[pathlib.Path, typing.List[str]]:
+def _sanitize_triggers(triggers: typing.Optional[typing.Union[typing.Iterable[Trigger], Trigger]]
+                       ) -> typing.Optional[typing.List[Trigger]]:
+    if isinstance(triggers, Trigger):
+        return [triggers]
+    if triggers is not None:
+        triggers = list(triggers)
+        for index, item in enumerate(triggers):
+            if not isinstance(item, Trigger):
+                raise TypeError(f'item at position {index} is not a Trigger: {type(item)}')
+        return triggers
+    return None
+
+
+@functools.lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _split_cmd(cmd: str) -> typing.Tuple[str, typing.Tuple[str, ...]]:
     try:
         exe_name, args = cmd.split(' ', maxsplit=1)
     except ValueError:
         # cmd has no argument
         exe_name, args = cmd, ''
+    return exe_name, tuple(shlex.split(args))
+
+
+def _split_argv(argv: typing.Sequence[typing.Union[str, pathlib.Path]]
+                ) -> typing.Tuple[typing.Union[str, pathlib.Path], typing.List[str]]:
+    if not argv:
+        raise ValueError('empty command')
+    exe_name, *args = argv
+    for index, arg in enumerate(args):
+        if not isinstance(arg, (str, pathlib.Path)):
+            raise TypeError(f'expected a string, got "{type(arg)}" at index {index + 1}')
+    return exe_name, [str(arg) for arg in args]
+
+
+def _sanitize_parsers(parsers: typing.Optional[typing.Iterable[ParserType]]
+                      ) -> typing.Optional[typing.List[LineParser]]:
+    if parsers is None:
+        return None
+    result = []
+    for index, item in enumerate(parsers):
+        if isinstance(item, LineParser):
+            result.append(item)
+        elif callable(item):
+            result.append(CallableParser(item))
+        else:
+            raise TypeError(f'item at position {index} is not a LineParser or a callable: {type(item)}')
+    return result
+
+
+def _parse_cmd(cmd: CommandType, *paths: str) -> typing.Tuple[pathlib.Path, typing.List[str]]:
+    args_list: typing.List[str]
+    if isinstance(cmd, str):
+        exe_name, args = _split_cmd(cmd)
+        args_list = list(args)
+    elif isinstance(cmd, pathlib.Path):
+        exe_name, args_list = cmd, []
+    elif isinstance(cmd, (list, tuple)):
+        exe_name, args_list = _split_argv(cmd)
+    else:
+        raise TypeError(f'expected a string, a pathlib.Path or a list, got "{type(cmd)}"')
+
+    if isinstance(exe_name, pathlib.Path):
+        # Explicit path to the executable: no lookup
+        if not exe_name.is_file():
+            raise ExecutableNotFoundError(str(exe_name))
+        return exe_name, args_list
+
+    if not isinstance(exe_name, str):
+        raise TypeError(f'expected a string or a pathlib.Path, got "{type(exe_name)}"')
+
     exe_path: typing.Optional[pathlib.Path] = find_executable(exe_name, *paths)
 
     if not exe_path:
         raise ExecutableNotFoundError(exe_name)
 
-    args_list = shlex.split(args)
-
     return exe_path, args_list
 
 
-def run(cmd: str,
+def _build_context(cmd: CommandType,
+                   *paths: str,
+                   cwd: str = '.',
+                   mute: bool = False,
+                   filters: typing.Optional[typing.Union[typing.Iterable[str], str]] = None,
+                   failure_ok: bool = False,
+                   timeout: float = _DEFAULT_PROCESS_TIMEOUT,
+                   triggers: typing.Optional[typing.Union[typing.Iterable[Trigger], Trigger]] = None,
+                   limits: typing.Optional[ResourceLimits] = None,
+                   parsers: typing.Optional[typing.Iterable[ParserType]] = None,
+                   encoding: str = 'utf8',
+                   storage: str = 'list',
+                   executor: typing.Optional[Executor] = None,
+                   sample_interval: typing.Optional[float] = None,
+                   timestamps: bool = False,
+                   idle_timeout: typing.Optional[float] = None,
+                   ) -> RunContext:
+    filters = _sanitize_filters(filters)
+
+    exe_path, args_list = _parse_cmd(cmd, *paths)
+
+    # Arguments, filters and triggers have been checked item by item above; only check the rest once
+    context = RunContext(  # type: ignore
+        exe_path=exe_path,
+        capture=StreamCapture(),
+        failure_ok=failure_ok,
+        mute=mute,
+        args_list=args_list,
+        paths=list(paths),
+        cwd=cwd,
+        timeout=timeout,
+        filters=filters,
+        triggers=_sanitize_triggers(triggers),
+        limits=limits,
+        parsers=_sanitize_parsers(parsers),
+        console_encoding=encoding,
+        storage=storage,
+        executor=executor,
+        sampler=ResourceSampler(sample_interval) if sample_interval is not None else None,
+        line_timings=LineTimings() if timestamps else None,
+        idle_timeout=idle_timeout,
+        validate=False,
+    )
+    context.validate(deep=False)
+
+    return context
+
+
+def _start_context(context: RunContext):
+    if context.mute:
+        context.result_buffer += f'{context.cmd_as_string}'
+    else:
+        _LOGGER_PROCESS.info('%s: running', context.cmd_as_string)
+
+    context.start_process()
+
+
+def _acquire(context: RunContext, weight: typing.Optional[float], priority: int, group: str) -> Ticket:
+    if weight is None:
+        weight = GOVERNOR.weight_for(context.exe_short_name)
+    return GOVERNOR.acquire(weight, priority, group)
+
+
+def _should_retry(context: RunContext, retry: typing.Optional[RetryPolicy], attempt_number: int) -> bool:
+    if retry is None:
+        return False
+    if context.attempts[-1].timed_out:
+        return retry.retry_on_timeout and attempt_number < retry.max_attempts
+    return retry.should_retry(attempt_number, context.return_code, context.process_output_chunks)
+
+
+def _monitor_with_retry(context: RunContext, retry: typing.Optional[RetryPolicy], admit: typing.Callable[[], Ticket]):
+    # a governor ticket is held while a process runs, but not while backing off between attempts
+    ticket: typing.Optional[Ticket] = admit()
+    try:
+        _start_context(context)
+        attempt_number = 1
+        delay = 0.0
+        while True:
+            error: typing.Optional[ProcessTimeoutError] = None
+            try:
+                monitor_running_process(context)
+            except ProcessTimeoutError as timeout_error:
+                error = timeout_error
+            duration = time.monotonic() - context.start_time
+            context.attempts.append(Attempt(context.return_code, duration, delay, error is not None))
+
+            if not _should_retry(context, retry, attempt_number):
+                if error is not None:
+                    raise error
+                return
+
+            delay = retry.delay(attempt_number)  # type: ignore
+            _LOGGER_PROCESS.warning('%s: attempt %s failed (%s), retrying in %.2f seconds',
+                                    context.exe_short_name, attempt_number, context.return_code, delay)
+            GOVERNOR.release(ticket)  # type: ignore
+            ticket = None
+            time.sleep(delay)
+            ticket = admit()
+            attempt_number += 1
+            context.reset_for_retry()
+            context.start_process()
+    finally:
+        if ticket is not None:
+            GOVERNOR.release(ticket)
+
+
+def _record_history(context: RunContext, history: HistoryStore):
+    history.record(
+        history_key(context.exe_path, context.args_list),
+        context.attempts[-1].duration,
+        context.sampler.peak_rss if context.sampler is not None else None,
+        context.return_code,
+    )
+
+
+def run(cmd: CommandType,
         *paths: str,
         cwd: str = '.',
         mute: bool = False,
         filters: typing.Optional[typing.Union[typing.Iterable[str], str]] = None,
         failure_ok: bool = False,
         timeout: float = _DEFAULT_PROCESS_TIMEOUT,
-        ) -> typing.Tuple[str, int]:
+        triggers: typing.Optional[typing.Union[typing.Iterable[Trigger], Trigger]] = None,
+        limits: typing.Optional[ResourceLimits] = None,
+        priority: int = 0,
+        group: str = DEFAULT_GROUP,
+        weight: typing.Optional[float] = None,
+        retry: typing.Optional[RetryPolicy] = None,
+        parsers: typing.Optional[typing.Iterable[ParserType]] = None,
+        encoding: str = 'utf8',
+        storage: str = 'list',
+        executor: typing.Optional[Executor] = None,
+        sample_interval: typing.Optional[float] = None,
+        timestamps: bool = False,
+        idle_timeout: typing.Optional[float] = None,
+        history: typing.Optional[HistoryStore] = None,
+        ) -> RunResult:
     """
     Executes a command and returns the result
 
     Args:
-        cmd: command to execute
+        cmd: command to execute, either as a string, or as a pre-split list of arguments (skips parsing)
         paths: paths to search executable in
         cwd: working directory (defaults to ".")
         mute: if true, output will not be printed
         filters: gives a list of partial strings to filter out from the output (stdout or stderr)
         failure_ok: if False (default), a return code different than 0 will exit the application
         timeout: sub-process timeout
+        triggers: output-match triggers that stop, kill or call back as soon as a line matches
+        limits: resource limits applied to the process before it executes (POSIX only; see ResourceLimits about threads)
+        priority: admission priority when the process-wide governor is saturated (lowest value first)
+        group: group of callers this run belongs to, for fair sharing in the process-wide governor
+        weight: weight of this run in the process-wide governor (defaults to the weight configured for the executable)
+        retry: retries the process on given return codes or output patterns, with exponential backoff (the
+            governor ticket is released while waiting to retry, and acquired again for the next attempt)
+        parsers: line parsers (LineParser or callables); their records are collected in the result as output streams
+        encoding: encoding of the process output, or "auto" to detect it from a BOM (falls back to the locale encoding)
+        storage: output storage: "list", "compact" (repeated lines collapsed), "zlib" or "lzma" (also compressed),
+            "indexed" (line offsets for random access into very large output, spilled to disk)
+        executor: executor spawning the process (defaults to the local one, running it through sarge)
+        sample_interval: samples CPU, memory and threads of the process (and descendants) at this interval, in seconds
+        timestamps: records the time at which each line of output is captured (see RunResult.timings)
+        idle_timeout: kills the process if it produces no output for this long, in seconds (timeout kind: "idle")
+        history: records the duration of the run (and its peak memory, with "sample_interval") in this store
 
-    Returns: command output
+    Returns: command output and return code
     """
-
-    filters = _sanitize_filters(filters)
-
-    exe_path, args_list = _parse_cmd(cmd, *paths)
-
-    context = RunContext(  # type: ignore
-        exe_path=exe_path,
-        capture=sarge.Capture(),
-        failure_ok=failure_ok,
-        mute=mute,
-        args_list=args_list,
-        paths=paths,
+    if history is not None and not isinstance(history, HistoryStore):
+        raise TypeError(f'expected a HistoryStore, got "{type(history)}"')
+    context = _build_context(
+        cmd,
+        *paths,
         cwd=cwd,
-        timeout=timeout,
+        mute=mute,
         filters=filters,
+        failure_ok=failure_ok,
+        timeout=timeout,
+        triggers=triggers,
+        limits=limits,
+        parsers=parsers,
+        encoding=encoding,
+        storage=storage,
+        executor=executor,
+        sample_interval=sample_interval,
+        timestamps=timestamps,
+        idle_timeout=idle_timeout,
     )
 
-    if mute:
-        context.result_buffer += f'{context.cmd_as_string}'
-    else:
-        _LOGGER_PROCESS.info('%s: running', context.cmd_as_string)
-
-    context.start_process()
-    monitor_running_process(context)
+    _monitor_with_retry(context, retry, functools.partial(_acquire, context, weight, priority, group))
+    if history is not None:
+        _record_history(context, history)
     check_error(context)
 
-    return context.process_output_as_str, context.return_code
+    return RunResult(context)
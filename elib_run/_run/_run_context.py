@@ -1,35 +1,160 @@
 # coding=utf-8
 """
-Dummy dataclass context for a sub-process run
+Context for a sub-process run
 """
+import logging
 import pathlib
 import time
 import typing
 
-# noinspection PyCompatibility
-import dataclasses
 import sarge
 
+from elib_run._run._decoder import StreamDecoder
+from elib_run._run._executor import Executor, LOCAL_EXECUTOR, LocalExecutor, StreamCapture
+from elib_run._run._limits import ResourceLimits
+from elib_run._run._output_storage import OutputStorage, new_output_storage, output_as_str
+from elib_run._run._parsers import LineParser
+from elib_run._run._process_logger import ProcessLogger
+from elib_run._run._recording import active_recorder
+from elib_run._run._retry import Attempt
+from elib_run._run._sampler import ResourceSampler
+from elib_run._run._shutdown import register, unregister
+from elib_run._run._timings import LineTimings
+from elib_run._run._trigger import Trigger
 
-@dataclasses.dataclass
-class RunContext:
+_LOGGER_PROCESS = logging.getLogger('elib_run.process')
+
+
+class RunContext:  # pylint: disable=too-many-instance-attributes
     """
-    Dummy dataclass context for a sub-process run
+    Context for a sub-process run
+
+    Uses __slots__ to keep high-frequency launches cheap; all fields are checked at construction, unless
+    "validate" is False (for callers that already validated their values at the public API boundary).
     """
-    exe_path: pathlib.Path
-    capture: sarge.Capture
-    failure_ok: bool
-    mute: bool
-    args_list: typing.List[str]
-    paths: typing.Optional[typing.Iterable[str]]
-    cwd: str
-    timeout: float
-    process_output_chunks: typing.List[str] = dataclasses.field(default_factory=list, repr=False)
-    result_buffer: str = dataclasses.field(default='', repr=False)
-    filters: typing.Optional[typing.Iterable[str]] = None
-    return_code: int = -1
-    start_time: float = 0
-    console_encoding: str = 'utf8'
+    __slots__ = (
+        'exe_path',
+        'capture',
+        'failure_ok',
+        'mute',
+        'args_list',
+        'paths',
+        'cwd',
+        'timeout',
+        'process_output_chunks',
+        'result_buffer',
+        'filters',
+        'return_code',
+        'start_time',
+        'console_encoding',
+        'triggers',
+        'fired_trigger',
+        'process_logger',
+        'limits',
+        'limit_hit',
+        'attempts',
+        'parsers',
+        'parsed_records',
+        'decoders',
+        'storage',
+        'executor',
+        'sampler',
+        'line_timings',
+        'idle_timeout',
+        'last_output_time',
+        '_command',
+        '_started',
+        '__weakref__',
+    )
+
+    _REPR_FIELDS = (
+        'exe_path',
+        'capture',
+        'failure_ok',
+        'mute',
+        'args_list',
+        'paths',
+        'cwd',
+        'timeout',
+        'idle_timeout',
+        'filters',
+        'return_code',
+        'start_time',
+        'console_encoding',
+        'triggers',
+        'limits',
+        'parsers',
+        'executor',
+        'sampler',
+    )
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def __init__(self,
+                 exe_path: pathlib.Path,
+                 capture: sarge.Capture,
+                 failure_ok: bool,
+                 mute: bool,
+                 args_list: typing.List[str],
+                 paths: typing.Optional[typing.Iterable[str]],
+                 cwd: str,
+                 timeout: float,
+                 process_output_chunks: typing.Optional[typing.List[str]] = None,
+                 result_buffer: str = '',
+                 filters: typing.Optional[typing.Iterable[str]] = None,
+                 return_code: int = -1,
+                 start_time: float = 0,
+                 console_encoding: str = 'utf8',
+                 triggers: typing.Optional[typing.Iterable[Trigger]] = None,
+                 fired_trigger: typing.Optional[Trigger] = None,
+                 process_logger: typing.Optional[ProcessLogger] = None,
+                 limits: typing.Optional[ResourceLimits] = None,
+                 parsers: typing.Optional[typing.List[LineParser]] = None,
+                 storage: str = 'list',
+                 executor: typing.Optional[Executor] = None,
+                 sampler: typing.Optional[ResourceSampler] = None,
+                 line_timings: typing.Optional[LineTimings] = None,
+                 idle_timeout: typing.Optional[float] = None,
+                 validate: bool = True,
+                 ) -> None:
+        self.exe_path = exe_path
+        self.capture = capture
+        self.failure_ok = failure_ok
+        self.mute = mute
+        self.args_list = args_list
+        self.paths = paths
+        self.cwd = cwd
+        self.timeout = timeout
+        self.storage = storage
+        self.process_output_chunks: OutputStorage = (
+            process_output_chunks if process_output_chunks is not None else new_output_storage(storage)
+        )
+        self.result_buffer = result_buffer
+        self.filters = filters
+        self.return_code = return_code
+        self.start_time = start_time
+        self.console_encoding = console_encoding
+        self.triggers = triggers
+        self.fired_trigger = fired_trigger
+        self.process_logger = process_logger if process_logger is not None else ProcessLogger()
+        self.limits = limits
+        self.limit_hit: typing.Optional[str] = None
+        self.attempts: typing.List[Attempt] = []
+        self.parsers = parsers
+        self.parsed_records: typing.Dict[str, typing.List[typing.Any]] = {}
+        self.decoders: typing.Dict[typing.Any, StreamDecoder] = {}
+        self.executor = executor if executor is not None else LOCAL_EXECUTOR
+        self.sampler = sampler
+        self.line_timings = line_timings
+        self.idle_timeout = idle_timeout
+        self.last_output_time = 0.0
+        self._command: typing.Any = None
+        self._started = False
+        if validate:
+            self.validate()
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._REPR_FIELDS)
+        return f'{self.__class__.__name__}({fields})'
 
     def _check_capture(self):
         if not isinstance(self.capture, sarge.Capture):
@@ -47,13 +172,14 @@ class RunContext:
         if not isinstance(self.failure_ok, bool):
             raise TypeError(f'expected a bool, got "{type(self.failure_ok)}"')
 
-    def _check_paths(self):
+    def _check_paths(self, deep: bool):
         if self.paths:
             if not isinstance(self.paths, list):
                 raise TypeError(f'expected a list, got "{type(self.paths)}"')
-            for index, path in enumerate(self.paths):
-                if not isinstance(path, str):
-                    raise TypeError(f'expected a string, got "{type(path)}" at index {index}')
+            if deep:
+                for index, path in enumerate(self.paths):
+                    if not isinstance(path, str):
+                        raise TypeError(f'expected a string, got "{type(path)}" at index {index}')
 
     def _check_cwd(self):
         if not isinstance(self.cwd, str):
@@ -63,40 +189,145 @@ class RunContext:
         if not isinstance(self.timeout, (float, int)) or isinstance(self.timeout, bool):
             raise TypeError(f'expected a float, got "{type(self.timeout)}"')
 
-    def _check_filters(self):
+    def _check_filters(self, deep: bool):
         if self.filters:
             if not isinstance(self.filters, list):
                 raise TypeError(f'expected a list, got "{type(self.filters)}"')
-            for index, filter_ in enumerate(self.filters):
-                if not isinstance(filter_, str):
-                    raise TypeError(f'expected a string, got "{type(filter_)}" at index {index}')
+            if deep:
+                for index, filter_ in enumerate(self.filters):
+                    if not isinstance(filter_, str):
+                        raise TypeError(f'expected a string, got "{type(filter_)}" at index {index}')
 
-    def _check_args_list(self):
+    def _check_args_list(self, deep: bool):
         if self.args_list:
             if not isinstance(self.args_list, list):
                 raise TypeError(f'expected a list, got "{type(self.args_list)}"')
-            for index, arg in enumerate(self.args_list):
-                if not isinstance(arg, str):
-                    raise TypeError(f'expected a string, got "{type(arg)}" at index {index}')
+            if deep:
+                for index, arg in enumerate(self.args_list):
+                    if not isinstance(arg, str):
+                        raise TypeError(f'expected a string, got "{type(arg)}" at index {index}')
+
+    def _check_triggers(self, deep: bool):
+        if self.triggers:
+            if not isinstance(self.triggers, list):
+                raise TypeError(f'expected a list, got "{type(self.triggers)}"')
+            if deep:
+                for index, trigger in enumerate(self.triggers):
+                    if not isinstance(trigger, Trigger):
+                        raise TypeError(f'expected a Trigger, got "{type(trigger)}" at index {index}')
+
+    def _check_parsers(self, deep: bool):
+        if self.parsers:
+            if not isinstance(self.parsers, list):
+                raise TypeError(f'expected a list, got "{type(self.parsers)}"')
+            if deep:
+                for index, parser in enumerate(self.parsers):
+                    if not isinstance(parser, LineParser):
+                        raise TypeError(f'expected a LineParser, got "{type(parser)}" at index {index}')
+
+    def _check_executor(self):
+        if not isinstance(self.executor, Executor):
+            raise TypeError(f'expected an Executor, got "{type(self.executor)}"')
+
+    def _check_sampler(self):
+        if self.sampler is not None and not isinstance(self.sampler, ResourceSampler):
+            raise TypeError(f'expected a ResourceSampler, got "{type(self.sampler)}"')
+
+    def _check_line_timings(self):
+        if self.line_timings is not None and not isinstance(self.line_timings, LineTimings):
+            raise TypeError(f'expected a LineTimings, got "{type(self.line_timings)}"')
+
+    def _check_idle_timeout(self):
+        if self.idle_timeout is not None:
+            if not isinstance(self.idle_timeout, (int, float)):
+                raise TypeError(f'expected a number, got "{type(self.idle_timeout)}"')
+            if self.idle_timeout <= 0:
+                raise ValueError(f'expected a positive idle timeout, got {self.idle_timeout}')
 
-    def __post_init__(self):
+    def _check_limits(self):
+        if self.limits is not None and not isinstance(self.limits, ResourceLimits):
+            raise TypeError(f'expected a ResourceLimits, got "{type(self.limits)}"')
+
+    def validate(self, deep: bool = True):
+        """
+        Checks the type of all fields
+
+        :param deep: also checks every item of the lists (arguments, paths, filters, ...)
+        :type deep: bool
+        """
         self._check_capture()
         self._check_exe_path()
         self._check_mute()
         self._check_failure_ok()
-        self._check_paths()
+        self._check_paths(deep)
         self._check_cwd()
         self._check_timeout()
-        self._check_filters()
-        self._check_args_list()
+        self._check_filters(deep)
+        self._check_args_list(deep)
+        self._check_triggers(deep)
+        self._check_limits()
+        self._check_parsers(deep)
+        self._check_executor()
+        self._check_sampler()
+        self._check_line_timings()
+        self._check_idle_timeout()
 
     def start_process(self) -> None:
         """
         Starts the process defined by this context
+
+        Within "elib_run.recording", the process is recorded, or replayed without being spawned.
+
+        The context is registered for "shutdown" until its output is collected.
         """
-        setattr(self, '_started', True)
-        self.start_time = time.monotonic()
-        self.command.run(async_=True)
+        register(self)
+        try:
+            recorder = active_recorder()
+            if recorder is not None:
+                recorder.attach(self)
+            self._started = True
+            self.start_time = time.monotonic()
+            self.last_output_time = self.start_time
+            self.command.run(async_=True)
+        except BaseException:
+            unregister(self)
+            raise
+
+    def set_process(self, command: typing.Any, capture: typing.Any) -> None:
+        """
+        Replaces the command and capture of this context before the process starts
+
+        Used by the recorder, to wrap them or to replace them with a replay.
+
+        :param command: object with the interface of sarge.Command (run, poll, wait, terminate, returncode)
+        :type command: any
+        :param capture: object with the interface of sarge.Capture (readline, threads)
+        :type capture: any
+        """
+        self._command = command
+        self.capture = capture
+
+    def reset_for_retry(self) -> None:
+        """
+        Prepares the context for another attempt at running the same command
+
+        Only the process, its capture and the per-attempt results are reset; the parsed command is kept.
+        """
+        if self._command is not None and not self.process_finished():
+            raise RuntimeError('process still running')
+        self.capture = StreamCapture()
+        self._command = None
+        self._started = False
+        self.process_output_chunks = new_output_storage(self.storage)
+        self.parsed_records = {}
+        self.decoders = {}
+        self.fired_trigger = None
+        self.limit_hit = None
+        self.return_code = -1
+        if self.sampler is not None:
+            self.sampler.reset()
+        if self.line_timings is not None:
+            self.line_timings = LineTimings()
 
     @property
     def started(self) -> bool:
@@ -104,16 +335,51 @@ class RunContext:
         :return: True if process has been started
         :rtype: bool
         """
-        return getattr(self, '_started', False)
+        return self._started
 
-    def process_timed_out(self) -> bool:
+    def process_timed_out(self) -> typing.Optional[str]:
         """
-        :return: True if the process timed out
-        :rtype: bool
+        :return: "wall" if the process ran for longer than "timeout", "idle" if it produced no output for longer
+            than "idle_timeout", None otherwise
+        :rtype: optional str
+        """
+        if not self.started:
+            raise RuntimeError('process not started')
+        now = time.monotonic()
+        if now - self.start_time > self.timeout:
+            return 'wall'
+        if self.idle_timeout is not None and now - self.last_output_time > self.idle_timeout:
+            return 'idle'
+        return None
+
+    def kill_process(self) -> None:
+        """
+        Terminates the process and waits for it to exit
         """
         if not self.started:
             raise RuntimeError('process not started')
-        return time.monotonic() - self.start_time > self.timeout
+        if not self.process_finished():
+            self.command.terminate()
+            self.command.wait()
+
+    def wait_for_output(self, timeout: float = 1.0) -> None:
+        """
+        Gives the capture threads a chance to read the end of the output after the process exited
+
+        :param timeout: maximum time to wait for each capture thread, in seconds
+        :type timeout: float
+        """
+        for thread in self.capture.threads:
+            thread.join(timeout)
+
+    def check_limit_hit(self) -> None:
+        """
+        Records which resource limit, if any, made the process fail
+        """
+        if self.limits is not None:
+            self.limit_hit = self.limits.limit_hit(self.return_code, self.process_output_as_str)
+            if self.limit_hit:
+                _LOGGER_PROCESS.warning('%s: resource limit hit: %s', self.exe_short_name, self.limit_hit)
 
     def process_finished(self) -> bool:
         """
@@ -130,7 +396,7 @@ class RunContext:
         :return: process output
         :rtype: str
         """
-        return '\n'.join(self.process_output_chunks)
+        return output_as_str(self.process_output_chunks)
 
     @property
     def exe_path_as_str(self) -> str:
@@ -161,6 +427,22 @@ class RunContext:
         cmd = self.exe_path_as_str + (' ' + ' '.join(self.args_list) if self.args_list else '')
         return f'"{cmd}" in "{self.absolute_cwd_as_str}"'
 
+    @property
+    def local_pid(self) -> typing.Optional[int]:
+        """
+        :return: PID of the process if it runs on this machine and has started, None otherwise
+        :rtype: optional int
+        """
+        process = getattr(self._command, 'process', None) if isinstance(self.executor, LocalExecutor) else None
+        return process.pid if process is not None else None
+
+    def sample_resources(self) -> None:
+        """
+        Samples the CPU and memory usage of the process, if a sampler is set and its interval has elapsed
+        """
+        if self.sampler is not None:
+            self.sampler.sample_if_due(self.local_pid, self.start_time)
+
     @property
     def exe_short_name(self) -> str:
         """
@@ -172,20 +454,13 @@ class RunContext:
         return self.exe_path.name
 
     @property
-    def command(self) -> sarge.Command:
+    def command(self) -> typing.Any:
         """
-        Returns sarge.Command instance, creating it if necessary
+        Returns the command of the process, creating it (and its capture) through the executor if necessary
 
-        :return: sarge.Command object
+        :return: sarge.Command with the default executor
         :rtype: sarge.Command
         """
-        if not hasattr(self, '_command'):
-            command = sarge.Command(
-                [self.exe_path_as_str] + self.args_list,
-                stdout=self.capture,
-                stderr=self.capture,
-                shell=False,
-                cwd=self.cwd,
-            )
-            setattr(self, '_command', command)
-        return getattr(self, '_command')
+        if self._command is None:
+            self._command, self.capture = self.executor.create_process(self)
+        return self._command
@@ -0,0 +1,196 @@
+# coding=utf-8
+"""
+Samples the CPU and memory usage of a running sub-process (and its descendants) from /proc
+"""
+import os
+import time
+import typing
+
+# noinspection PyCompatibility
+import dataclasses
+
+from elib_run._exc import ELIBRunError
+
+_PROC = '/proc'
+
+try:
+    _CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError):  # pragma: no cover
+    _CLOCK_TICKS = _PAGE_SIZE = 0
+
+
+@dataclasses.dataclass
+class ResourceSample:
+    """
+    CPU and memory usage of a sub-process and its descendants at a point in time
+
+    Attributes:
+        time: seconds since the start of the process
+        cpu_percent: CPU usage since the previous sample (100 is one core fully used)
+        rss: resident memory, in bytes
+        threads: number of threads
+        processes: number of processes (the sub-process and its descendants)
+    """
+    time: float
+    cpu_percent: float
+    rss: int
+    threads: int
+    processes: int
+
+
+class _ProcStat(typing.NamedTuple):
+    ppid: int
+    cpu_ticks: int
+    threads: int
+    rss_pages: int
+
+
+def _read_stat(pid: int) -> typing.Optional[_ProcStat]:
+    try:
+        with open(f'{_PROC}/{pid}/stat', 'rb') as stat_file:
+            content = stat_file.read()
+    except OSError:
+        return None
+    # the command name (2nd field) may contain spaces and parentheses: split after its closing parenthesis
+    fields = content[content.rindex(b')') + 2:].split()
+    return _ProcStat(
+        ppid=int(fields[1]),
+        # utime + stime + cutime + cstime: includes the descendants that already exited and were waited for
+        cpu_ticks=int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14]),
+        threads=int(fields[17]),
+        rss_pages=int(fields[21]),
+    )
+
+
+def _read_tree(pid: int, descendants: bool) -> typing.List[_ProcStat]:
+    root = _read_stat(pid)
+    if root is None:
+        return []
+    if not descendants:
+        return [root]
+    stats: typing.Dict[int, _ProcStat] = {}
+    for name in os.listdir(_PROC):
+        if name.isdigit():
+            stat = _read_stat(int(name))
+            if stat is not None:
+                stats[int(name)] = stat
+    stats[pid] = root
+    children: typing.Dict[int, typing.List[int]] = {}
+    for child_pid, stat in stats.items():
+        children.setdefault(stat.ppid, []).append(child_pid)
+    tree = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(stats[current])
+        pending.extend(children.get(current, ()))
+    return tree
+
+
+def check_sampling_supported():
+    """
+    Raises ELIBRunError if resource sampling is not supported on this platform
+    """
+    if not os.path.isdir(_PROC) or not _CLOCK_TICKS:
+        raise ELIBRunError('resource sampling requires /proc, which is not available on this platform')
+
+
+class ResourceSampler:
+    """
+    Samples the CPU usage, resident memory and thread count of a running sub-process at a fixed interval
+
+    Reads /proc/<pid>/stat, which holds all three; with "descendants", every process is read once per sample to
+    find the children of the sub-process (so keep the interval reasonable for hosts running thousands of processes).
+    """
+
+    def __init__(self, interval: float = 1.0, descendants: bool = True) -> None:
+        if not isinstance(interval, (int, float)):
+            raise TypeError(f'expected a number, got "{type(interval)}"')
+        if interval <= 0:
+            raise ValueError(f'expected a positive interval, got {interval!r}')
+        check_sampling_supported()
+        self.interval = interval
+        self.descendants = descendants
+        self.samples: typing.List[ResourceSample] = []
+        self._last_time: typing.Optional[float] = None
+        self._last_ticks = 0
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(interval={self.interval!r}, samples={len(self.samples)})'
+
+    def reset(self):
+        """
+        Forgets all samples (for a new attempt at running the process)
+        """
+        self.samples = []
+        self._last_time = None
+        self._last_ticks = 0
+
+    def sample(self, pid: int, start_time: float,
+               now: typing.Optional[float] = None) -> typing.Optional[ResourceSample]:
+        """
+        Takes a sample
+
+        :param pid: PID of the sub-process
+        :type pid: int
+        :param start_time: start time of the sub-process (time.monotonic)
+        :type start_time: float
+        :param now: current time (time.monotonic)
+        :type now: optional float
+        :return: the sample, or None if the process is gone
+        :rtype: optional ResourceSample
+        """
+        now = time.monotonic() if now is None else now
+        tree = _read_tree(pid, self.descendants)
+        if not tree:
+            return None
+        ticks = sum(stat.cpu_ticks for stat in tree)
+        elapsed = now - (start_time if self._last_time is None else self._last_time)
+        cpu_percent = 0.0
+        if elapsed > 0:
+            cpu_percent = 100 * (ticks - self._last_ticks) / _CLOCK_TICKS / elapsed
+        self._last_time = now
+        self._last_ticks = ticks
+        sample = ResourceSample(
+            time=now - start_time,
+            cpu_percent=max(cpu_percent, 0.0),
+            rss=sum(stat.rss_pages for stat in tree) * _PAGE_SIZE,
+            threads=sum(stat.threads for stat in tree),
+            processes=len(tree),
+        )
+        self.samples.append(sample)
+        return sample
+
+    def sample_if_due(self, pid: typing.Optional[int], start_time: float):
+        """
+        Takes a sample if the interval has elapsed since the previous one
+
+        :param pid: PID of the sub-process, or None if it is not a local process
+        :type pid: optional int
+        :param start_time: start time of the sub-process (time.monotonic)
+        :type start_time: float
+        """
+        if pid is None:
+            return
+        now = time.monotonic()
+        if now - (start_time if self._last_time is None else self._last_time) >= self.interval:
+            self.sample(pid, start_time, now)
+
+    @property
+    def peak_rss(self) -> int:
+        """
+        :return: highest resident memory sampled, in bytes
+        :rtype: int
+        """
+        return max((sample.rss for sample in self.samples), default=0)
+
+    @property
+    def mean_cpu_percent(self) -> float:
+        """
+        :return: average CPU usage over the samples
+        :rtype: float
+        """
+        if not self.samples:
+            return 0.0
+        return sum(sample.cpu_percent for sample in self.samples) / len(self.samples)
@@ -0,0 +1,188 @@
+# coding=utf-8
+"""
+Runs a batch of commands longest first, using the durations and peak memory of their past runs
+"""
+import concurrent.futures
+import logging
+import os
+import typing
+
+# noinspection PyCompatibility
+import dataclasses
+
+from elib_run._exc import ELIBRunError
+from elib_run._run._history import HistoryStore, JobStats, history_key
+from elib_run._run._result import RunResult
+from elib_run._run._run import CommandType, _parse_cmd, run
+from elib_run._run._sampler import check_sampling_supported
+
+_LOGGER = logging.getLogger('elib_run')
+
+
+@dataclasses.dataclass
+class BatchJob:
+    """
+    Command of a batch
+
+    Attributes:
+        index: position of the job in the batch
+        argv: resolved executable and arguments
+        key: key of the command in the history store
+        options: keyword arguments for "run"
+        stats: statistics of its past runs, if any
+        result: result of the run, once done
+        error: exception raised by the run, if any
+    """
+    index: int
+    argv: typing.List[typing.Any]
+    key: str
+    options: typing.Dict[str, typing.Any]
+    stats: typing.Optional[JobStats] = None
+    result: typing.Optional[RunResult] = None
+    error: typing.Optional[Exception] = None
+
+    @property
+    def expected_duration(self) -> typing.Optional[float]:
+        """
+        :return: mean duration of its past runs, in seconds, or None if it never ran
+        :rtype: optional float
+        """
+        return self.stats.duration if self.stats is not None else None
+
+    @property
+    def expected_rss(self) -> int:
+        """
+        :return: peak memory of its past runs, in bytes (0 if unknown)
+        :rtype: int
+        """
+        if self.stats is None or self.stats.peak_rss is None:
+            return 0
+        return self.stats.peak_rss
+
+
+class BatchScheduler:
+    """
+    Runs a batch of commands in parallel, longest first
+
+    Starting the longest jobs first keeps a few long jobs started last from dominating the total time of the batch.
+
+    - jobs are ordered by the mean duration of their recent runs, read from "history", longest first; jobs that
+      never ran go first, since they could be the longest
+    - with a "memory_budget", a job only starts if the peak memory of the running jobs, plus its own, fits in the
+      budget (or if nothing else is running); the longest job that fits is picked
+    - every run is recorded in "history", with its peak memory if sampling is supported on this platform
+
+    Commands run through "run", with "failure_ok" forced to True.
+    """
+
+    def __init__(self,
+                 history: HistoryStore,
+                 jobs: typing.Optional[int] = None,
+                 memory_budget: typing.Optional[int] = None,
+                 sample_interval: typing.Optional[float] = 0.5,
+                 ) -> None:
+        if not isinstance(history, HistoryStore):
+            raise TypeError(f'expected a HistoryStore, got "{type(history)}"')
+        self.history = history
+        self.jobs = jobs or os.cpu_count() or 1
+        self.memory_budget = memory_budget
+        if sample_interval is not None:
+            try:
+                check_sampling_supported()
+            except ELIBRunError:
+                sample_interval = None
+        self.sample_interval = sample_interval
+        self.batch: typing.List[BatchJob] = []
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({len(self.batch)} jobs, jobs={self.jobs})'
+
+    def add(self, cmd: CommandType, *paths: str, **options: typing.Any) -> BatchJob:
+        """
+        Adds a command to the batch
+
+        :param cmd: command, as given to "run"
+        :type cmd: str, pathlib.Path or list
+        :param paths: paths to search the executable in
+        :type paths: str
+        :param options: keyword arguments for "run"
+        :return: the job
+        :rtype: BatchJob
+        """
+        exe_path, args_list = _parse_cmd(cmd, *paths)
+        key = history_key(exe_path, args_list)
+        job = BatchJob(len(self.batch), [exe_path] + args_list, key, options, self.history.stats(key))
+        self.batch.append(job)
+        return job
+
+    def order(self) -> typing.List[BatchJob]:
+        """
+        :return: jobs in the order they are started (without a memory budget)
+        :rtype: list of BatchJob
+        """
+        return sorted(
+            self.batch,
+            key=lambda job: (job.expected_duration is not None, -(job.expected_duration or 0), job.index),
+        )
+
+    def next_job(self, pending: typing.List[BatchJob], memory_in_use: int, running: int) -> typing.Optional[BatchJob]:
+        """
+        Picks the next job to start
+
+        :param pending: jobs not started yet, in the order of "order"
+        :type pending: list of BatchJob
+        :param memory_in_use: expected peak memory of the running jobs, in bytes
+        :type memory_in_use: int
+        :param running: number of running jobs
+        :type running: int
+        :return: job to start, or None if none fits
+        :rtype: optional BatchJob
+        """
+        if running >= self.jobs:
+            return None
+        for job in pending:
+            if self.memory_budget is None or not running or memory_in_use + job.expected_rss <= self.memory_budget:
+                return job
+        return None
+
+    def _run_job(self, job: BatchJob) -> BatchJob:
+        options = dict(job.options, failure_ok=True, history=self.history)
+        if self.sample_interval is not None:
+            options.setdefault('sample_interval', self.sample_interval)
+        try:
+            job.result = run(job.argv, **options)
+        except ELIBRunError as error:
+            _LOGGER.error('%s: %s', job.argv[0], error)
+            job.error = error
+        return job
+
+    def run(self) -> typing.List[BatchJob]:
+        """
+        Runs all the jobs
+
+        A job that fails, for any reason, has its exception in "error", and no result.
+
+        :return: jobs, in the order they were added, with their result
+        :rtype: list of BatchJob
+        """
+        pending = self.order()
+        memory_in_use = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            running: typing.Dict[concurrent.futures.Future, BatchJob] = {}
+            while pending or running:
+                job = self.next_job(pending, memory_in_use, len(running))
+                while job is not None:
+                    pending.remove(job)
+                    memory_in_use += job.expected_rss
+                    running[pool.submit(self._run_job, job)] = job
+                    job = self.next_job(pending, memory_in_use, len(running))
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    memory_in_use -= job.expected_rss
+                    error = future.exception()
+                    if error is not None:
+                        # not a run failure: wrong options, or a bug; recorded like one, for the rest of the batch
+                        _LOGGER.error('%s: %r', job.argv[0], error)
+                        job.error = error
+        return list(self.batch)
@@ -0,0 +1,203 @@
+# coding=utf-8
+"""
+Runs a command over a long list of arguments, split in shards run in parallel (like "xargs -P")
+"""
+import concurrent.futures
+import logging
+import math
+import os
+import sys
+import typing
+
+from elib_run._run._result import RunResult
+from elib_run._run._run import CommandType, _parse_cmd, run
+
+_LOGGER_PROCESS = logging.getLogger('elib_run.process')
+
+# Used when the system does not tell: the smallest limit of the platforms we run on
+_DEFAULT_ARG_MAX = 128 * 1024
+# CreateProcess limit, in characters, for the whole command line
+_WINDOWS_ARG_MAX = 32767
+# Like xargs: leave room for whatever the system adds to the argument block
+_HEADROOM = 2048
+# Linux refuses any single argument longer than this (MAX_ARG_STRLEN)
+_MAX_ARG_STRLEN = 128 * 1024
+
+
+def argument_size(arg: str) -> int:
+    """
+    :param arg: command-line argument
+    :type arg: str
+    :return: space the argument takes in the command line
+    :rtype: int
+    """
+    if sys.platform == 'win32':
+        # separating space, and quotes
+        return len(arg) + 3
+    # NUL-terminated string, and a pointer in argv
+    return len(os.fsencode(arg)) + 1 + 8
+
+
+def argument_limit() -> int:
+    """
+    :return: space available for the command line of a new process
+    :rtype: int
+    """
+    if sys.platform == 'win32':
+        return _WINDOWS_ARG_MAX - _HEADROOM
+    try:
+        arg_max = os.sysconf('SC_ARG_MAX')
+    except (AttributeError, ValueError, OSError):  # pragma: no cover
+        arg_max = _DEFAULT_ARG_MAX
+    if arg_max <= 0:  # pragma: no cover
+        arg_max = _DEFAULT_ARG_MAX
+    # the environment shares the same space
+    environment = sum(argument_size(f'{key}={value}') for key, value in os.environ.items())
+    return arg_max - environment - _HEADROOM
+
+
+def split_arguments(args: typing.Sequence[str],
+                    shards: int,
+                    limit: int,
+                    base_size: int = 0,
+                    ) -> typing.List[typing.List[str]]:
+    """
+    Splits arguments in at least "shards" shards of about the same length, each fitting in "limit"
+
+    :param args: arguments to split
+    :type args: sequence of str
+    :param shards: target number of shards; more are made if the arguments do not fit in that many
+    :type shards: int
+    :param limit: space available for the command line
+    :type limit: int
+    :param base_size: space taken by the executable and the arguments common to all shards
+    :type base_size: int
+    :return: shards, in the order of the arguments
+    :rtype: list of lists of str
+    """
+    if not args:
+        return []
+    per_shard = math.ceil(len(args) / shards)
+    result: typing.List[typing.List[str]] = [[]]
+    size = base_size
+    for arg in args:
+        arg_size = argument_size(arg)
+        if base_size + arg_size > limit or (sys.platform != 'win32' and len(os.fsencode(arg)) >= _MAX_ARG_STRLEN):
+            raise ValueError(f'argument too long for a command line: {arg[:50]}...')
+        if result[-1] and (len(result[-1]) >= per_shard or size + arg_size > limit):
+            result.append([])
+            size = base_size
+        result[-1].append(arg)
+        size += arg_size
+    return result
+
+
+class ShardedResult(tuple):
+    """
+    Merged result of the shards of a sharded run
+
+    Behaves like the "(output, return_code)" tuple returned by "run": the output of the shards is joined in the
+    order of the arguments, and the return code is the first non-zero return code in that order (0 if all shards
+    succeeded). The result of every shard is kept in "results".
+    """
+
+    shards: typing.List[typing.List[str]]
+    results: typing.List[RunResult]
+
+    def __new__(cls, shards: typing.List[typing.List[str]], results: typing.List[RunResult]) -> 'ShardedResult':
+        output = '\n'.join(result.output for result in results if result.output)
+        return_code = next((result.return_code for result in results if result.return_code != 0), 0)
+        result = super(ShardedResult, cls).__new__(cls, (output, return_code))
+        result.shards = shards
+        result.results = results
+        return result
+
+    @property
+    def output(self) -> str:
+        """
+        :return: output of all shards
+        :rtype: str
+        """
+        return typing.cast(str, self[0])
+
+    @property
+    def return_code(self) -> int:
+        """
+        :return: first non-zero return code of the shards, or 0
+        :rtype: int
+        """
+        return typing.cast(int, self[1])
+
+    @property
+    def failed(self) -> typing.List[int]:
+        """
+        :return: indices of the shards that failed
+        :rtype: list of int
+        """
+        return [index for index, result in enumerate(self.results) if result.return_code != 0]
+
+
+def run_sharded(cmd: CommandType,
+                args: typing.Iterable[str],
+                *paths: str,
+                jobs: typing.Optional[int] = None,
+                shards: typing.Optional[int] = None,
+                max_arg_size: typing.Optional[int] = None,
+                failure_ok: bool = False,
+                **options: typing.Any,
+                ) -> ShardedResult:
+    """
+    Runs a command over a long list of arguments, appended to it in shards that run in parallel
+
+    The executable is looked up once. Arguments are split in "shards" shards of about the same length, and in more
+    if they do not fit in the command-line size limit of the system; the shards then run "jobs" at a time (and
+    through the process-wide governor, like any other run).
+
+    :param cmd: command, as given to "run"; the arguments are appended to it
+    :type cmd: str, pathlib.Path or list
+    :param args: arguments to split between the shards
+    :type args: iterable of str
+    :param paths: paths to search the executable in
+    :type paths: str
+    :param jobs: maximum number of shards running at once (defaults to the number of CPUs)
+    :type jobs: optional int
+    :param shards: target number of shards (defaults to "jobs")
+    :type shards: optional int
+    :param max_arg_size: space available for the command line (defaults to the system limit)
+    :type max_arg_size: optional int
+    :param failure_ok: if False (default), a failed shard exits the application, once all shards are done
+    :type failure_ok: bool
+    :param options: keyword arguments for "run"
+    :return: merged output and return code
+    :rtype: ShardedResult
+    """
+    args = list(args)
+    for index, arg in enumerate(args):
+        if not isinstance(arg, str):
+            raise TypeError(f'expected a string, got "{type(arg)}" at index {index}')
+    jobs = jobs or os.cpu_count() or 1
+    shards = shards or jobs
+    for value in (jobs, shards):
+        if not isinstance(value, int):
+            raise TypeError(f'expected an int, got "{type(value)}"')
+        if value < 1:
+            raise ValueError(f'expected a positive number, got {value}')
+
+    exe_path, base_args = _parse_cmd(cmd, *paths)
+    base_size = sum(argument_size(arg) for arg in [str(exe_path)] + base_args)
+    limit = max_arg_size if max_arg_size is not None else argument_limit()
+    arg_shards = split_arguments(args, shards, limit, base_size)
+    _LOGGER_PROCESS.debug('%s: %s arguments in %s shards', exe_path.name, len(args), len(arg_shards))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(run, [exe_path] + base_args + shard, *paths, failure_ok=True, **options)
+            for shard in arg_shards
+        ]
+        results = [future.result() for future in futures]
+
+    result = ShardedResult(arg_shards, results)
+    if result.return_code != 0 and not failure_ok:
+        _LOGGER_PROCESS.error('%s: %s of %s shards failed', exe_path.name, len(result.failed), len(arg_shards))
+        sys.exit(result.return_code)
+    return result
@@ -0,0 +1,208 @@
+# coding=utf-8
+"""
+Process-wide registry of the running sub-processes, to shut them all down in bounded time
+"""
+import logging
+import os
+import signal
+import threading
+import time
+import typing
+import weakref
+
+from elib_run._exc import ShutdownError
+
+_LOGGER = logging.getLogger('elib_run')
+
+_POLL_INTERVAL = 0.01
+# time given to the monitors to collect the output of the processes once they exited
+_FLUSH_TIMEOUT = 1.0
+
+_ACTIVE: 'weakref.WeakSet' = weakref.WeakSet()
+# processes still running once their run is over (left by a "stop" trigger): kept until they exit
+_DETACHED: typing.Set[typing.Any] = set()
+_CONDITION = threading.Condition()
+_SHUTTING_DOWN = threading.Event()
+_PREVIOUS_HANDLERS: typing.Dict[int, typing.Any] = {}
+
+
+def register(context) -> None:
+    """
+    Adds a run context to the registry, right before its process starts
+
+    :param context: run context
+    :type context: RunContext
+    :raises ShutdownError: if "shutdown" was called
+    """
+    _detached_runs()
+    with _CONDITION:
+        if _SHUTTING_DOWN.is_set():
+            raise ShutdownError(f'{context.exe_short_name}: not started, shutting down')
+        _ACTIVE.add(context)
+
+
+def unregister(context) -> None:
+    """
+    Removes a run context from the registry, once its output has been collected
+
+    :param context: run context
+    :type context: RunContext
+    """
+    with _CONDITION:
+        _ACTIVE.discard(context)
+        _CONDITION.notify_all()
+
+
+def detach(context) -> None:
+    """
+    Removes a run context from the registry, but keeps it until its process exits, so that "shutdown" still
+    stops the process; used when a "stop" trigger leaves the process running
+
+    :param context: run context
+    :type context: RunContext
+    """
+    _detached_runs()
+    with _CONDITION:
+        _ACTIVE.discard(context)
+        _DETACHED.add(context)
+        _CONDITION.notify_all()
+
+
+def _detached_runs() -> list:
+    # prunes the detached contexts whose process exited, so that they (and their output) are not kept forever
+    with _CONDITION:
+        detached = list(_DETACHED)
+    running = _running(detached)
+    with _CONDITION:
+        _DETACHED.intersection_update(running)
+    return running
+
+
+def active_runs() -> list:
+    """
+    :return: contexts of the runs being monitored, and of the processes left running by "stop" triggers
+    :rtype: list of RunContext
+    """
+    detached = _detached_runs()
+    with _CONDITION:
+        return list(_ACTIVE) + [context for context in detached if context not in _ACTIVE]
+
+
+def is_shutting_down() -> bool:
+    """
+    :return: True if "shutdown" was called (new runs are refused)
+    :rtype: bool
+    """
+    return _SHUTTING_DOWN.is_set()
+
+
+def reset_shutdown() -> None:
+    """
+    Accepts new runs again after a shutdown
+    """
+    _SHUTTING_DOWN.clear()
+
+
+def _running(contexts: list) -> list:
+    running = []
+    for context in contexts:
+        try:
+            if context.started and not context.process_finished():
+                running.append(context)
+        except Exception:  # pylint: disable=broad-except
+            # the process is gone, or its executor cannot be reached anymore
+            pass
+    return running
+
+
+def _signal_processes(contexts: list, kill: bool):
+    for context in contexts:
+        try:
+            if kill:
+                context.command.kill()
+            else:
+                context.command.terminate()
+        except (OSError, AttributeError) as error:
+            _LOGGER.debug('%s: %s', context.exe_short_name, error)
+
+
+def shutdown(grace: float = 10.0, terminate: bool = True) -> int:
+    """
+    Stops all runs in bounded time
+
+    New runs are refused (ShutdownError). Running processes are asked to terminate (unless "terminate" is False,
+    in which case they are left to finish), and the ones still running after "grace" seconds are killed. The runs
+    then complete like processes that exited on their own, with all the output they produced. Processes left
+    running by "stop" triggers are stopped the same way.
+
+    :param grace: time given to the processes to exit, in seconds
+    :type grace: float
+    :param terminate: if True (default), ask the processes to terminate right away; otherwise let them finish
+    :type terminate: bool
+    :return: number of processes killed after the grace period
+    :rtype: int
+    """
+    if not isinstance(grace, (int, float)):
+        raise TypeError(f'expected a number, got "{type(grace)}"')
+    if grace < 0:
+        raise ValueError(f'expected a positive grace period, got {grace}')
+    _SHUTTING_DOWN.set()
+    running = _running(active_runs())
+    _LOGGER.info('shutting down: %s processes running', len(running))
+    if terminate:
+        _signal_processes(running, kill=False)
+
+    deadline = time.monotonic() + grace
+    while running and time.monotonic() < deadline:
+        time.sleep(_POLL_INTERVAL)
+        running = _running(running)
+
+    if running:
+        _LOGGER.warning('shutting down: killing %s processes', len(running))
+        _signal_processes(running, kill=True)
+
+    deadline = time.monotonic() + _FLUSH_TIMEOUT
+    with _CONDITION:
+        while _ACTIVE and _CONDITION.wait(max(deadline - time.monotonic(), 0)):
+            pass
+    return len(running)
+
+
+def _shutdown_and_resend(signum: int, grace: float):
+    shutdown(grace)
+    # let the previous handler (or the default action) deal with the signal, now that the children are gone
+    os.kill(os.getpid(), signum)
+
+
+def install_signal_handlers(grace: float = 10.0, signals: typing.Optional[typing.Iterable[int]] = None) -> None:
+    """
+    Shuts down all runs when the process receives a signal, then lets the signal through
+
+    On the first signal, the previous handlers are restored and the shutdown runs in a background thread; once it
+    is done, the signal is sent again, so that the process ends like it would have without the handlers. A second
+    signal during the shutdown goes straight to the previous handlers. Must be called from the main thread.
+
+    :param grace: time given to the processes to exit, in seconds
+    :type grace: float
+    :param signals: signals to handle (defaults to SIGTERM and SIGINT)
+    :type signals: optional iterable of int
+    """
+    if signals is None:
+        signals = (signal.SIGTERM, signal.SIGINT)
+
+    def _handler(signum, _):
+        uninstall_signal_handlers()
+        threading.Thread(target=_shutdown_and_resend, args=(signum, grace), daemon=True).start()
+
+    for signum in signals:
+        previous = signal.signal(signum, _handler)
+        _PREVIOUS_HANDLERS.setdefault(signum, previous)
+
+
+def uninstall_signal_handlers() -> None:
+    """
+    Restores the signal handlers replaced by "install_signal_handlers"
+    """
+    for signum, previous in list(_PREVIOUS_HANDLERS.items()):
+        signal.signal(signum, previous if previous is not None else signal.SIG_DFL)
+        del _PREVIOUS_HANDLERS[signum]
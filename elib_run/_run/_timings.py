@@ -0,0 +1,105 @@
+# coding=utf-8
+"""
+Timestamps of the captured lines of output, and helpers to find where a process went silent
+"""
+import array
+import bisect
+import typing
+
+# Upper edges of the default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0, float('inf'))
+
+
+class Silence(typing.NamedTuple):
+    """
+    Period without output
+
+    Attributes:
+        line: index of the line that ended the silence
+        start: time of the previous line (or of the process start), in seconds since the process started
+        duration: length of the silence, in seconds
+    """
+    line: int
+    start: float
+    duration: float
+
+
+class LineTimings:
+    """
+    Time at which each line of output was captured, in seconds since the process started
+
+    Stored in a flat array of doubles (8 bytes per line); index "i" is the time of the "i"-th line of the output.
+    """
+
+    def __init__(self) -> None:
+        self.times = array.array('d')
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({len(self.times)} lines)'
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __getitem__(self, index: int) -> float:
+        return self.times[index]
+
+    def append(self, line_time: float):
+        """
+        Records the time of a line
+
+        :param line_time: seconds since the process started
+        :type line_time: float
+        """
+        self.times.append(line_time)
+
+    def gaps(self) -> array.array:
+        """
+        :return: time elapsed before each line, since the previous one (or since the process started)
+        :rtype: array of float
+        """
+        gaps = array.array('d', self.times)
+        for index in range(len(gaps) - 1, 0, -1):
+            gaps[index] -= gaps[index - 1]
+        return gaps
+
+    def longest_silences(self, count: int = 5) -> typing.List[Silence]:
+        """
+        :param count: number of silences to return
+        :type count: int
+        :return: longest periods without output, longest first
+        :rtype: list of Silence
+        """
+        gaps = self.gaps()
+        longest = sorted(range(len(gaps)), key=gaps.__getitem__, reverse=True)[:count]
+        return [
+            Silence(line=index, start=self.times[index] - gaps[index], duration=gaps[index])
+            for index in longest
+        ]
+
+    def histogram(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS) -> typing.List[typing.Tuple[float, int]]:
+        """
+        Counts the time between lines, by bucket
+
+        :param buckets: upper edges of the buckets, in seconds and in increasing order; gaps larger than the last
+            edge are not counted
+        :type buckets: sequence of float
+        :return: upper edge and number of gaps of every bucket
+        :rtype: list of tuple of float, int
+        """
+        counts = [0] * len(buckets)
+        for gap in self.gaps():
+            index = bisect.bisect_left(buckets, gap)
+            if index < len(counts):
+                counts[index] += 1
+        return list(zip(buckets, counts))
+
+    def lines_between(self, start: float, end: float) -> range:
+        """
+        :param start: seconds since the process started
+        :type start: float
+        :param end: seconds since the process started
+        :type end: float
+        :return: indices of the lines captured between "start" (included) and "end" (excluded)
+        :rtype: range
+        """
+        return range(bisect.bisect_left(self.times, start), bisect.bisect_left(self.times, end))
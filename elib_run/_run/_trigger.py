@@ -0,0 +1,48 @@
+# coding=utf-8
+"""
+Output-match triggers that act on a running sub-process as soon as a line matches
+"""
+import typing
+
+# noinspection PyCompatibility
+import dataclasses
+
+from elib_run._run._patterns import compile_pattern
+
+TRIGGER_ACTIONS = ('stop', 'kill', 'callback')
+
+
+@dataclasses.dataclass
+class Trigger:
+    """
+    Acts on a running sub-process when a line of its output matches "pattern"
+
+    Patterns are matched at the beginning of the line, like filters.
+
+    Actions:
+
+        - "stop": stop monitoring and return, leaving the process running (e.g. a server that printed "ready");
+          the output it produces afterwards is discarded
+        - "kill": kill the process and return
+        - "callback": call "callback" with the matching line, and keep monitoring
+    """
+    pattern: str
+    action: str = 'stop'
+    callback: typing.Optional[typing.Callable[[str], None]] = None
+
+    def __post_init__(self):
+        if not isinstance(self.pattern, str):
+            raise TypeError(f'expected a string, got "{type(self.pattern)}"')
+        if self.action not in TRIGGER_ACTIONS:
+            raise ValueError(f'unknown action "{self.action}", expected one of: {", ".join(TRIGGER_ACTIONS)}')
+        if self.action == 'callback' and not callable(self.callback):
+            raise TypeError(f'expected a callable, got "{type(self.callback)}"')
+
+    def matches(self, line: str) -> bool:
+        """
+        :param line: line of output
+        :type line: str
+        :return: True if the line matches this trigger
+        :rtype: bool
+        """
+        return compile_pattern(self.pattern).match(line) is not None
@@ -69,6 +69,11 @@ setup(
         'elib_run': 'test'
     },
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'elib-run = elib_run._cli:main',
+        ],
+    },
     install_requires=requirements,
     tests_require=test_requirements,
     use_scm_version=True,
@@ -7,6 +7,11 @@ from pathlib import Path
 import pytest
 from mockito import unstub
 
+# noinspection PyProtectedMember
+from elib_run._run._executor import StreamCapture
+# noinspection PyProtectedMember
+from elib_run._run._run_context import RunContext
+
 
 def pytest_configure(config):
     """
@@ -63,3 +68,25 @@ def _clean_os_env():
     for key in os.environ.keys():
         if key not in env.keys():
             del os.environ[key]
+
+
+@pytest.fixture
+def python_context():
+    """
+    Builds run contexts executing Python code, muted, failures allowed
+    """
+
+    def _python_context(code: str, timeout: float = 10.0, **kwargs) -> RunContext:
+        return RunContext(  # type: ignore
+            exe_path=Path(sys.executable),
+            capture=StreamCapture(),
+            failure_ok=True,
+            mute=True,
+            args_list=['-c', code],
+            paths=None,
+            cwd='.',
+            timeout=timeout,
+            **kwargs,
+        )
+
+    return _python_context
@@ -1,13 +1,20 @@
 # coding=utf-8
 
+import pathlib
 import string
+import sys
 
 import pytest
 from hypothesis import given, strategies as st
 from mockito import mock, verify, verifyNoUnwantedInteractions, verifyStubbedInvocationsAreUsed, when
 
+from elib_run import run
 # noinspection PyProtectedMember
 from elib_run._run import _capture_output
+from elib_run._run._executor import StreamCapture
+from elib_run._run._parsers import JsonLinesParser, RegexParser
+from elib_run._run._process_logger import ProcessLogger
+from elib_run._run._trigger import Trigger
 
 
 @given(text=st.text(alphabet=string.printable))
@@ -32,20 +39,6 @@ def test_filter_line(text, filters, expected_return):
     assert expected_return == _capture_output.filter_line(text, context)
 
 
-def test_decode_and_filter():
-    line_bytes = 'random string'.encode('utf8')
-    context = mock({'filters': None, 'console_encoding': 'cp437'})
-    result = _capture_output.decode_and_filter(line_bytes, context)
-    assert 'random string' == result
-
-
-def test_decode_and_filter_filtered():
-    line_bytes = 'random string'.encode('utf8')
-    context = mock({'filters': ['random.*'], 'console_encoding': 'cp437'})
-    result = _capture_output.decode_and_filter(line_bytes, context)
-    assert result is None
-
-
 def _dummy_context():
     return mock(
         {
@@ -55,6 +48,13 @@ def _dummy_context():
             'process_output_chunks': [],
             'console_encoding': 'utf8',
             'process_logger': mock(),
+            'triggers': None,
+            'fired_trigger': None,
+            'exe_short_name': 'dummy.exe',
+            'parsers': None,
+            'parsed_records': {},
+            'decoders': {},
+            'line_timings': None,
         }
     )
 
@@ -62,7 +62,8 @@ def _dummy_context():
 def test_capture_simple(caplog):
     caplog.set_level(10, 'elib_run.process')
     context = _dummy_context()
-    when(context.capture).readline(block=False).thenReturn(b'random string').thenReturn(None)
+    context.process_logger = ProcessLogger()
+    when(context.capture).readline(block=False).thenReturn(b'random string\n').thenReturn(None)
     _capture_output.capture_output_from_running_process(context)
     verifyNoUnwantedInteractions()
     verifyStubbedInvocationsAreUsed()
@@ -73,10 +74,10 @@ def test_capture_simple(caplog):
 def test_capture_filtered():
     context = _dummy_context()
     context.filters = ['random.*']
-    when(context.capture).readline(block=False).thenReturn(b'random string').thenReturn(None)
-    when(context.process_logger).debug(...)
+    when(context.capture).readline(block=False).thenReturn(b'random string\n').thenReturn(None)
+    when(context.process_logger).log_line(...)
     _capture_output.capture_output_from_running_process(context)
-    verify(context.process_logger, times=0).debug(...)
+    verify(context.process_logger, times=0).log_line(...)
     verifyNoUnwantedInteractions()
     verifyStubbedInvocationsAreUsed()
     assert [] == context.process_output_chunks
@@ -85,18 +86,110 @@ def test_capture_filtered():
 def test_capture_muted():
     context = _dummy_context()
     context.mute = True
-    when(context.capture).readline(block=False).thenReturn(b'random string').thenReturn(None)
-    when(context.process_logger).debug(...)
+    when(context.capture).readline(block=False).thenReturn(b'random string\n').thenReturn(None)
+    when(context.process_logger).log_line(...)
     _capture_output.capture_output_from_running_process(context)
-    verify(context.process_logger, times=0).debug(...)
+    verify(context.process_logger, times=0).log_line(...)
     verifyNoUnwantedInteractions()
     verifyStubbedInvocationsAreUsed()
     assert ['random string'] == context.process_output_chunks
 
 
-def test_capture_error():
+def test_capture_trigger_stop():
+    context = _dummy_context()
+    trigger = Trigger('ready')
+    context.triggers = [trigger]
+    when(context.capture).readline(block=False).thenReturn(b'starting\n').thenReturn(b'ready\n').thenReturn(b'extra\n')
+    _capture_output.capture_output_from_running_process(context)
+    assert ['starting', 'ready'] == context.process_output_chunks
+    assert context.fired_trigger is trigger
+
+
+def test_capture_trigger_callback():
+    context = _dummy_context()
+    matched = []
+    context.triggers = [Trigger('.*warning', action='callback', callback=matched.append)]
+    when(context.capture).readline(block=False).thenReturn(b'some warning\n').thenReturn(b'other\n').thenReturn(None)
+    _capture_output.capture_output_from_running_process(context)
+    assert ['some warning', 'other'] == context.process_output_chunks
+    assert ['some warning'] == matched
+    assert context.fired_trigger is None
+
+
+def test_capture_trigger_filtered_line():
+    context = _dummy_context()
+    context.filters = ['ready']
+    context.triggers = [Trigger('ready')]
+    when(context.capture).readline(block=False).thenReturn(b'ready\n').thenReturn(None)
+    _capture_output.capture_output_from_running_process(context)
+    assert context.fired_trigger is None
+
+
+def test_capture_many_lines():
+    context = _dummy_context()
+    context.mute = True
+    lines = [f'line {index}\n'.encode('utf8') for index in range(5000)]
+    when(context.capture).readline(block=False).thenReturn(*lines).thenReturn(None)
+    _capture_output.capture_output_from_running_process(context)
+    assert 5000 == len(context.process_output_chunks)
+
+
+def test_capture_parsers():
     context = _dummy_context()
-    test_str = '"éà$ùµ'
-    in_bytes = test_str.encode('utf16')
-    output = _capture_output.decode_and_filter(in_bytes, context)
-    assert output != test_str
+    context.filters = ['{']
+    context.parsers = [RegexParser(r'(?P<file>\w+\.c):(?P<line>\d+): error', name='errors'), JsonLinesParser()]
+    when(context.capture).readline(block=False) \
+        .thenReturn(b'main.c:12: error: oops\n') \
+        .thenReturn(b'{"tests": 3}\n') \
+        .thenReturn(b'other line\n') \
+        .thenReturn(None)
+    _capture_output.capture_output_from_running_process(context)
+    assert ['main.c:12: error: oops', 'other line'] == context.process_output_chunks
+    assert {'errors': [{'file': 'main.c', 'line': '12'}], 'json': [{'tests': 3}]} == context.parsed_records
+
+
+def test_capture_split_multibyte_and_partial_line():
+    context = _dummy_context()
+    data = 'première ligne\nseconde ligne'.encode('utf8')
+    split = data.index('è'.encode('utf8')) + 1
+    when(context.capture).readline(block=False).thenReturn(data[:split]).thenReturn(data[split:]).thenReturn(None)
+    _capture_output.capture_output_from_running_process(context)
+    assert ['première ligne'] == context.process_output_chunks
+    _capture_output.flush_captured_output(context)
+    assert ['première ligne', 'seconde ligne'] == context.process_output_chunks
+
+
+def test_capture_utf16():
+    context = _dummy_context()
+    context.console_encoding = 'auto'
+    data = 'éà$ùµ\nsecond\n'.encode('utf16')
+    chunks = [chunk + b'\n' for chunk in data.split(b'\n')]
+    chunks[-1] = chunks[-1][:-1]
+    # sarge splits on b'\n', leaving the NUL byte of each UTF-16 line feed at the start of the next chunk
+    when(context.capture).readline(block=False).thenReturn(*chunks).thenReturn(None)
+    _capture_output.capture_output_from_running_process(context)
+    _capture_output.flush_captured_output(context)
+    assert ['éà$ùµ', 'second'] == context.process_output_chunks
+
+
+def test_capture_streams_decoded_separately():
+    context = _dummy_context()
+    context.capture = StreamCapture()
+    # a partial line on stdout, then a line on stderr
+    for chunk in ((0, b'progress: 50%'), (1, b'warning: slow\n'), (0, b', done\n'), (1, b'unterminated')):
+        context.capture.buffer.put(chunk)
+    _capture_output.capture_output_from_running_process(context)
+    assert ['warning: slow', 'progress: 50%, done'] == context.process_output_chunks
+    _capture_output.flush_captured_output(context)
+    assert ['warning: slow', 'progress: 50%, done', 'unterminated'] == context.process_output_chunks
+
+
+def test_capture_streams_of_a_process():
+    # stdout ends on a partial line while stderr is still being written to
+    code = '\n'.join((
+        'import sys, time',
+        'sys.stdout.write("no line feed"); sys.stdout.close(); time.sleep(0.2)',
+        'sys.stderr.write("warning: slow\\n")',
+    ))
+    output, _ = run([pathlib.Path(sys.executable), '-c', code], mute=True)
+    assert ['no line feed', 'warning: slow'] == sorted(output.split('\n'))
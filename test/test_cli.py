@@ -0,0 +1,133 @@
+# coding=utf-8
+
+import io
+import json
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+# noinspection PyProtectedMember
+from elib_run import _cli
+
+
+@pytest.fixture(autouse=True)
+def _python_on_path(monkeypatch):
+    # "py" is found in PATH, like any other command
+    os.mkdir('bin')
+    os.symlink(sys.executable, os.path.join('bin', 'py'))
+    monkeypatch.setenv('PATH', os.pathsep.join((os.path.abspath('bin'), os.environ['PATH'])))
+
+
+def _output_lines(output):
+    return [line for line in output.splitlines() if not line.startswith('==>')]
+
+
+def _main(monkeypatch, *argv, stdin=''):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(stdin))
+    stdout = io.StringIO()
+    monkeypatch.setattr(sys, 'stdout', stdout)
+    return_code = _cli.main(list(argv))
+    return return_code, stdout.getvalue()
+
+
+def test_arguments(monkeypatch):
+    return_code, output = _main(monkeypatch, 'py -c "print(1)"', 'py -c "print(2)"', '--jobs', '1')
+    assert 0 == return_code
+    assert output.startswith('==> py -c "print(1)" (return code 0, ')
+    assert ['1', '2'] == _output_lines(output)
+
+
+def test_stdin_and_summary(monkeypatch):
+    stdin = '\n'.join((
+        '# comment',
+        '',
+        'py -c "import sys; print(\'failing\'); sys.exit(3)"',
+        json.dumps({'cmd': ['py', '-c', 'print("json")'], 'cwd': '..'}),
+        'missing_executable',
+        json.dumps({'cmd': 'py -c "import time; time.sleep(30)"', 'timeout': 0.5}),
+        json.dumps({'cmd': 'py -c "print(\'kept\'); print(\'dropped\')"', 'filters': ['drop']}),
+    ))
+    return_code, output = _main(monkeypatch, '--summary', 'summary.json', '--jobs', '4', stdin=stdin)
+    assert 1 == return_code
+    lines = _output_lines(output)
+    assert 'failing' in lines
+    assert 'kept' in lines
+    assert 'dropped' not in lines
+    summary = json.loads(pathlib.Path('summary.json').read_text())
+    assert 3 == summary['failed']
+    commands = summary['commands']
+    assert [3, 0, 127, 124, 0] == [command['return_code'] for command in commands]
+    assert '..' == commands[1]['cwd']
+    assert 'executable not found' in commands[2]['error']
+    assert all(command['duration'] >= 0 for command in commands)
+
+
+def test_file(monkeypatch):
+    pathlib.Path('batch.txt').write_text('py -c "print(\'from file\')"\n')
+    return_code, output = _main(monkeypatch, '-f', 'batch.txt', '--quiet', '--summary', '-')
+    assert 0 == return_code
+    assert '==>' not in output
+    assert 0 == json.loads(output)['failed']
+
+
+@pytest.mark.skipif(not os.path.isfile('/bin/echo'), reason='needs /bin/echo')
+def test_system_executables(monkeypatch):
+    stdin = '\n'.join(('echo from path', '/bin/echo "explicit path"', json.dumps({'cmd': ['/bin/echo', 'json list']})))
+    return_code, _ = _main(monkeypatch, '--summary', 'summary.json', '--jobs', '1', stdin=stdin)
+    assert 0 == return_code
+    summary = json.loads(pathlib.Path('summary.json').read_text())
+    assert [0, 0, 0] == [command['return_code'] for command in summary['commands']]
+    return_code, output = _main(monkeypatch, '/bin/echo "explicit path"')
+    assert ['explicit path'] == _output_lines(output)
+
+
+def test_relative_executable(monkeypatch):
+    return_code, output = _main(monkeypatch, '--cwd', 'bin', './py -c "print(\'relative\')"')
+    assert 0 == return_code
+    assert ['relative'] == _output_lines(output)
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='POSIX permissions')
+def test_spawn_errors(monkeypatch, capsys):
+    not_executable = pathlib.Path('not_executable.txt')
+    not_executable.write_text('hello\n')
+    not_executable.chmod(0o755)
+    no_permission = pathlib.Path('no_permission')
+    no_permission.write_text('#!/bin/sh\n')
+    no_permission.chmod(0o644)
+    stdin = '\n'.join(('./not_executable.txt', './no_permission', 'py -c "print(\'after\')"'))
+    return_code, output = _main(monkeypatch, '--summary', '-', '--jobs', '1', '--quiet', stdin=stdin)
+    assert 1 == return_code
+    summary = json.loads(output)
+    assert [126, 126, 0] == [command['return_code'] for command in summary['commands']]
+    assert 'RunContext(' not in capsys.readouterr().err
+
+
+def test_defaults(monkeypatch):
+    return_code, output = _main(monkeypatch, 'py -c "print(\'a\'); print(\'b\')"', '--filter', 'a', '--timeout', '10')
+    assert 0 == return_code
+    assert ['b'] == _output_lines(output)
+
+
+@pytest.mark.parametrize('stdin', ('{"cwd": "."}', '{invalid', '{"cmd": "py", "unknown": 1}'))
+def test_wrong_lines(monkeypatch, stdin, capsys):
+    return_code, _ = _main(monkeypatch, stdin=stdin)
+    assert 2 == return_code
+
+
+def test_wrong_jobs(monkeypatch):
+    with pytest.raises(SystemExit):
+        _main(monkeypatch, '--jobs', '0', 'py')
+
+
+def test_module():
+    package_root = str(pathlib.Path(_cli.__file__).parent.parent)
+    env = dict(os.environ, PYTHONPATH=package_root)
+    process = subprocess.run(
+        [sys.executable, '-m', 'elib_run', 'py -c "print(\'module\')"'], stdout=subprocess.PIPE, env=env, check=False,
+    )
+    assert 0 == process.returncode
+    assert b'module' in process.stdout
@@ -0,0 +1,201 @@
+# coding=utf-8
+
+import io
+import os
+import pathlib
+import sys
+import threading
+import time
+
+import pytest
+
+import elib_run
+from elib_run import (
+    CoprocessError, CoprocessPool, CoprocessTimeoutError, LengthPrefixedFraming, LineFraming, SentinelFraming,
+)
+
+_PYTHON = pathlib.Path(sys.executable)
+
+_LINE_SERVER = '''
+import os, sys, time
+for line in sys.stdin:
+    line = line.strip()
+    if line == 'crash':
+        sys.exit(1)
+    if line == 'hang':
+        time.sleep(30)
+    if line == 'pid':
+        line = str(os.getpid())
+    print(line.upper(), flush=True)
+'''
+
+_LENGTH_SERVER = '''
+import struct, sys
+while True:
+    header = sys.stdin.buffer.read(4)
+    if not header:
+        break
+    payload = sys.stdin.buffer.read(struct.unpack('>I', header)[0])
+    sys.stdout.buffer.write(struct.pack('>I', len(payload) * 2) + payload * 2)
+    sys.stdout.buffer.flush()
+'''
+
+_SENTINEL_SERVER = '''
+import sys
+for line in sys.stdin:
+    for word in line.split():
+        print(word)
+    print('END', flush=True)
+'''
+
+
+def _pool(code: str, **kwargs) -> CoprocessPool:
+    return CoprocessPool([_PYTHON, '-u', '-c', code], **kwargs)
+
+
+@pytest.mark.parametrize(
+    'framing,stream,expected',
+    (
+        [LineFraming(), b'response\r\nnext', b'response'],
+        [LengthPrefixedFraming(), b'\x00\x00\x00\x03abcdef', b'abc'],
+        [SentinelFraming('END'), b'first\nsecond\nEND\nnext', b'first\nsecond\n'],
+    )
+)
+def test_framing_read(framing, stream, expected):
+    assert expected == framing.read(io.BytesIO(stream))
+
+
+@pytest.mark.parametrize(
+    'framing,stream',
+    (
+        [LineFraming(), b'partial'],
+        [LengthPrefixedFraming(), b'\x00\x00'],
+        [LengthPrefixedFraming(), b'\x00\x00\x00\x03ab'],
+        [SentinelFraming(b'END\n'), b'first\n'],
+    )
+)
+def test_framing_eof(framing, stream):
+    with pytest.raises(EOFError):
+        framing.read(io.BytesIO(stream))
+
+
+def test_framing_encode():
+    assert b'request\n' == LineFraming().encode(b'request')
+    assert b'request\n' == SentinelFraming('END').encode(b'request\n')
+    assert b'\x00\x00\x00\x07request' == LengthPrefixedFraming().encode(b'request')
+
+
+def test_wrong_values():
+    with pytest.raises(ValueError):
+        _pool(_LINE_SERVER, size=0)
+    with pytest.raises(TypeError):
+        _pool(_LINE_SERVER, framing='line')
+    with pytest.raises(TypeError):
+        SentinelFraming(1)
+    with pytest.raises(elib_run.ExecutableNotFoundError):
+        CoprocessPool('__missing_executable__')
+
+
+def test_line_pool():
+    with _pool(_LINE_SERVER) as pool:
+        assert 'HELLO' == pool.request('hello')
+        assert b'WORLD' == pool.request(b'world')
+        assert 1 == pool.workers
+        pid = pool.request('pid')
+        assert pid == pool.request('pid')
+
+
+def test_length_prefixed_pool():
+    with _pool(_LENGTH_SERVER, framing=LengthPrefixedFraming()) as pool:
+        assert b'ab\nab\n' == pool.request(b'ab\n')
+
+
+def test_sentinel_pool():
+    with _pool(_SENTINEL_SERVER, framing=SentinelFraming('END')) as pool:
+        assert 'first\nsecond\n' == pool.request('first second')
+
+
+def test_pool_size():
+    with _pool(_LINE_SERVER, size=3) as pool:
+        barrier = threading.Barrier(6)
+        results = []
+
+        def _request(index):
+            barrier.wait()
+            results.append(pool.request(f'request {index}'))
+
+        threads = [threading.Thread(target=_request, args=(index,)) for index in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(f'REQUEST {index}' for index in range(6)) == sorted(results)
+        assert pool.workers <= 3
+
+
+def test_restart_on_crash():
+    with _pool(_LINE_SERVER) as pool:
+        pid = pool.request('pid')
+        with pytest.raises(CoprocessError):
+            pool.request('crash')
+        assert 1 == pool.restarts
+        assert 'AFTER' == pool.request('after')
+        assert pid != pool.request('pid')
+
+
+def test_timeout():
+    with _pool(_LINE_SERVER, request_timeout=0.5) as pool:
+        start = time.monotonic()
+        with pytest.raises(CoprocessTimeoutError):
+            pool.request('hang')
+        assert time.monotonic() - start < 10
+        assert 0 == pool.workers
+        assert 'AFTER' == pool.request('after')
+
+
+def test_health_check():
+    checked = []
+
+    def _check(worker):
+        checked.append(worker)
+        return False
+
+    with _pool(_LINE_SERVER, health_check=_check, health_interval=0) as pool:
+        pid = pool.request('pid')
+        assert pid != pool.request('pid')
+        assert 1 == len(checked)
+        assert 1 == pool.restarts
+
+
+def test_idle_eviction():
+    with _pool(_LINE_SERVER, idle_timeout=0.1) as pool:
+        pool.request('first')
+        assert 1 == pool.workers
+        time.sleep(0.2)
+        pool.evict_idle()
+        assert 0 == pool.workers
+        assert 'SECOND' == pool.request('second')
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='probes the process with a POSIX signal')
+def test_idle_eviction_without_requests():
+    with _pool(_LINE_SERVER, idle_timeout=0.1) as pool:
+        pid = int(pool.request('pid'))
+        deadline = time.monotonic() + 5
+        while True:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                break
+        assert 0 == pool.workers
+
+
+def test_closed():
+    pool = _pool(_LINE_SERVER)
+    pool.request('first')
+    pool.close()
+    assert 0 == pool.workers
+    with pytest.raises(CoprocessError):
+        pool.request('second')
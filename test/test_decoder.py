@@ -0,0 +1,73 @@
+# coding=utf-8
+
+import codecs
+import locale
+
+import pytest
+
+# noinspection PyProtectedMember
+from elib_run._run._decoder import StreamDecoder, detect_encoding
+
+
+def _feed_bytewise(decoder: StreamDecoder, data: bytes):
+    lines = []
+    for index in range(len(data)):
+        lines.extend(decoder.feed(data[index:index + 1]))
+    return lines + decoder.flush()
+
+
+@pytest.mark.parametrize('encoding', ('utf8', 'utf-16', 'utf-32', 'cp1252', 'shift_jis'))
+def test_split_reads(encoding):
+    text = 'first line\nsecond line\nthird'
+    if encoding == 'shift_jis':
+        text = 'こんにちは\n世界\nend'
+    assert text.split('\n') == _feed_bytewise(StreamDecoder(encoding), text.encode(encoding))
+
+
+@pytest.mark.parametrize(
+    'head,expected',
+    (
+        [codecs.BOM_UTF8 + b'text', 'utf-8-sig'],
+        [codecs.BOM_UTF16_LE + b't\x00', 'utf-16'],
+        [codecs.BOM_UTF16_BE + b'\x00t', 'utf-16'],
+        [codecs.BOM_UTF32_LE + b't\x00\x00\x00', 'utf-32'],
+        [b't\x00e\x00', 'utf-16-le'],
+        [b'\x00t\x00e', 'utf-16-be'],
+        [b'text', locale.getpreferredencoding(False)],
+    )
+)
+def test_detect_encoding(head, expected):
+    assert expected == detect_encoding(head)
+
+
+@pytest.mark.parametrize('encoding', ('utf-8-sig', 'utf-16', 'utf-16-le', 'utf-32'))
+def test_auto(encoding):
+    text = 'éà$ùµ\nsecond'
+    data = text.encode(encoding)
+    if encoding == 'utf-8-sig':
+        assert data.startswith(codecs.BOM_UTF8)
+    decoder = StreamDecoder('auto')
+    assert text.split('\n') == _feed_bytewise(decoder, data)
+
+
+def test_auto_short_stream():
+    decoder = StreamDecoder('auto')
+    assert [] == decoder.feed(b'ok')
+    assert ['ok'] == decoder.flush()
+
+
+def test_invalid_bytes_are_replaced():
+    decoder = StreamDecoder('utf8')
+    assert ['a\ufffdb'] == decoder.feed(b'a\xffb\n')
+
+
+def test_flush_empty():
+    decoder = StreamDecoder('utf8')
+    assert ['line'] == decoder.feed(b'line\n')
+    assert [] == decoder.flush()
+
+
+@pytest.mark.parametrize('encoding', ('unknown_codec', 1, None))
+def test_wrong_encoding(encoding):
+    with pytest.raises((TypeError, ValueError)):
+        StreamDecoder(encoding)
@@ -0,0 +1,133 @@
+# coding=utf-8
+
+import json
+import os
+import pathlib
+import socket
+import sys
+import time
+
+import pytest
+import sarge
+
+import elib_run
+from elib_run import ELIBRunError, Executor, LocalExecutor, ResourceLimits, SocketExecutor, run, start
+from elib_run._exc import ProcessTimeoutError
+# noinspection PyProtectedMember
+from elib_run._run._agent import AgentServer, LocalAgent
+# noinspection PyProtectedMember
+from elib_run._run._executor import FRAME_SPAWN, FRAME_STARTED, recv_frame, send_frame
+# noinspection PyProtectedMember
+from elib_run._run._run import _build_context
+
+_PYTHON = pathlib.Path(sys.executable)
+
+
+@pytest.fixture(scope='module')
+def agent():
+    with LocalAgent() as local_agent:
+        yield local_agent
+
+
+def test_default_executor():
+    context = _build_context([_PYTHON, '-c', 'pass'])
+    assert isinstance(context.executor, LocalExecutor)
+    assert isinstance(context.command, sarge.Command)
+
+
+def test_wrong_executor():
+    with pytest.raises(TypeError):
+        run([_PYTHON, '-c', 'pass'], executor='local')
+
+
+def test_base_executor():
+    with pytest.raises(NotImplementedError):
+        Executor().create_process(None)
+
+
+@pytest.mark.parametrize('address', ((1, 1), ('localhost', '1')))
+def test_socket_executor_wrong_address(address):
+    with pytest.raises(TypeError):
+        SocketExecutor(address)
+
+
+def test_socket_executor(agent):
+    output, return_code = run(
+        [_PYTHON, '-c', 'import sys; print("first"); print("second", file=sys.stderr); sys.exit(3)'],
+        executor=agent.executor,
+        failure_ok=True,
+    )
+    assert 3 == return_code
+    assert ['first', 'second'] == sorted(output.split('\n'))
+
+
+def test_socket_executor_streams_output(agent):
+    handle = start(
+        [_PYTHON, '-u', '-c', 'import time; print("ready"); time.sleep(30)'],
+        executor=agent.executor,
+        triggers=elib_run.Trigger('ready', action='kill'),
+    )
+    assert handle.wait(10)
+    assert 'ready' == handle.output_so_far
+
+
+def test_socket_executor_kill_on_timeout(agent):
+    begin = time.monotonic()
+    with pytest.raises(ProcessTimeoutError):
+        run([_PYTHON, '-c', 'import time; time.sleep(30)'], executor=agent.executor, timeout=0.5)
+    assert time.monotonic() - begin < 10
+
+
+def test_socket_executor_spawn_error(agent):
+    with pytest.raises(ELIBRunError):
+        run([_PYTHON, '-c', 'pass'], executor=agent.executor, cwd=str(pathlib.Path('missing').absolute()))
+
+
+def test_socket_executor_no_agent():
+    with LocalAgent() as local_agent:
+        executor = local_agent.executor
+    with pytest.raises(ELIBRunError):
+        run([_PYTHON, '-c', 'pass'], executor=executor)
+
+
+def test_socket_executor_limits(agent):
+    with pytest.raises(ELIBRunError):
+        run([_PYTHON, '-c', 'pass'], executor=agent.executor, limits=ResourceLimits(open_files=64))
+
+
+@pytest.mark.parametrize('host', ('0.0.0.0', '192.168.0.1', 'example.com'))
+def test_agent_loopback_only(host):
+    with pytest.raises(ValueError):
+        AgentServer((host, 0))
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='probes the process with a POSIX signal')
+def test_agent_kills_on_disconnect(agent):
+    with socket.create_connection(agent.address) as connection:
+        spec = {'argv': [str(_PYTHON), '-c', 'import time; time.sleep(30)'], 'cwd': '.'}
+        send_frame(connection, FRAME_SPAWN, json.dumps(spec).encode('utf8'))
+        kind, payload = recv_frame(connection)
+    assert FRAME_STARTED == kind
+    pid = json.loads(payload.decode('utf8'))['pid']
+    deadline = time.monotonic() + 10
+    while True:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            break
+
+
+@pytest.mark.long
+def test_throughput_benchmark(agent):
+    cmd = [_PYTHON, '-c', 'import sys; sys.stdout.write(("y" * 79 + "\\n") * 200001)']
+
+    def _time(executor) -> float:
+        begin = time.perf_counter()
+        output, _ = run(cmd, executor=executor, mute=True, timeout=60)
+        assert 200001 == len(output.split('\n'))
+        return time.perf_counter() - begin
+
+    local, remote = _time(None), _time(agent.executor)
+    print(f'200k lines: {local:.3f}s local, {remote:.3f}s through the agent')
@@ -0,0 +1,193 @@
+# coding=utf-8
+
+import threading
+import time
+
+import pytest
+
+# noinspection PyProtectedMember
+from elib_run._run._governor import Governor
+
+
+def test_unlimited():
+    governor = Governor()
+    tickets = [governor.acquire() for _ in range(100)]
+    assert 100 == governor.metrics.in_flight
+    for ticket in tickets:
+        governor.release(ticket)
+    assert 0 == governor.metrics.in_flight
+    assert 100 == governor.metrics.admitted
+
+
+@pytest.mark.parametrize('max_in_flight', (0, -1))
+def test_wrong_max_in_flight(max_in_flight):
+    with pytest.raises(ValueError):
+        Governor().configure(max_in_flight)
+
+
+def test_weights():
+    governor = Governor()
+    governor.configure(weights={'heavy.exe': 4})
+    assert 4 == governor.weight_for('heavy.exe')
+    assert 1 == governor.weight_for('light.exe')
+
+
+def test_configure_separately():
+    governor = Governor()
+    governor.configure(max_in_flight=4)
+    governor.configure(weights={'heavy.exe': 2})
+    assert 4 == governor.max_in_flight
+    assert 2 == governor.weight_for('heavy.exe')
+    governor.configure(max_in_flight=None)
+    assert governor.max_in_flight is None
+    assert 2 == governor.weight_for('heavy.exe')
+
+
+def _acquire_in_thread(governor, admitted, name, **kwargs):
+    def _target():
+        ticket = governor.acquire(**kwargs)
+        admitted.append((name, ticket))
+
+    thread = threading.Thread(target=_target, daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_for_waiting(governor, count):
+    deadline = time.monotonic() + 5
+    while governor.metrics.waiting != count:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_max_in_flight():
+    governor = Governor(2)
+    first, second = governor.acquire(), governor.acquire()
+    admitted = []
+    thread = _acquire_in_thread(governor, admitted, 'third')
+    _wait_for_waiting(governor, 1)
+    assert not admitted
+    governor.release(first)
+    thread.join(5)
+    assert ['third'] == [name for name, _ in admitted]
+    assert 2 == governor.metrics.in_flight
+    assert governor.metrics.max_wait > 0
+    governor.release(second)
+
+
+def test_heavy_ticket_runs_alone():
+    governor = Governor(2)
+    ticket = governor.acquire(weight=10)
+    assert 10 == governor.metrics.in_flight
+    governor.release(ticket)
+
+
+def test_priority():
+    governor = Governor(1)
+    blocker = governor.acquire()
+    admitted = []
+    threads = [_acquire_in_thread(governor, admitted, 'low', priority=10)]
+    _wait_for_waiting(governor, 1)
+    threads.append(_acquire_in_thread(governor, admitted, 'high', priority=0))
+    _wait_for_waiting(governor, 2)
+    governor.release(blocker)
+    for _ in range(2):
+        deadline = time.monotonic() + 5
+        count = len(admitted)
+        while len(admitted) == count:
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+        governor.release(admitted[-1][1])
+    assert ['high', 'low'] == [name for name, _ in admitted]
+
+
+def test_fair_share():
+    governor = Governor(2)
+    busy = governor.acquire(group='busy')
+    other = governor.acquire(group='other')
+    admitted = []
+    _acquire_in_thread(governor, admitted, 'busy', group='busy')
+    _wait_for_waiting(governor, 1)
+    _acquire_in_thread(governor, admitted, 'idle', group='idle')
+    _wait_for_waiting(governor, 2)
+    governor.release(other)
+    _wait_for_waiting(governor, 1)
+    assert ['idle'] == [name for name, _ in admitted]
+    governor.release(busy)
+    _wait_for_waiting(governor, 0)
+
+
+@pytest.mark.parametrize('weight,error', (('1', TypeError), (0, ValueError), (-1, ValueError)))
+def test_wrong_weight(weight, error):
+    governor = Governor()
+    with pytest.raises(error):
+        governor.acquire(weight=weight)
+    assert 0 == governor.metrics.waiting
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class _InterruptibleGovernor(Governor):
+    # tickets of the "interrupted" group give up after waiting a bit, like a thread interrupted by a signal
+
+    def _enqueue(self, ticket):
+        wakeup = super()._enqueue(ticket)
+        if ticket.group == 'interrupted':
+            wait = wakeup.wait
+
+            def _wait():
+                wait(0.2)
+                raise _Interrupted()
+
+            wakeup.wait = _wait
+        return wakeup
+
+
+def test_interrupted_wait():
+    governor = _InterruptibleGovernor(2)
+    blocker = governor.acquire()
+    admitted = []
+    errors = []
+
+    def _interrupted():
+        try:
+            governor.acquire(weight=2, group='interrupted')
+        except _Interrupted as error:
+            errors.append(error)
+
+    interrupted = threading.Thread(target=_interrupted, daemon=True)
+    interrupted.start()
+    _wait_for_waiting(governor, 1)
+    # fits, but waits behind the interrupted ticket
+    thread = _acquire_in_thread(governor, admitted, 'next', priority=1)
+    interrupted.join(5)
+    thread.join(5)
+    assert 1 == len(errors)
+    assert ['next'] == [name for name, _ in admitted]
+    assert 0 == governor.metrics.waiting
+    assert 2 == governor.metrics.in_flight
+    governor.release(blocker)
+
+
+def test_many_waiters():
+    governor = Governor(1)
+    blocker = governor.acquire()
+    admitted = []
+    threads = [_acquire_in_thread(governor, admitted, index, group=str(index % 3)) for index in range(200)]
+    _wait_for_waiting(governor, 200)
+    governor.release(blocker)
+    for _ in range(200):
+        deadline = time.monotonic() + 5
+        count = len(admitted)
+        while len(admitted) == count:
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+        governor.release(admitted[-1][1])
+    for thread in threads:
+        thread.join(5)
+    assert 201 == governor.metrics.admitted
+    # no group has anything in flight when the next ticket is picked: arrival order
+    sequences = [ticket.sequence for _, ticket in admitted]
+    assert sorted(sequences) == sequences
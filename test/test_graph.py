@@ -0,0 +1,137 @@
+# coding=utf-8
+
+import json
+import pathlib
+import sys
+import time
+
+import pytest
+
+import elib_run
+from elib_run import CommandGraph
+
+_PYTHON = pathlib.Path(sys.executable)
+
+
+def _python(code: str):
+    return [_PYTHON, '-c', code]
+
+
+def _append(path: str, text: str):
+    return _python(f'open({path!r}, "a").write({text!r} + "\\n")')
+
+
+def test_order():
+    graph = CommandGraph(workers=4)
+    graph.add('a', _append('log', 'a'))
+    graph.add('b', _append('log', 'b'), deps=['a'])
+    graph.add('c', _append('log', 'c'), deps=['a'])
+    graph.add('d', _append('log', 'd'), deps=['b', 'c'])
+    results = graph.run()
+    assert ['a', 'b', 'c', 'd'] == list(results)
+    assert all(result.status == 'success' for result in results.values())
+    lines = pathlib.Path('log').read_text().split()
+    assert 'a' == lines[0]
+    assert 'd' == lines[-1]
+    assert {'b', 'c'} == set(lines[1:3])
+
+
+def test_parallel():
+    graph = CommandGraph(workers=4)
+    for index in range(4):
+        graph.add(f'sleep {index}', _python('import time; time.sleep(0.5)'))
+    start = time.monotonic()
+    graph.run()
+    assert time.monotonic() - start < 1.5
+
+
+def test_failure_cancels_dependents_only():
+    graph = CommandGraph(workers=2)
+    graph.add('fail', _python('import sys; sys.exit(3)'))
+    graph.add('child', _append('log', 'child'), deps=['fail'])
+    graph.add('grandchild', _append('log', 'grandchild'), deps=['child'])
+    graph.add('other', _append('log', 'other'))
+    results = graph.run()
+    assert 'failed' == results['fail'].status
+    assert 3 == results['fail'].result.return_code
+    assert 'cancelled' == results['child'].status
+    assert 'cancelled' == results['grandchild'].status
+    assert 'success' == results['other'].status
+    assert ['other'] == pathlib.Path('log').read_text().split()
+
+
+def test_wrong_options_fail_the_node_only():
+    graph = CommandGraph(workers=2)
+    graph.add('wrong', _python('pass'), storage='bogus')
+    graph.add('child', _append('log', 'child'), deps=['wrong'])
+    graph.add('empty', [])
+    graph.add('other', _append('log', 'other'))
+    results = graph.run()
+    assert 'failed' == results['wrong'].status
+    assert isinstance(results['wrong'].error, ValueError)
+    assert results['wrong'].result is None
+    assert 'cancelled' == results['child'].status
+    assert isinstance(results['empty'].error, ValueError)
+    assert 'success' == results['other'].status
+    assert ['other'] == pathlib.Path('log').read_text().split()
+
+
+def test_timeout_is_a_failure():
+    graph = CommandGraph()
+    graph.add('slow', _python('import time; time.sleep(30)'), timeout=0.3)
+    results = graph.run()
+    assert 'failed' == results['slow'].status
+    assert isinstance(results['slow'].error, elib_run.ELIBRunError)
+
+
+def test_incremental():
+    pathlib.Path('input').write_text('first')
+    copy = _python('import shutil; shutil.copy("input", "output"); open("log", "a").write("copy\\n")')
+
+    def _run_graph():
+        graph = CommandGraph(state_file='state.json')
+        graph.add('copy', copy, inputs=['input'], outputs=['output'])
+        graph.add('always', _append('log', 'always'))
+        return graph.run()
+
+    assert 'success' == _run_graph()['copy'].status
+    assert 'skipped' == _run_graph()['copy'].status
+    assert 'copy' in json.loads(pathlib.Path('state.json').read_text())
+    pathlib.Path('input').write_text('second')
+    assert 'success' == _run_graph()['copy'].status
+    pathlib.Path('output').unlink()
+    assert 'success' == _run_graph()['copy'].status
+    log = pathlib.Path('log').read_text().split()
+    assert (3, 4) == (log.count('copy'), log.count('always'))
+
+
+def test_incremental_command_change():
+    pathlib.Path('input').write_text('content')
+    for code, expected in (('pass', 'success'), ('pass', 'skipped'), ('pass;', 'success')):
+        graph = CommandGraph(state_file='state.json')
+        graph.add('node', _python(code), inputs=['input'])
+        assert expected == graph.run()['node'].status
+
+
+def test_corrupt_state_file():
+    pathlib.Path('input').write_text('content')
+    pathlib.Path('state.json').write_text('{')
+    graph = CommandGraph(state_file='state.json')
+    graph.add('node', _python('pass'), inputs=['input'])
+    assert 'success' == graph.run()['node'].status
+
+
+def test_wrong_graphs():
+    graph = CommandGraph()
+    graph.add('a', 'cmd', deps=['b'])
+    with pytest.raises(ValueError):
+        graph.add('a', 'cmd')
+    with pytest.raises(TypeError):
+        graph.add(1, 'cmd')
+    with pytest.raises(ValueError, match='unknown dependency'):
+        graph.run()
+    graph.add('b', 'cmd', deps=['c'])
+    graph.add('c', 'cmd', deps=['a'])
+    graph.add('d', 'cmd')
+    with pytest.raises(ValueError, match='cycle between: a, b, c'):
+        graph.run()
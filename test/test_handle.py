@@ -0,0 +1,118 @@
+# coding=utf-8
+
+import pytest
+from mockito import verifyStubbedInvocationsAreUsed, when
+
+# noinspection PyProtectedMember
+from elib_run._run import _handle, _run
+from elib_run._run._result import RunResult
+from elib_run._run._run_context import RunContext
+from elib_run._run._shutdown import active_runs
+from elib_run._run._trigger import Trigger
+
+
+def _started_handle(context: RunContext) -> _handle.RunHandle:
+    context.start_process()
+    handle = _handle.RunHandle(context)
+    _handle._COLLECTOR.register(handle)
+    return handle
+
+
+def test_wait(python_context):
+    handle = _started_handle(python_context('print("some output")'))
+    assert 0 == handle.wait(5)
+    assert handle.finished
+    assert 'some output' == handle.output_so_far
+    assert 0 == handle.poll()
+
+
+def test_wait_timeout_expires(python_context):
+    handle = _started_handle(python_context('import time; time.sleep(5)'))
+    assert handle.wait(0.05) is None
+    assert handle.poll() is None
+    assert handle.kill() != 0
+    assert handle.finished
+
+
+def test_process_timeout(python_context):
+    handle = _started_handle(python_context('import time; time.sleep(5)', timeout=0.1))
+    with pytest.raises(_handle.ProcessTimeoutError):
+        handle.wait(5)
+    assert -1 == handle.context.return_code
+
+
+def test_result(python_context):
+    handle = _started_handle(python_context('import sys; print("out"); sys.exit(2)'))
+    result = handle.result()
+    assert isinstance(result, RunResult)
+    assert ('out', 2) == result
+    assert 2 == result.return_code
+
+
+def test_result_checked_once(python_context):
+    handle = _started_handle(python_context('import sys; print("out"); sys.exit(2)'))
+    assert handle.result() is handle.result()
+    assert 1 == handle.context.result_buffer.count('command failed')
+
+
+def test_kill_after_stop_trigger(python_context):
+    context = python_context('import time; print("ready", flush=True); time.sleep(30)')
+    context.triggers = [Trigger('ready')]
+    context.start_process()
+    handle = _handle.RunHandle(context)
+    _handle._COLLECTOR.register(handle)
+    assert 0 == handle.wait(10)
+    assert not context.process_finished()
+    assert handle.kill() != 0
+    assert context.process_finished()
+
+
+def test_many_handles(python_context):
+    handles = [_started_handle(python_context(f'print({index})')) for index in range(10)]
+    assert [str(index) for index in range(10)] == [handle.result().output for handle in handles]
+
+
+def test_start(python_context):
+    context = python_context('print("started")')
+    when(_handle)._build_context(...).thenReturn(context)
+    handle = _handle.start('python')
+    assert context is handle.context
+    assert context.started
+    assert ('started', 0) == handle.result()
+    verifyStubbedInvocationsAreUsed()
+
+
+def test_run_returns_result(python_context):
+    context = python_context('print("ran")')
+    when(_run)._build_context(...).thenReturn(context)
+    result = _run.run('python')
+    assert ('ran', 0) == result
+    assert context is result.context
+
+
+def test_start_releases_governor_ticket(python_context):
+    context = python_context('print("started")')
+    when(_handle)._build_context(...).thenReturn(context)
+    in_flight = _handle.GOVERNOR.metrics.in_flight
+    handle = _handle.start('python', weight=3)
+    assert in_flight + 3 == _handle.GOVERNOR.metrics.in_flight
+    handle.wait(5)
+    assert in_flight == _handle.GOVERNOR.metrics.in_flight
+
+
+def test_failing_callback(python_context):
+    def _callback(_):
+        raise RuntimeError('callback failed')
+
+    context = python_context('import time; print("ready", flush=True); time.sleep(30)')
+    context.triggers = [Trigger('ready', action='callback', callback=_callback)]
+    context.start_process()
+    handle = _handle.RunHandle(context)
+    _handle._COLLECTOR.register(handle)
+    with pytest.raises(RuntimeError):
+        handle.wait(10)
+    assert handle.finished
+    assert context.process_finished()
+    assert context not in active_runs()
+    with pytest.raises(RuntimeError):
+        handle.result()
@@ -0,0 +1,92 @@
+# coding=utf-8
+
+import pathlib
+import sys
+import threading
+
+import pytest
+
+from elib_run import HistoryStore, JobStats, run
+# noinspection PyProtectedMember
+from elib_run._run._history import history_key
+
+_PYTHON = pathlib.Path(sys.executable)
+
+
+def test_history_key():
+    assert history_key(_PYTHON, ['-c', 'print(1)']) == history_key(_PYTHON, ['-c', 'print(1)'])
+    assert history_key(_PYTHON, ['-c', 'print(1)']) != history_key(_PYTHON, ['-c', 'print(2)'])
+    assert history_key(_PYTHON, ['a b']) != history_key(_PYTHON, ['a', 'b'])
+
+
+def test_stats():
+    store = HistoryStore()
+    assert store.stats('key') is None
+    store.record('key', 1.0)
+    store.record('key', 3.0, peak_rss=1000)
+    store.record('key', 2.0, peak_rss=500, return_code=1)
+    store.record('other', 100.0)
+    assert JobStats(runs=3, duration=2.0, max_duration=3.0, peak_rss=1000) == store.stats('key')
+    assert store.stats('other').peak_rss is None
+
+
+def test_stats_recent_runs_only():
+    store = HistoryStore()
+    for _ in range(20):
+        store.record('key', 100.0)
+    for _ in range(10):
+        store.record('key', 1.0)
+    assert 1.0 == store.stats('key').duration
+
+
+def test_persistent():
+    with HistoryStore('history.db') as store:
+        store.record('key', 1.5)
+    with HistoryStore(pathlib.Path('history.db')) as store:
+        assert 1 == store.stats('key').runs
+
+
+def test_threads():
+    store = HistoryStore('history.db')
+
+    def _record():
+        for _ in range(50):
+            store.record('key', 1.0)
+
+    threads = [threading.Thread(target=_record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 10 == store.stats('key').runs
+    assert 200 == store._connection.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+
+
+def test_run_records():
+    store = HistoryStore()
+    cmd = [_PYTHON, '-c', 'import time; time.sleep(0.2)']
+    run(cmd, mute=True, history=store)
+    stats = store.stats(history_key(_PYTHON, cmd[1:]))
+    assert 1 == stats.runs
+    assert 0.2 <= stats.duration < 5
+    assert stats.peak_rss is None
+
+
+@pytest.mark.skipif(not pathlib.Path('/proc/self/stat').exists(), reason='needs /proc')
+def test_run_records_peak_memory():
+    store = HistoryStore()
+    cmd = [_PYTHON, '-c', 'import time; data = bytearray(50 * 1024 * 1024); time.sleep(0.5)']
+    run(cmd, mute=True, history=store, sample_interval=0.05)
+    assert store.stats(history_key(_PYTHON, cmd[1:])).peak_rss > 50 * 1024 * 1024
+
+
+def test_run_records_failures():
+    store = HistoryStore()
+    cmd = [_PYTHON, '-c', 'import sys; sys.exit(2)']
+    run(cmd, mute=True, failure_ok=True, history=store)
+    assert 1 == store.stats(history_key(_PYTHON, cmd[1:])).runs
+
+
+def test_run_wrong_history():
+    with pytest.raises(TypeError):
+        run([_PYTHON, '-c', ''], history='history.db')
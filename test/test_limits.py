@@ -0,0 +1,98 @@
+# coding=utf-8
+
+import os
+import shutil
+import signal
+
+import pytest
+
+# noinspection PyProtectedMember
+from elib_run._run._limits import ResourceLimits
+from elib_run._run._monitor_running_process import monitor_running_process
+from elib_run._run._result import RunResult
+from elib_run._run._run_context import RunContext
+
+posix_only = pytest.mark.skipif(os.name != 'posix', reason='resource limits are POSIX only')
+
+
+def _run_to_end(context: RunContext) -> RunResult:
+    context.start_process()
+    monitor_running_process(context)
+    return RunResult(context)
+
+
+@pytest.mark.parametrize(
+    'kwargs',
+    (
+        {'address_space': 0},
+        {'cpu_time': -1},
+        {'open_files': 1.5},
+        {'open_files': True},
+        {'nice': 'string'},
+        {'ionice': 8},
+        {'cpu_affinity': []},
+    )
+)
+@posix_only
+def test_wrong_values(kwargs):
+    with pytest.raises((TypeError, ValueError)):
+        ResourceLimits(**kwargs)
+
+
+@posix_only
+@pytest.mark.parametrize(
+    'limits,return_code,output,expected',
+    (
+        [ResourceLimits(cpu_time=1), 0, '', None],
+        [ResourceLimits(cpu_time=1), -signal.SIGXCPU, '', 'cpu_time'],
+        [ResourceLimits(cpu_time=1), 1, 'MemoryError', None],
+        [ResourceLimits(address_space=2 ** 30), 1, 'MemoryError', 'address_space'],
+        [ResourceLimits(address_space=2 ** 30), 1, 'some error', None],
+        [ResourceLimits(open_files=10), 1, 'OSError: [Errno 24] Too many open files', 'open_files'],
+    )
+)
+def test_limit_hit(limits, return_code, output, expected):
+    assert expected == limits.limit_hit(return_code, output)
+
+
+@posix_only
+def test_open_files_limit(python_context):
+    code = 'files = [open(__import__("sys").executable) for _ in range(100)]'
+    result = _run_to_end(python_context(code, limits=ResourceLimits(open_files=20)))
+    assert 0 != result.return_code
+    assert 'open_files' == result.limit_hit
+
+
+@posix_only
+def test_address_space_limit(python_context):
+    result = _run_to_end(python_context('data = bytearray(2 ** 30)', limits=ResourceLimits(address_space=2 ** 29)))
+    assert 0 != result.return_code
+    assert 'address_space' == result.limit_hit
+
+
+@posix_only
+def test_nice(python_context):
+    result = _run_to_end(python_context('import os; print(os.nice(0))', limits=ResourceLimits(nice=5)))
+    assert str(os.nice(0) + 5) == result.output
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'), reason='Linux only')
+def test_cpu_affinity(python_context):
+    cpu = sorted(os.sched_getaffinity(0))[0]
+    code = 'import os; print(sorted(os.sched_getaffinity(0)))'
+    result = _run_to_end(python_context(code, limits=ResourceLimits(cpu_affinity=[cpu])))
+    assert f'[{cpu}]' == result.output
+
+
+@pytest.mark.skipif(shutil.which('ionice') is None, reason='requires the "ionice" executable')
+def test_ionice(python_context):
+    code = 'import os, subprocess; subprocess.run(["ionice", "-p", str(os.getpid())])'
+    result = _run_to_end(python_context(code, limits=ResourceLimits(ionice=7)))
+    assert 'best-effort: prio 7' == result.output
+
+
+@posix_only
+@pytest.mark.long
+def test_cpu_time_limit(python_context):
+    result = _run_to_end(python_context('while True: pass', limits=ResourceLimits(cpu_time=1)))
+    assert 'cpu_time' == result.limit_hit
@@ -1,16 +1,25 @@
 # coding=utf-8
 
+import pathlib
+import sys
+import time
+
 import pytest
 from mockito import mock, verify, when
 
+from elib_run import run
 # noinspection PyProtectedMember
 from elib_run._run import _monitor_running_process
+from elib_run._run._trigger import Trigger
 
 
 def test_monitor_running_process_poll():
     context = mock()
+    context.process_logger = mock()
+    context.fired_trigger = None
     context.command = mock({'returncode': 0})
     when(_monitor_running_process).capture_output_from_running_process(context)
+    when(_monitor_running_process).flush_captured_output(context)
     when(context).process_finished().thenReturn(True)
     when(context).process_timed_out()
     _monitor_running_process.monitor_running_process(context)
@@ -22,10 +31,13 @@ def test_monitor_running_process_poll():
 
 def test_monitor_running_process_break():
     context = mock()
+    context.process_logger = mock()
+    context.fired_trigger = None
     context.command = mock({'returncode': 0})
     when(_monitor_running_process).capture_output_from_running_process(context)
+    when(_monitor_running_process).flush_captured_output(context)
     when(context).process_finished().thenReturn(False).thenReturn(False).thenReturn(True)
-    when(context).process_timed_out().thenReturn(False)
+    when(context).process_timed_out().thenReturn(None)
     _monitor_running_process.monitor_running_process(context)
     assert 0 is context.return_code
     verify(_monitor_running_process)
@@ -35,13 +47,67 @@ def test_monitor_running_process_break():
 
 def test_monitor_running_process_timeout():
     context = mock()
+    context.process_logger = mock()
+    context.fired_trigger = None
     context.command = mock({'returncode': 0})
     when(_monitor_running_process).capture_output_from_running_process(context)
+    when(_monitor_running_process).flush_captured_output(context)
     when(context).process_finished().thenReturn(False)
-    when(context).process_timed_out().thenReturn(True)
-    with pytest.raises(_monitor_running_process.ProcessTimeoutError):
+    when(context).process_timed_out().thenReturn('wall')
+    with pytest.raises(_monitor_running_process.ProcessTimeoutError) as exc_info:
         _monitor_running_process.monitor_running_process(context)
+    assert 'wall' == exc_info.value.kind
     assert -1 is context.return_code
     verify(_monitor_running_process)
     when(context).process_finished()
     verify(context).process_timed_out()
+
+
+def test_monitor_running_process_trigger_stop():
+    context = mock()
+    context.process_logger = mock()
+    context.fired_trigger = Trigger('ready')
+    when(_monitor_running_process).capture_output_from_running_process(context)
+    when(_monitor_running_process).flush_captured_output(context)
+    when(context).process_finished()
+    when(_monitor_running_process).detach(context)
+    when(_monitor_running_process).discard_output(context)
+    _monitor_running_process.monitor_running_process(context)
+    assert 0 == context.return_code
+    verify(context, times=0).process_finished()
+    verify(_monitor_running_process).detach(context)
+    verify(_monitor_running_process).discard_output(context)
+
+
+def test_monitor_running_process_trigger_kill():
+    context = mock()
+    context.process_logger = mock()
+    context.fired_trigger = Trigger('FATAL', action='kill')
+    context.command = mock({'returncode': -15})
+    when(_monitor_running_process).capture_output_from_running_process(context)
+    when(_monitor_running_process).flush_captured_output(context)
+    when(context).kill_process()
+    _monitor_running_process.monitor_running_process(context)
+    assert -15 == context.return_code
+    verify(context).kill_process()
+
+
+def test_output_discarded_after_stop():
+    code = '\n'.join((
+        'import pathlib, time',
+        'print("ready", flush=True)',
+        'print("chatty\\n" * 200000, flush=True)',
+        'pathlib.Path("written").touch()',
+        'time.sleep(30)',
+    ))
+    result = run([pathlib.Path(sys.executable), '-u', '-c', code], mute=True, triggers=Trigger('ready'))
+    context = result.context
+    try:
+        deadline = time.monotonic() + 10
+        # the output written after the trigger is read, and dropped, while the process keeps running
+        while not pathlib.Path('written').exists() or context.capture.buffer.qsize():
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert not context.process_finished()
+    finally:
+        context.kill_process()
@@ -0,0 +1,239 @@
+# coding=utf-8
+
+import gc
+import pathlib
+import sys
+import time
+import tracemalloc
+
+import pytest
+
+from elib_run import run
+# noinspection PyProtectedMember
+from elib_run._run import _output_storage
+# noinspection PyProtectedMember
+from elib_run._run._output_storage import CompactOutput, IndexedOutput, find_line, new_output_storage, tail_lines
+
+_LINES = ['progress 10%', 'progress 10%', 'warning: deprecated', 'progress 20%', 'tab\tseparated', '',
+          'warning: deprecated', 'warning: deprecated', 'unicode: éàù']
+
+
+@pytest.mark.parametrize('compression', (None, 'zlib', 'lzma'))
+@pytest.mark.parametrize('block_size', (1, 2, 3, 1000))
+def test_round_trip(compression, block_size):
+    output = CompactOutput(compression, block_size)
+    for line in _LINES:
+        output.append(line)
+    assert len(_LINES) == len(output)
+    assert _LINES == list(output)
+    assert output == _LINES
+    assert '\n'.join(_LINES) == '\n'.join(output)
+    assert _LINES[3] == output[3]
+    assert _LINES[-1] == output[-1]
+    assert _LINES[2:5] == output[2:5]
+    assert _LINES[1::3] == output[1::3]
+    assert _LINES[::-2] == output[::-2]
+    assert _LINES[5:2] == output[5:2]
+    assert _LINES[-3:] == tail_lines(output, 3)
+
+
+def test_lookup_skips_blocks(monkeypatch):
+    output = CompactOutput('zlib', block_size=10)
+    for index in range(1000):
+        output.append(f'line {index}')
+    decompressed = []
+    compress, decompress = _output_storage._COMPRESSORS['zlib']
+    monkeypatch.setitem(_output_storage._COMPRESSORS, 'zlib',
+                        (compress, lambda block: decompressed.append(block) or decompress(block)))
+    assert 'line 995' == output[995]
+    assert ['line 998', 'line 999'] == tail_lines(output, 2)
+    assert ['line 500', 'line 501'] == output[500:502]
+    assert 3 == len(decompressed)
+
+
+def test_index_error():
+    output = CompactOutput()
+    with pytest.raises(IndexError):
+        _ = output[0]
+
+
+def test_run_length_and_interning():
+    output = CompactOutput()
+    for _ in range(1000):
+        output.append('same line')
+    for index in range(1000):
+        output.append('line ' + str(index % 2))
+    assert 2000 == len(output)
+    assert 1001 == len(output._lines)
+    assert 2 == len({id(line) for line in output._lines[1:]})
+
+
+def test_compression_saves_memory():
+    plain = CompactOutput()
+    compressed = CompactOutput('zlib')
+    for index in range(100000):
+        line = f'compiling module_{index % 50}.c: warning: implicit declaration of function'
+        plain.append(line)
+        compressed.append(line)
+    raw_size = sum(len(line) + 1 for line in compressed)
+    assert compressed.stored_size * 10 < raw_size
+    assert list(plain) == list(compressed)
+
+
+@pytest.mark.parametrize('spill_size', (1, 1024 * 1024))
+def test_indexed_round_trip(spill_size):
+    output = IndexedOutput(spill_size)
+    for line in _LINES + ['embedded\nline feed']:
+        output.append(line)
+    lines = _LINES + ['embedded\nline feed']
+    assert len(lines) == len(output)
+    assert lines == list(output)
+    assert output == lines
+    assert '\n'.join(lines) == output.as_str()
+    assert lines[3] == output[3]
+    assert lines[-1] == output[-1]
+    assert lines[2:5] == output[2:5]
+    assert lines[::3] == output[::3]
+    assert lines[5:2] == output[5:2]
+    assert lines[-3:] == output.tail(3)
+    assert spill_size == 1 and output.spilled or spill_size > 1 and not output.spilled
+    output.close()
+
+
+def test_indexed_spilled():
+    output = IndexedOutput(spill_size=10)
+    output.append('short')
+    assert not output.spilled
+    output.append('over the spill size')
+    assert output.spilled
+    output.append('after')
+    assert ['short', 'over the spill size', 'after'] == list(output)
+    output.close()
+
+
+def test_indexed_empty():
+    output = IndexedOutput()
+    assert '' == output.as_str()
+    assert [] == output.tail(5)
+    assert output.find('.') is None
+    with pytest.raises(IndexError):
+        _ = output[0]
+
+
+def test_indexed_append_after_read():
+    output = IndexedOutput(spill_size=10)
+    output.append('first')
+    assert 'first' == output[0]
+    output.append('second')
+    assert ['first', 'second'] == list(output)
+
+
+@pytest.mark.parametrize('storage', ('list', 'compact', 'zlib', 'indexed'))
+def test_find_and_tail(storage):
+    output = new_output_storage(storage)
+    for index in range(10000):
+        output.append(f'line {index}')
+    output.append('error: something failed')
+    output.append('last line')
+    assert 10000 == find_line(output, 'error')
+    assert 7 == find_line(output, r'line 7$')
+    assert 10 == find_line(output, r'line \d+$', 10)
+    assert find_line(output, 'missing') is None
+    assert find_line(output, 'error', 10001) is None
+    assert ['error: something failed', 'last line'] == tail_lines(output, 2)
+    assert [] == tail_lines(output, 0)
+    assert 10002 == len(tail_lines(output, 20000))
+
+
+@pytest.mark.parametrize('count,error', (('1', TypeError), (-1, ValueError)))
+def test_tail_wrong_count(count, error):
+    with pytest.raises(error):
+        tail_lines([], count)
+
+
+def test_indexed_random_access_is_fast():
+    indexed = IndexedOutput()
+    plain = []
+    for index in range(500000):
+        line = f'compiling module_{index}.c'
+        indexed.append(line)
+        plain.append(line)
+
+    start = time.perf_counter()
+    for _ in range(10):
+        window = '\n'.join(plain).split('\n')[250000:250010]
+    split_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(10):
+        assert window == indexed[250000:250010]
+    indexed_time = time.perf_counter() - start
+    print(f'window of 10 lines out of 500k: split {split_time * 100:.3f} ms, indexed {indexed_time * 100:.3f} ms')
+    assert indexed_time * 100 < split_time
+
+
+def test_run_indexed():
+    code = 'for i in range(1000): print("line", i)\nprint("error: failed")'
+    result = run([pathlib.Path(sys.executable), '-c', code], mute=True, storage='indexed')
+    assert isinstance(result.lines, IndexedOutput)
+    assert 1001 == len(result.lines)
+    assert ['line 10', 'line 11'] == result.lines[10:12]
+    assert 1000 == result.find('^error')
+    assert ['line 999', 'error: failed'] == result.tail(2)
+    assert result.output.endswith('line 999\nerror: failed')
+
+
+@pytest.mark.parametrize('mode,expected_type', (
+    ('list', list), ('compact', CompactOutput), ('zlib', CompactOutput), ('indexed', IndexedOutput),
+))
+def test_new_output_storage(mode, expected_type):
+    assert isinstance(new_output_storage(mode), expected_type)
+
+
+@pytest.mark.parametrize('mode', ('bz2', '', None))
+def test_new_output_storage_wrong_mode(mode):
+    with pytest.raises(ValueError):
+        new_output_storage(mode)
+
+
+def _retained_size(storage: str, lines: int = 100000):
+    code = f'for i in range({lines}): print("compiling module_%d.c: warning: implicit declaration" % (i % 50))'
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = run([pathlib.Path(sys.executable), '-c', code], mute=True, storage=storage)
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    raw_size = sum(len(line) + 1 for line in result.lines)
+    return result, size, raw_size
+
+
+def test_lazy_result():
+    code = 'print("a"); print("b")'
+    result = run([pathlib.Path(sys.executable), '-c', code], mute=True, storage='indexed')
+    output, return_code = result
+    assert ('a\nb', 0) == (output, return_code)
+    assert ('a\nb', 0) == result
+    assert 'a\nb' == result[0] == result.output
+    assert ('a\nb',) == result[:1]
+    assert 0 in result
+    assert "('a\\nb', 0)" == repr(result)
+    assert hash(('a\nb', 0)) == hash(result)
+
+
+def test_run_indexed_retained_size():
+    result, size, raw_size = _retained_size('indexed')
+    print(f'indexed: {size / 1e6:.1f} MB retained for {raw_size / 1e6:.1f} MB of output')
+    # the encoded lines and their offsets, without the decoded output string
+    assert size < raw_size * 1.5
+    assert 'implicit declaration' in result.tail(1)[0]
+
+
+@pytest.mark.parametrize('storage', ('zlib', 'lzma'))
+def test_run_compressed_retained_size(storage):
+    result, size, raw_size = _retained_size(storage)
+    print(f'{storage}: {size / 1e6:.2f} MB retained for {raw_size / 1e6:.1f} MB of output')
+    # an order of magnitude less than the output, which is never kept decoded
+    assert size * 10 < raw_size
+    assert 100000 == len(result.lines)
@@ -0,0 +1,72 @@
+# coding=utf-8
+
+import pytest
+
+# noinspection PyProtectedMember
+from elib_run._run import _run
+from elib_run._run._parsers import CallableParser, JsonLinesParser, LineParser, RegexParser
+
+
+@pytest.mark.parametrize(
+    'line,expected',
+    (
+        ['src/main.c:12:3: warning: unused variable', {'file': 'src/main.c', 'line': '12', 'level': 'warning'}],
+        ['some other line', None],
+    )
+)
+def test_regex_parser(line, expected):
+    parser = RegexParser(r'(?P<file>[^:]+):(?P<line>\d+):\d+: (?P<level>\w+):')
+    assert expected == parser.parse(line)
+    assert parser.pattern.pattern == parser.name
+
+
+@pytest.mark.parametrize(
+    'line,expected',
+    (
+        ['{"passed": 3, "failed": 1}', {'passed': 3, 'failed': 1}],
+        ['  [1, 2]', [1, 2]],
+        ['{not json', None],
+        ['plain text', None],
+        ['"string"', None],
+    )
+)
+def test_json_lines_parser(line, expected):
+    assert expected == JsonLinesParser().parse(line)
+
+
+def test_callable_parser():
+    def count_words(line):
+        return len(line.split()) or None
+
+    parser = CallableParser(count_words)
+    assert 'count_words' == parser.name
+    assert 3 == parser.parse('some random words')
+    assert parser.parse('') is None
+
+
+@pytest.mark.parametrize(
+    'factory',
+    (
+        lambda: LineParser(1),
+        lambda: RegexParser(1),
+        lambda: CallableParser('not callable'),
+    )
+)
+def test_wrong_values(factory):
+    with pytest.raises(TypeError):
+        factory()
+
+
+def test_base_parser():
+    with pytest.raises(NotImplementedError):
+        LineParser('base').parse('line')
+
+
+def test_sanitize_parsers():
+    json_parser = JsonLinesParser()
+    result = _run._sanitize_parsers([json_parser, str.upper])
+    assert json_parser is result[0]
+    assert isinstance(result[1], CallableParser)
+    assert _run._sanitize_parsers(None) is None
+    with pytest.raises(TypeError):
+        _run._sanitize_parsers(['string'])
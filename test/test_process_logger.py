@@ -0,0 +1,67 @@
+# coding=utf-8
+
+import logging
+import time
+
+# noinspection PyProtectedMember
+from elib_run._run._process_logger import ProcessLogger
+
+
+def test_first_line_is_logged_right_away(caplog):
+    caplog.set_level(10, 'elib_run.process')
+    process_logger = ProcessLogger()
+    process_logger.log_line('first line')
+    assert [('elib_run.process', 10, 'first line')] == caplog.record_tuples
+
+
+def test_lines_are_batched(caplog):
+    caplog.set_level(10, 'elib_run.process')
+    process_logger = ProcessLogger(interval=60)
+    for index in range(5):
+        process_logger.log_line(str(index))
+    process_logger.flush()
+    assert ['0', '1\n2\n3\n4'] == [record.message for record in caplog.records]
+
+
+def test_batch_size(caplog):
+    caplog.set_level(10, 'elib_run.process')
+    process_logger = ProcessLogger(interval=60, max_lines=3)
+    for index in range(7):
+        process_logger.log_line(str(index))
+    assert ['0', '1\n2\n3', '4\n5\n6'] == [record.message for record in caplog.records]
+
+
+def test_flush_empty(caplog):
+    caplog.set_level(10, 'elib_run.process')
+    ProcessLogger().flush()
+    assert not caplog.records
+
+
+def test_logger_disabled(caplog):
+    caplog.set_level(20, 'elib_run.process')
+    process_logger = ProcessLogger()
+    process_logger.log_line('some line')
+    process_logger.flush()
+    assert not caplog.records
+
+
+class _SlowHandler(logging.Handler):
+
+    def emit(self, record):
+        time.sleep(0.05)
+
+
+def test_sampling_when_logging_falls_behind():
+    logger = logging.getLogger('test_process_logger.slow')
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = _SlowHandler()
+    logger.addHandler(handler)
+    try:
+        process_logger = ProcessLogger(logger=logger, interval=0.01, max_lines=50)
+        for index in range(200):
+            process_logger.log_line(str(index))
+        process_logger.flush()
+        assert process_logger.suppressed_count > 0
+    finally:
+        logger.removeHandler(handler)
@@ -0,0 +1,102 @@
+# coding=utf-8
+
+import pathlib
+import statistics
+import sys
+import time
+
+import pytest
+
+from elib_run import PtyExecutor, ResourceLimits, Trigger, run
+# noinspection PyProtectedMember
+from elib_run._run._pty import clean_terminal_line
+
+pytestmark = pytest.mark.skipif(sys.platform.startswith('win'), reason='requires POSIX pseudo-terminals')
+
+_PYTHON = pathlib.Path(sys.executable)
+
+
+@pytest.mark.parametrize(
+    'line,expected',
+    (
+        [b'plain', b'plain'],
+        [b'\x1b[31mred\x1b[0m text', b'red text'],
+        [b'\x1b]0;title\x07after', b'after'],
+        [b'10%\r50%\r100%', b'100%'],
+        [b'done\r', b'done'],
+        [b'\x1b[2K\r\x1b[1mbold\x1b[22m', b'bold'],
+        [b'\r', b''],
+    )
+)
+def test_clean_terminal_line(line, expected):
+    assert expected == clean_terminal_line(line)
+
+
+@pytest.mark.parametrize('kwargs,error', (({'columns': 0}, ValueError), ({'rows': '1'}, TypeError)))
+def test_wrong_window_size(kwargs, error):
+    with pytest.raises(error):
+        PtyExecutor(**kwargs)
+
+
+def test_is_a_terminal():
+    code = 'import os, sys; print(sys.stdout.isatty(), sys.stderr.isatty(), os.get_terminal_size())'
+    output, _ = run([_PYTHON, '-c', code], executor=PtyExecutor(columns=100, rows=30))
+    assert 'True True os.terminal_size(columns=100, lines=30)' == output
+
+
+def test_output_and_return_code():
+    code = 'import sys; print("first"); print("\\x1b[32msecond\\x1b[0m", file=sys.stderr); sys.exit(3)'
+    output, return_code = run([_PYTHON, '-c', code], executor=PtyExecutor(), failure_ok=True)
+    assert 3 == return_code
+    assert ['first', 'second'] == sorted(output.split('\n'))
+
+
+def test_no_strip():
+    code = 'print("\\x1b[32mgreen\\x1b[0m")'
+    output, _ = run([_PYTHON, '-c', code], executor=PtyExecutor(strip_control=False))
+    assert '\x1b[32mgreen\x1b[0m' == output
+
+
+def test_unterminated_line():
+    output, _ = run([_PYTHON, '-c', 'import sys; sys.stdout.write("no line feed")'], executor=PtyExecutor())
+    assert 'no line feed' == output
+
+
+def test_line_buffered(monkeypatch):
+    # without a terminal, "ready" would stay in the child's buffer until it exits
+    monkeypatch.delenv('PYTHONUNBUFFERED', raising=False)
+    code = 'import time; print("ready"); time.sleep(30)'
+    start = time.monotonic()
+    output, _ = run([_PYTHON, '-c', code], executor=PtyExecutor(), triggers=Trigger('ready', action='kill'),
+                    failure_ok=True)
+    assert 'ready' == output
+    assert time.monotonic() - start < 10
+
+
+def test_limits():
+    code = 'import resource; print(resource.getrlimit(resource.RLIMIT_NOFILE)[0])'
+    output, _ = run([_PYTHON, '-c', code], executor=PtyExecutor(), limits=ResourceLimits(open_files=64))
+    assert '64' == output
+
+
+def test_sampling():
+    result = run([_PYTHON, '-c', 'import time; time.sleep(0.5)'], executor=PtyExecutor(), sample_interval=0.1)
+    assert result.samples
+
+
+@pytest.mark.long
+def test_latency_benchmark(monkeypatch):
+    monkeypatch.delenv('PYTHONUNBUFFERED', raising=False)
+    code = 'import time\nfor _ in range(20):\n    print(time.time())\n    time.sleep(0.05)'
+
+    def _latencies(executor) -> float:
+        latencies = []
+        trigger = Trigger('.*', action='callback', callback=lambda line: latencies.append(time.time() - float(line)))
+        run([_PYTHON, '-c', code], executor=executor, mute=True, triggers=trigger)
+        assert 20 == len(latencies)
+        return statistics.median(latencies)
+
+    pipe, terminal = _latencies(None), _latencies(PtyExecutor())
+    print(f'median latency from print to capture: {pipe * 1000:.1f} ms through a pipe, '
+          f'{terminal * 1000:.1f} ms through a pseudo-terminal')
+    assert terminal < pipe
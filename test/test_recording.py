@@ -0,0 +1,128 @@
+# coding=utf-8
+
+import json
+import pathlib
+import sys
+import time
+
+import pytest
+import sarge
+from mockito import verify, when
+
+import elib_run
+from elib_run import PtyExecutor, Recorder, RecordingNotFoundError, recording, run
+# noinspection PyProtectedMember
+from elib_run._run import _recording
+# noinspection PyProtectedMember
+from elib_run._run._agent import LocalAgent
+
+_CMD = [pathlib.Path(sys.executable), '-c', 'import time; print("first"); time.sleep(0.3); print("second")']
+
+
+def test_record_then_replay(tmpdir):
+    fixture = pathlib.Path(str(tmpdir), 'fixture.json')
+    with recording(fixture, mode='record'):
+        output, return_code = run(_CMD)
+    assert 'first\nsecond' == output
+    assert 0 == return_code
+    content = json.loads(fixture.read_text(encoding='utf8'))
+    assert 1 == len(content['runs'])
+    assert 0 == content['runs'][0]['return_code']
+    when(sarge.Command).run(...)
+    with recording(fixture, mode='replay'):
+        result = run(_CMD)
+    verify(sarge.Command, times=0).run(...)
+    assert ('first\nsecond', 0) == result
+
+
+@pytest.mark.parametrize('executor', ('pty', 'socket'))
+def test_record_then_replay_with_executor(executor, tmpdir):
+    if executor == 'pty':
+        if sys.platform.startswith('win'):
+            pytest.skip('requires POSIX pseudo-terminals')
+        agent = None
+        executor = PtyExecutor()
+    else:
+        agent = LocalAgent().start()
+        executor = agent.executor
+    fixture = pathlib.Path(str(tmpdir), 'fixture.json')
+    try:
+        with recording(fixture, mode='record'):
+            assert ('first\nsecond', 0) == run(_CMD, executor=executor)
+    finally:
+        if agent is not None:
+            agent.stop()
+    content = json.loads(fixture.read_text(encoding='utf8'))
+    assert content['runs'][0]['chunks']
+    with recording(fixture, mode='replay'):
+        assert ('first\nsecond', 0) == run(_CMD, executor=executor)
+
+
+def test_replay_pacing(tmpdir):
+    fixture = pathlib.Path(str(tmpdir), 'fixture.json')
+    with recording(fixture, mode='record'):
+        run(_CMD)
+    start = time.monotonic()
+    with recording(fixture, mode='replay', pacing='instant'):
+        run(_CMD)
+    instant = time.monotonic() - start
+    start = time.monotonic()
+    with recording(fixture, mode='replay', pacing='original'):
+        run(_CMD)
+    original = time.monotonic() - start
+    assert original >= 0.25
+    assert instant < original
+
+
+def test_replay_not_found(tmpdir):
+    fixture = pathlib.Path(str(tmpdir), 'fixture.json')
+    with recording(fixture, mode='replay'):
+        with pytest.raises(RecordingNotFoundError):
+            run(_CMD)
+    assert not fixture.exists()
+
+
+def test_auto_mode(tmpdir):
+    fixture = pathlib.Path(str(tmpdir), 'fixture.json')
+    with recording(fixture) as recorder:
+        run(_CMD)
+    assert recorder.dirty is False
+    assert fixture.exists()
+    with recording(fixture) as recorder:
+        run(_CMD)
+    assert recorder.dirty is False
+
+
+def test_replay_in_order(tmpdir):
+    fixture = pathlib.Path(str(tmpdir), 'fixture.json')
+    recorder = Recorder(fixture, mode='record')
+    recorder.add(_recording._Recording(('cmd', 'arg'), [(0.0, b'one\n')], 0))
+    recorder.add(_recording._Recording(('cmd', 'arg'), [(0.0, b'two\n')], 1))
+    recorder.save()
+    recorder = Recorder(fixture, mode='replay')
+    assert b'one\n' == recorder._next_recording(('cmd', 'arg')).chunks[0][1]
+    assert 1 == recorder._next_recording(('cmd', 'arg')).return_code
+    assert 1 == recorder._next_recording(('cmd', 'arg')).return_code
+    assert recorder._next_recording(('other',)) is None
+
+
+def test_replay_binary_chunks(tmpdir):
+    fixture = pathlib.Path(str(tmpdir), 'fixture.json')
+    recorder = Recorder(fixture, mode='record')
+    recorder.add(_recording._Recording(('cmd',), [(0.5, b'\xff\x00\n')], 0))
+    recorder.save()
+    replayed = Recorder(fixture, mode='replay')._next_recording(('cmd',))
+    assert [(0.5, b'\xff\x00\n')] == replayed.chunks
+
+
+def test_unsupported_fixture_version(tmpdir):
+    fixture = pathlib.Path(str(tmpdir), 'fixture.json')
+    fixture.write_text(json.dumps({'version': 0, 'runs': []}), encoding='utf8')
+    with pytest.raises(elib_run.ELIBRunError):
+        Recorder(fixture)
+
+
+@pytest.mark.parametrize('kwargs', ({'mode': 'unknown'}, {'pacing': 'unknown'}))
+def test_wrong_values(kwargs, tmpdir):
+    with pytest.raises(ValueError):
+        Recorder(pathlib.Path(str(tmpdir), 'fixture.json'), **kwargs)
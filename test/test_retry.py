@@ -0,0 +1,116 @@
+# coding=utf-8
+
+import time
+import types
+
+import pytest
+from mockito import when
+
+# noinspection PyProtectedMember
+from elib_run._run import _run
+from elib_run._run._retry import RetryPolicy
+
+
+@pytest.mark.parametrize(
+    'policy,attempt_number,return_code,output,expected',
+    (
+        [RetryPolicy(), 1, 0, [], False],
+        [RetryPolicy(), 1, 1, [], True],
+        [RetryPolicy(), 3, 1, [], False],
+        [RetryPolicy(return_codes=[2]), 1, 1, [], False],
+        [RetryPolicy(return_codes=[2]), 1, 2, [], True],
+        [RetryPolicy(patterns=['.*timed out']), 1, 1, ['connection timed out'], True],
+        [RetryPolicy(patterns=['.*timed out']), 1, 1, ['some error'], False],
+        [RetryPolicy(return_codes=[2], patterns=['.*timed out']), 1, 1, ['connection timed out'], True],
+    )
+)
+def test_should_retry(policy, attempt_number, return_code, output, expected):
+    assert expected is policy.should_retry(attempt_number, return_code, output)
+
+
+def test_delay():
+    policy = RetryPolicy(backoff=1, factor=2, max_backoff=5, jitter=0)
+    assert [1, 2, 4, 5, 5] == [policy.delay(retry_number) for retry_number in range(1, 6)]
+
+
+def test_delay_jitter():
+    policy = RetryPolicy(backoff=1, jitter=0.5)
+    for _ in range(100):
+        assert 0.5 <= policy.delay(1) <= 1.5
+
+
+@pytest.mark.parametrize(
+    'kwargs',
+    (
+        {'max_attempts': 0},
+        {'backoff': -1},
+        {'factor': 0.5},
+        {'jitter': 2},
+        {'patterns': [1]},
+    )
+)
+def test_wrong_values(kwargs):
+    with pytest.raises((TypeError, ValueError)):
+        RetryPolicy(**kwargs)
+
+
+_FLAKY = '''
+import pathlib, sys
+counter = pathlib.Path("counter")
+count = int(counter.read_text()) if counter.exists() else 0
+counter.write_text(str(count + 1))
+print(f"attempt {count}")
+sys.exit(0 if count == 2 else 3)
+'''
+
+
+def test_run_retries(python_context):
+    context = python_context(_FLAKY)
+    when(_run)._build_context(...).thenReturn(context)
+    result = _run.run('python', retry=RetryPolicy(return_codes=[3], backoff=0.01))
+    assert ('attempt 2', 0) == result
+    assert [3, 3, 0] == [attempt.return_code for attempt in result.attempts]
+    assert all(attempt.duration > 0 for attempt in result.attempts)
+    assert 0 == result.attempts[0].delay
+    assert result.attempts[1].delay > 0
+
+
+def test_run_gives_up(python_context):
+    context = python_context(_FLAKY)
+    when(_run)._build_context(...).thenReturn(context)
+    result = _run.run('python', retry=RetryPolicy(max_attempts=2, backoff=0.01), failure_ok=True)
+    assert ('attempt 1', 3) == result
+    assert 2 == len(result.attempts)
+
+
+def test_run_no_retry(python_context):
+    context = python_context('print("once")')
+    when(_run)._build_context(...).thenReturn(context)
+    result = _run.run('python')
+    assert 1 == len(result.attempts)
+
+
+def test_run_retries_timeout(python_context):
+    context = python_context('import time; time.sleep(5)', timeout=0.1)
+    when(_run)._build_context(...).thenReturn(context)
+    with pytest.raises(_run.ProcessTimeoutError):
+        _run.run('python', retry=RetryPolicy(max_attempts=2, backoff=0.01, retry_on_timeout=True))
+    assert [True, True] == [attempt.timed_out for attempt in context.attempts]
+
+
+def test_run_releases_governor_while_waiting(monkeypatch, python_context):
+    in_flight_while_waiting = []
+
+    def _sleep(delay):
+        in_flight_while_waiting.append(_run.GOVERNOR.metrics.in_flight)
+        time.sleep(delay)
+
+    monkeypatch.setattr(_run, 'time', types.SimpleNamespace(monotonic=time.monotonic, sleep=_sleep))
+    context = python_context(_FLAKY)
+    when(_run)._build_context(...).thenReturn(context)
+    in_flight = _run.GOVERNOR.metrics.in_flight
+    admitted = _run.GOVERNOR.metrics.admitted
+    _run.run('python', retry=RetryPolicy(return_codes=[3], backoff=0.01))
+    assert [in_flight, in_flight] == in_flight_while_waiting
+    assert admitted + 3 == _run.GOVERNOR.metrics.admitted
+    assert in_flight == _run.GOVERNOR.metrics.in_flight
@@ -1,13 +1,22 @@
 # coding=utf-8
 
+import pathlib
+import sys
+import time
 
 import pytest
 from mockito import expect, mock, verify, verifyNoUnwantedInteractions, verifyStubbedInvocationsAreUsed, when
 
+import elib_run
 # noinspection PyProtectedMember
 from elib_run._run import _run
 
 
+def test_exports():
+    assert len(set(elib_run.__all__)) == len(elib_run.__all__)
+    assert all(hasattr(elib_run, name) for name in elib_run.__all__)
+
+
 @pytest.mark.parametrize(
     'mute',
     [True, False]
@@ -121,3 +130,79 @@ def test_run(mute):
     expect(_run).check_error(...)
     _run.run('cmd', mute=mute)
     verifyNoUnwantedInteractions()
+
+
+def test_parse_cmd_cached():
+    when(_run).find_executable(...).thenReturn('dummy')
+    when(_run.shlex).split(...).thenCallOriginalImplementation()
+    _run._split_cmd.cache_clear()
+    for _ in range(10):
+        assert ('dummy', ['some', 'quoted args']) == _run._parse_cmd('cmd some "quoted args"')
+    verify(_run.shlex, times=1).split(...)
+
+
+def test_parse_cmd_cached_result_is_a_copy():
+    when(_run).find_executable(...).thenReturn('dummy')
+    _, args_list = _run._parse_cmd('cmd some args')
+    args_list.append('other')
+    assert ('dummy', ['some', 'args']) == _run._parse_cmd('cmd some args')
+
+
+@pytest.mark.parametrize(
+    'cmd,expected_args',
+    (
+        [['cmd'], []],
+        [('cmd', 'some', 'args'), ['some', 'args']],
+        [['cmd', 'arg with spaces', pathlib.Path('some_file')], ['arg with spaces', 'some_file']],
+    )
+)
+def test_parse_argv(cmd, expected_args):
+    when(_run).find_executable('cmd').thenReturn('dummy')
+    when(_run.shlex).split(...)
+    assert ('dummy', expected_args) == _run._parse_cmd(cmd)
+    verify(_run.shlex, times=0).split(...)
+
+
+def test_parse_argv_exe_path():
+    exe = pathlib.Path('some dir', 'test.exe')
+    exe.parent.mkdir()
+    exe.touch()
+    when(_run).find_executable(...)
+    assert (exe, ['arg']) == _run._parse_cmd([exe, 'arg'])
+    assert (exe, []) == _run._parse_cmd(exe)
+    verify(_run, times=0).find_executable(...)
+
+
+def test_parse_argv_exe_path_not_found():
+    with pytest.raises(_run.ExecutableNotFoundError):
+        _run._parse_cmd([pathlib.Path('missing.exe')])
+
+
+@pytest.mark.parametrize('cmd', ([], [1], ['cmd', 1], ['cmd', None], 1, None, {'k': 'v'}))
+def test_parse_argv_wrong_value(cmd):
+    with pytest.raises((TypeError, ValueError)):
+        _run._parse_cmd(cmd)
+
+
+def test_idle_timeout():
+    cmd = [pathlib.Path(sys.executable), '-u', '-c', 'import time; print("started"); time.sleep(30)']
+    start = time.monotonic()
+    with pytest.raises(_run.ProcessTimeoutError) as exc_info:
+        _run.run(cmd, timeout=30, idle_timeout=0.5)
+    assert time.monotonic() - start < 10
+    assert 'idle' == exc_info.value.kind
+    assert 0.5 == exc_info.value.timeout
+    assert 'no output' in str(exc_info.value)
+
+
+def test_idle_timeout_active_process():
+    code = 'import time\nfor _ in range(10):\n    print("tick", flush=True)\n    time.sleep(0.1)'
+    output, return_code = _run.run([pathlib.Path(sys.executable), '-c', code], idle_timeout=0.5)
+    assert 0 == return_code
+    assert 10 == len(output.split('\n'))
+
+
+def test_wall_timeout_kind():
+    with pytest.raises(_run.ProcessTimeoutError) as exc_info:
+        _run.run([pathlib.Path(sys.executable), '-c', 'import time; time.sleep(30)'], timeout=0.3, idle_timeout=10)
+    assert 'wall' == exc_info.value.kind
@@ -42,6 +42,7 @@ def dummy_kwargs() -> dict:
         ('args_list', ('string', 1, 1.1, {'k': 'v'}, pathlib.Path('.'), sarge.Capture())),
         ('paths', ('string', 1, 1.1, {'k': 'v'}, pathlib.Path('.'), sarge.Capture())),
         ('filters', ('string', 1, 1.1, {'k': 'v'}, pathlib.Path('.'), sarge.Capture())),
+        ('triggers', ('string', 1, 1.1, {'k': 'v'}, ['string'], pathlib.Path('.'), sarge.Capture())),
     )
 )
 def test_wrong_init(arg_name, wrong_values, dummy_kwargs):
@@ -89,7 +90,7 @@ def test_start_process(dummy_kwargs):
     command = mock()
     when(command).run(async_=True)
     context = _run_context.RunContext(**dummy_kwargs)
-    setattr(context, '_command', command)
+    context._command = command
     assert context.start_time == 0
     verifyZeroInteractions()
     context.start_process()
@@ -100,13 +101,13 @@ def test_start_process(dummy_kwargs):
 
 def test_process_timed_out(dummy_kwargs):
     context = _run_context.RunContext(**dummy_kwargs)
-    setattr(context, '_started', True)
+    context._started = True
     assert context.process_timed_out()
 
 
 def test_process_not_timed_out(dummy_kwargs):
     context = _run_context.RunContext(**dummy_kwargs)
-    setattr(context, '_started', True)
+    context._started = True
     context.start_time = time.monotonic()
     assert not context.process_timed_out()
 
@@ -121,7 +122,7 @@ def test_process_finished(dummy_kwargs):
     command = mock()
     when(command).poll().thenReturn(None).thenReturn(0)
     context = _run_context.RunContext(**dummy_kwargs)
-    setattr(context, '_command', command)
+    context._command = command
     assert not context.process_finished()
     assert context.process_finished()
     verifyNoUnwantedInteractions()
@@ -227,7 +228,7 @@ def test_command(dummy_kwargs):
     ).thenReturn(command)
     for _ in range(10):
         assert command is context.command
-        assert getattr(context, '_command') is command
+        assert context._command is command
     verify(sarge).Command(
         [context.exe_path_as_str] + context.args_list,
         stdout=context.capture,
@@ -235,3 +236,87 @@ def test_command(dummy_kwargs):
         shell=False,
         cwd=context.cwd,
     )
+
+
+def test_kill_process(dummy_kwargs):
+    command = mock()
+    when(command).poll().thenReturn(None)
+    when(command).terminate()
+    when(command).wait()
+    context = _run_context.RunContext(**dummy_kwargs)
+    context._command = command
+    context._started = True
+    context.kill_process()
+    verifyStubbedInvocationsAreUsed()
+
+
+def test_kill_process_not_started(dummy_kwargs):
+    context = _run_context.RunContext(**dummy_kwargs)
+    with pytest.raises(RuntimeError):
+        context.kill_process()
+
+
+def test_no_instance_dict(dummy_kwargs):
+    context = _run_context.RunContext(**dummy_kwargs)
+    assert not hasattr(context, '__dict__')
+    with pytest.raises(AttributeError):
+        context.some_attribute = True
+
+
+def test_repr(dummy_kwargs):
+    context = _run_context.RunContext(**dummy_kwargs)
+    context.process_output_chunks.append('some output')
+    assert repr(context).startswith(f'RunContext(exe_path={dummy_kwargs["exe_path"]!r}, ')
+    assert 'some output' not in repr(context)
+
+
+def test_skip_validation(dummy_kwargs):
+    wrong_kwargs = dummy_kwargs.copy()
+    wrong_kwargs['args_list'] = [1, 2, 3]
+    context = _run_context.RunContext(**wrong_kwargs, validate=False)
+    context.validate(deep=False)
+    with pytest.raises(TypeError):
+        context.validate()
+
+
+@pytest.mark.long
+def test_construction_benchmark(dummy_kwargs):
+    dummy_kwargs['args_list'] = [f'arg_{index}' for index in range(1000)]
+    dummy_kwargs['filters'] = [f'filter_{index}' for index in range(1000)]
+
+    def _time(validate: bool) -> float:
+        start = time.perf_counter()
+        for _ in range(1000):
+            _run_context.RunContext(**dummy_kwargs, validate=validate)
+        return time.perf_counter() - start
+
+    validated, unvalidated = _time(True), _time(False)
+    print(f'RunContext construction (1k args, 1k filters): {validated * 1000:.3f} us validated, '
+          f'{unvalidated * 1000:.3f} us unvalidated')
+    assert unvalidated < validated
+
+
+@pytest.mark.parametrize('storage', ('list', 'compact', 'zlib', 'lzma', 'indexed'))
+def test_storage(dummy_kwargs, storage):
+    context = _run_context.RunContext(**dummy_kwargs, storage=storage)
+    for line in ('first', 'repeated', 'repeated', 'last'):
+        context.process_output_chunks.append(line)
+    assert 'first\nrepeated\nrepeated\nlast' == context.process_output_as_str
+
+
+def test_process_idle_timed_out(dummy_kwargs):
+    context = _run_context.RunContext(**dummy_kwargs, idle_timeout=5)
+    context._started = True
+    context.start_time = time.monotonic()
+    context.last_output_time = context.start_time
+    assert context.process_timed_out() is None
+    context.last_output_time -= 10
+    assert 'idle' == context.process_timed_out()
+    context.start_time -= 10000
+    assert 'wall' == context.process_timed_out()
+
+
+@pytest.mark.parametrize('idle_timeout,error', (('1', TypeError), (0, ValueError), (-1, ValueError)))
+def test_wrong_idle_timeout(dummy_kwargs, idle_timeout, error):
+    with pytest.raises(error):
+        _run_context.RunContext(**dummy_kwargs, idle_timeout=idle_timeout)
@@ -0,0 +1,82 @@
+# coding=utf-8
+
+import os
+import pathlib
+import sys
+import time
+
+import pytest
+
+from elib_run import ELIBRunError, ResourceSampler, run
+# noinspection PyProtectedMember
+from elib_run._run import _sampler
+
+_PYTHON = pathlib.Path(sys.executable)
+
+pytestmark = pytest.mark.skipif(not os.path.isdir('/proc'), reason='requires /proc')
+
+
+@pytest.mark.parametrize('interval,error', ((0, ValueError), (-1, ValueError), ('1', TypeError)))
+def test_wrong_interval(interval, error):
+    with pytest.raises(error):
+        ResourceSampler(interval)
+
+
+def test_unsupported_platform(monkeypatch):
+    monkeypatch.setattr(_sampler, '_PROC', '/missing')
+    with pytest.raises(ELIBRunError):
+        ResourceSampler()
+
+
+def test_sample_self():
+    sampler = ResourceSampler(descendants=False)
+    start = time.monotonic()
+    sample = sampler.sample(os.getpid(), start, start + 1)
+    assert 1 == sample.time
+    assert sample.rss > 0
+    assert sample.threads >= 1
+    assert 1 == sample.processes
+    assert [sample] == sampler.samples
+    assert sample.rss == sampler.peak_rss
+    sampler.reset()
+    assert [] == sampler.samples
+    assert 0 == sampler.peak_rss
+    assert 0 == sampler.mean_cpu_percent
+
+
+def test_sample_gone_process():
+    sampler = ResourceSampler()
+    assert sampler.sample(2 ** 22 + 1, time.monotonic()) is None
+    assert [] == sampler.samples
+
+
+def test_sample_if_due():
+    sampler = ResourceSampler(interval=10)
+    start = time.monotonic()
+    sampler.sample_if_due(os.getpid(), start)
+    assert [] == sampler.samples
+    sampler.sample_if_due(None, start - 20)
+    assert [] == sampler.samples
+    sampler.sample_if_due(os.getpid(), start - 20)
+    assert 1 == len(sampler.samples)
+    sampler.sample_if_due(os.getpid(), start - 20)
+    assert 1 == len(sampler.samples)
+
+
+def test_run_samples():
+    code = 'import time\nblob = bytearray(50 * 1024 * 1024)\nend = time.time() + 0.6\nwhile time.time() < end: pass'
+    result = run([_PYTHON, '-c', code], sample_interval=0.1)
+    assert len(result.samples) >= 3
+    assert max(sample.rss for sample in result.samples) > 50 * 1024 * 1024
+    assert max(sample.cpu_percent for sample in result.samples) > 20
+    assert all(later.time > earlier.time for earlier, later in zip(result.samples, result.samples[1:]))
+
+
+def test_run_samples_descendants():
+    code = 'import subprocess, sys; subprocess.run([sys.executable, "-c", "import time; time.sleep(0.5)"])'
+    result = run([_PYTHON, '-c', code], sample_interval=0.1)
+    assert max(sample.processes for sample in result.samples) == 2
+
+
+def test_run_no_sampling():
+    assert [] == run([_PYTHON, '-c', 'pass']).samples
@@ -0,0 +1,149 @@
+# coding=utf-8
+
+import heapq
+import pathlib
+import random
+import sys
+
+import pytest
+
+import elib_run
+from elib_run import BatchScheduler, HistoryStore
+# noinspection PyProtectedMember
+from elib_run._run._history import history_key
+
+_PYTHON = pathlib.Path(sys.executable)
+
+
+def _cmd(name: str, sleep: float = 0.0):
+    return [_PYTHON, '-c', f'import time; time.sleep({sleep}); print({name!r})']
+
+
+def _record(store: HistoryStore, cmd, duration: float, peak_rss=None):
+    store.record(history_key(cmd[0], cmd[1:]), duration, peak_rss)
+
+
+def _simulate(scheduler: BatchScheduler, durations, in_add_order: bool = False) -> float:
+    """Makespan of the batch with the scheduler policy, in simulated time"""
+    pending = list(scheduler.batch) if in_add_order else scheduler.order()
+    running = []  # (end time, index, job)
+    now = 0.0
+    memory = 0
+    while pending or running:
+        job = scheduler.next_job(pending, memory, len(running))
+        while job is not None:
+            pending.remove(job)
+            memory += job.expected_rss
+            heapq.heappush(running, (now + durations[job.index], job.index, job))
+            job = scheduler.next_job(pending, memory, len(running))
+        now, _, job = heapq.heappop(running)
+        memory -= job.expected_rss
+    return now
+
+
+def test_order():
+    store = HistoryStore()
+    scheduler = BatchScheduler(store, jobs=2)
+    commands = [_cmd(name) for name in 'abcd']
+    for cmd, duration in zip(commands[:3], (1.0, 5.0, 3.0)):
+        _record(store, cmd, duration)
+    for cmd in commands:
+        scheduler.add(cmd)
+    # never ran: first
+    assert [3, 1, 2, 0] == [job.index for job in scheduler.order()]
+
+
+def test_memory_budget():
+    store = HistoryStore()
+    scheduler = BatchScheduler(store, jobs=4, memory_budget=1000)
+    commands = [_cmd(name) for name in 'abc']
+    _record(store, commands[0], 10.0, peak_rss=800)
+    _record(store, commands[1], 5.0, peak_rss=800)
+    _record(store, commands[2], 1.0, peak_rss=100)
+    for cmd in commands:
+        scheduler.add(cmd)
+    pending = scheduler.order()
+    first = scheduler.next_job(pending, 0, 0)
+    assert 0 == first.index
+    pending.remove(first)
+    # the second longest does not fit next to the first one: the next one that fits goes
+    assert 2 == scheduler.next_job(pending, 800, 1).index
+    assert scheduler.next_job(pending[:1], 900, 2) is None
+    # a job always starts when nothing runs, even over budget
+    assert 1 == scheduler.next_job(pending[:1], 0, 0).index
+
+
+def test_simulated_makespan():
+    store = HistoryStore()
+    scheduler = BatchScheduler(store, jobs=4)
+    # 40 short jobs, with 3 long ones queued last: the typical worst case for arrival order
+    durations = [1.0] * 40 + [20.0] * 3
+    for index, duration in enumerate(durations):
+        cmd = _cmd(str(index))
+        _record(store, cmd, duration)
+        scheduler.add(cmd)
+    fifo = _simulate(scheduler, durations, in_add_order=True)
+    longest_first = _simulate(scheduler, durations)
+    print(f'makespan: arrival order {fifo:.0f}, longest first {longest_first:.0f} (optimum 25)')
+    assert 30.0 == fifo
+    assert 25.0 == longest_first
+
+
+def test_simulated_makespan_random():
+    rng = random.Random(42)
+    store = HistoryStore()
+    scheduler = BatchScheduler(store, jobs=8)
+    durations = [rng.lognormvariate(0, 1.5) for _ in range(500)]
+    for index, duration in enumerate(durations):
+        cmd = _cmd(str(index))
+        _record(store, cmd, duration)
+        scheduler.add(cmd)
+    fifo = _simulate(scheduler, durations, in_add_order=True)
+    longest_first = _simulate(scheduler, durations)
+    lower_bound = max(max(durations), sum(durations) / 8)
+    print(f'makespan: arrival order {fifo:.1f}, longest first {longest_first:.1f}, lower bound {lower_bound:.1f}')
+    assert longest_first < fifo
+    assert longest_first <= lower_bound * 4 / 3
+
+
+def test_run_records_and_reorders():
+    store = HistoryStore()
+    commands = [_cmd('short'), _cmd('long', 0.5)]
+    scheduler = BatchScheduler(store, jobs=1)
+    for cmd in commands:
+        scheduler.add(cmd)
+    jobs = scheduler.run()
+    assert ['short', 'long'] == [job.result.output for job in jobs]
+    assert all(job.error is None for job in jobs)
+
+    scheduler = BatchScheduler(store, jobs=1)
+    for cmd in commands:
+        scheduler.add(cmd)
+    assert 1 == scheduler.order()[0].index
+    assert 2 == scheduler.batch[1].stats.runs + scheduler.batch[0].stats.runs
+
+
+def test_run_failures():
+    store = HistoryStore()
+    scheduler = BatchScheduler(store, jobs=2)
+    scheduler.add([_PYTHON, '-c', 'import sys; sys.exit(3)'])
+    scheduler.add([_PYTHON, '-c', 'import time; time.sleep(10)'], timeout=0.5)
+    failed, timed_out = scheduler.run()
+    assert 3 == failed.result.return_code
+    assert isinstance(timed_out.error, elib_run.ELIBRunError)
+
+
+def test_run_wrong_options():
+    scheduler = BatchScheduler(HistoryStore(), jobs=2)
+    scheduler.add([_PYTHON, '-c', ''], storage='bogus')
+    scheduler.add([_PYTHON, '-c', 'print("ok")'])
+    wrong, right = scheduler.run()
+    assert wrong.result is None
+    assert isinstance(wrong.error, ValueError)
+    assert 'ok' == right.result.output
+    assert right.error is None
+
+
+def test_wrong_history():
+    with pytest.raises(TypeError):
+        BatchScheduler('history.db')
@@ -0,0 +1,123 @@
+# coding=utf-8
+
+import os
+import pathlib
+import sys
+import time
+
+import pytest
+from mockito import verify, when
+
+from elib_run import ShardedResult, run_sharded
+# noinspection PyProtectedMember
+from elib_run._run import _run, _shard
+
+# prints its arguments, one per line
+_ECHO = [pathlib.Path(sys.executable), '-c', 'import sys; print("\\n".join(sys.argv[1:]))']
+
+
+@pytest.mark.parametrize('count,shards,expected', (
+    (10, 3, [4, 4, 2]),
+    (10, 1, [10]),
+    (3, 5, [1, 1, 1]),
+    (0, 4, []),
+))
+def test_split_arguments(count, shards, expected):
+    args = [str(index) for index in range(count)]
+    result = _shard.split_arguments(args, shards, limit=1024 * 1024)
+    assert expected == [len(shard) for shard in result]
+    assert args == [arg for shard in result for arg in shard]
+
+
+def test_split_arguments_respects_limit():
+    args = ['x' * 100] * 1000
+    limit = 10000
+    result = _shard.split_arguments(args, 1, limit, base_size=500)
+    assert len(result) > 1
+    for shard in result:
+        assert 500 + sum(_shard.argument_size(arg) for arg in shard) <= limit
+    assert args == [arg for shard in result for arg in shard]
+
+
+def test_split_arguments_too_long():
+    with pytest.raises(ValueError):
+        _shard.split_arguments(['x' * 1000], 1, limit=500)
+
+
+def test_argument_limit():
+    limit = _shard.argument_limit()
+    assert 0 < limit
+    if sys.platform != 'win32':
+        assert limit < os.sysconf('SC_ARG_MAX')
+
+
+def test_run_sharded():
+    args = [f'file_{index}.c' for index in range(100)]
+    result = run_sharded(_ECHO, args, jobs=4, mute=True)
+    assert isinstance(result, ShardedResult)
+    assert 4 == len(result.shards) == len(result.results)
+    output, return_code = result
+    assert 0 == return_code
+    assert args == output.splitlines()
+    assert [] == result.failed
+
+
+def test_run_sharded_deterministic_order():
+    # the first shard finishes last
+    code = 'import sys, time; time.sleep(0.5 if "0" in sys.argv else 0); print(" ".join(sys.argv[1:]))'
+    result = run_sharded([pathlib.Path(sys.executable), '-c', code], [str(index) for index in range(4)],
+                         jobs=4, mute=True)
+    assert ['0', '1', '2', '3'] == result.output.splitlines()
+
+
+def test_run_sharded_size_limit():
+    args = ['x' * 1000] * 50
+    result = run_sharded(_ECHO, args, jobs=2, shards=1, max_arg_size=20000, mute=True)
+    assert len(result.shards) > 2
+    assert args == result.output.splitlines()
+
+
+def test_run_sharded_looks_up_executable_once():
+    when(_run).find_executable(...).thenReturn(pathlib.Path(sys.executable))
+    run_sharded('python -c "print(1)"', ['a', 'b', 'c'], jobs=3, mute=True)
+    verify(_run, times=1).find_executable(...)
+
+
+def test_run_sharded_failure():
+    code = 'import sys; sys.exit(3 if "b" in sys.argv else 0)'
+    cmd = [pathlib.Path(sys.executable), '-c', code]
+    result = run_sharded(cmd, ['a', 'b', 'c'], jobs=3, mute=True, failure_ok=True)
+    assert 3 == result.return_code
+    assert [1] == result.failed
+    with pytest.raises(SystemExit):
+        run_sharded(cmd, ['a', 'b', 'c'], jobs=3, mute=True)
+
+
+@pytest.mark.parametrize('kwargs,error', (
+    ({'jobs': '2'}, TypeError),
+    ({'jobs': -1}, ValueError),
+    ({'shards': 1.5}, TypeError),
+))
+def test_run_sharded_wrong_values(kwargs, error):
+    with pytest.raises(error):
+        run_sharded(_ECHO, ['a'], **kwargs)
+
+
+def test_run_sharded_wrong_argument():
+    with pytest.raises(TypeError):
+        run_sharded(_ECHO, ['a', pathlib.Path('b')])
+
+
+@pytest.mark.long
+def test_run_sharded_uses_cores():
+    code = 'import sys, time; time.sleep(0.2 * len(sys.argv[1:]))'
+    cmd = [pathlib.Path(sys.executable), '-c', code]
+    args = [str(index) for index in range(8)]
+    start = time.monotonic()
+    run_sharded(cmd, args, jobs=1, mute=True)
+    serial = time.monotonic() - start
+    start = time.monotonic()
+    run_sharded(cmd, args, jobs=4, mute=True)
+    parallel = time.monotonic() - start
+    print(f'8 arguments: 1 job {serial:.2f}s, 4 jobs {parallel:.2f}s')
+    assert parallel * 2 < serial
@@ -0,0 +1,199 @@
+# coding=utf-8
+
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import elib_run
+from elib_run import ShutdownError, active_runs, run, shutdown, start
+# noinspection PyProtectedMember
+from elib_run._run import _shutdown
+
+_PYTHON = pathlib.Path(sys.executable)
+_SLEEPER = [_PYTHON, '-u', '-c', 'import time; print("started"); time.sleep(60)']
+# ignores SIGTERM: only a kill stops it
+_STUBBORN = [
+    _PYTHON, '-u', '-c',
+    'import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print("started"); time.sleep(60)',
+]
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    # contexts detached by other tests (some of them mocks)
+    _shutdown._DETACHED.clear()
+    yield
+    _shutdown.reset_shutdown()
+    _shutdown.uninstall_signal_handlers()
+
+
+def _run_in_thread(cmd, results: list):
+    def _target():
+        try:
+            results.append(run(cmd, mute=True, failure_ok=True))
+        except Exception as error:  # pylint: disable=broad-except
+            results.append(error)
+
+    thread = threading.Thread(target=_target)
+    thread.start()
+    return thread
+
+
+def _wait_for_runs(count: int):
+    deadline = time.monotonic() + 10
+    while len(active_runs()) < count or any('started' not in context.process_output_as_str
+                                            for context in active_runs()):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_shutdown_error():
+    assert issubclass(ShutdownError, elib_run.ELIBRunError)
+
+
+def test_registry():
+    assert [] == active_runs()
+    handle = start(_SLEEPER, mute=True)
+    assert [handle.context] == active_runs()
+    handle.kill()
+    assert [] == active_runs()
+    run([_PYTHON, '-c', ''], mute=True)
+    assert [] == active_runs()
+
+
+def test_shutdown_terminates():
+    results: list = []
+    threads = [_run_in_thread(_SLEEPER, results) for _ in range(3)]
+    _wait_for_runs(3)
+    start_time = time.monotonic()
+    assert 0 == shutdown(grace=5)
+    assert time.monotonic() - start_time < 2
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
+    assert 3 == len(results)
+    for result in results:
+        assert 'started' == result.output
+        assert 0 != result.return_code
+    assert [] == active_runs()
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='SIGTERM cannot be ignored on Windows')
+def test_shutdown_kills_after_grace():
+    results: list = []
+    thread = _run_in_thread(_STUBBORN, results)
+    _wait_for_runs(1)
+    start_time = time.monotonic()
+    assert 1 == shutdown(grace=0.5)
+    assert 0.5 <= time.monotonic() - start_time < 3
+    thread.join(5)
+    assert 'started' == results[0].output
+    assert -signal.SIGKILL == results[0].return_code
+
+
+def test_shutdown_drains():
+    results: list = []
+    code = 'import time; print("started"); time.sleep(0.5); print("done")'
+    thread = _run_in_thread([_PYTHON, '-u', '-c', code], results)
+    _wait_for_runs(1)
+    assert 0 == shutdown(grace=5, terminate=False)
+    thread.join(5)
+    assert 'started\ndone' == results[0].output
+    assert 0 == results[0].return_code
+
+
+def test_rejects_new_runs():
+    shutdown(grace=0)
+    assert _shutdown.is_shutting_down()
+    with pytest.raises(ShutdownError):
+        run([_PYTHON, '-c', ''], mute=True)
+    with pytest.raises(ShutdownError):
+        start([_PYTHON, '-c', ''], mute=True)
+    assert [] == active_runs()
+    _shutdown.reset_shutdown()
+    assert 0 == run([_PYTHON, '-c', ''], mute=True).return_code
+
+
+@pytest.mark.parametrize('grace,error', (('1', TypeError), (-1, ValueError)))
+def test_wrong_grace(grace, error):
+    with pytest.raises(error):
+        shutdown(grace)
+    assert not _shutdown.is_shutting_down()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        stat = pathlib.Path(f'/proc/{pid}/stat').read_text()
+    except OSError:
+        return False
+    # zombies are dead, only waiting for their (new) parent to reap them
+    return stat.rsplit(')', 1)[1].split()[0] != 'Z'
+
+
+@pytest.mark.skipif(not pathlib.Path('/proc/self/stat').exists(), reason='needs POSIX signals and /proc')
+def test_signal_handlers():
+    # a parent process running children through elib_run, terminated like a service during a deploy
+    code = '\n'.join((
+        'import pathlib, sys, threading',
+        'import elib_run',
+        'elib_run.install_signal_handlers(grace=0.5)',
+        'cmd = [pathlib.Path(sys.executable), "-c", "import signal, time; '
+        'signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(60)"]',
+        'threads = [threading.Thread(target=elib_run.run, args=(cmd,), kwargs={"failure_ok": True}, daemon=True)',
+        '           for _ in range(3)]',
+        'for thread in threads: thread.start()',
+        'for thread in threads: thread.join()',
+        # keeps serving: only the signal sent again once the shutdown is done ends the process
+        'threading.Event().wait(60)',
+    ))
+    env = dict(os.environ, PYTHONPATH=str(pathlib.Path(elib_run.__file__).parent.parent))
+    parent = subprocess.Popen([sys.executable, '-c', code], env=env)
+    deadline = time.monotonic() + 10
+    children: list = []
+    while len(children) < 3:
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+        pgrep = subprocess.run(['pgrep', '-P', str(parent.pid)], stdout=subprocess.PIPE, check=False)
+        children = [int(pid) for pid in pgrep.stdout.split()]
+    # let the children ignore SIGTERM
+    time.sleep(0.5)
+
+    start_time = time.monotonic()
+    parent.send_signal(signal.SIGTERM)
+    assert -signal.SIGTERM == parent.wait(10)
+    assert time.monotonic() - start_time < 5
+    assert not any(_alive(pid) for pid in children)
+
+
+def test_shutdown_stops_detached_processes():
+    cmd = [_PYTHON, '-u', '-c', 'import time; print("ready"); time.sleep(60)']
+    result = run(cmd, mute=True, triggers=elib_run.Trigger('ready'))
+    context = result.context
+    assert not context.process_finished()
+    assert [context] == active_runs()
+    assert 0 == shutdown(grace=0.5)
+    assert context.process_finished()
+    assert [] == active_runs()
+
+
+def test_detached_process_exits():
+    cmd = [_PYTHON, '-u', '-c', 'import time; print("ready"); time.sleep(0.2)']
+    result = run(cmd, mute=True, triggers=elib_run.Trigger('ready'))
+    assert [result.context] == active_runs()
+    result.context.command.wait()
+    assert [] == active_runs()
+
+
+def test_detached_pruned_on_register():
+    cmd = [_PYTHON, '-u', '-c', 'import time; print("ready"); time.sleep(0.2)']
+    result = run(cmd, mute=True, triggers=elib_run.Trigger('ready'))
+    result.context.command.wait()
+    assert [result.context] == list(_shutdown._DETACHED)
+    run([_PYTHON, '-c', ''], mute=True)
+    assert not _shutdown._DETACHED
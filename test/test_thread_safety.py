@@ -0,0 +1,81 @@
+# coding=utf-8
+
+import concurrent.futures
+import os
+import pathlib
+import shutil
+import sys
+import threading
+import time
+
+import pytest
+
+from elib_run import find_executable, run
+# noinspection PyProtectedMember
+from elib_run import _find_exe
+
+_ECHO = shutil.which('echo')
+
+pytestmark = pytest.mark.skipif(_ECHO is None, reason='requires an "echo" executable')
+
+
+def _run_many(count: int, threads: int) -> float:
+    """
+    :return: runs per second
+    """
+    echo = pathlib.Path(_ECHO)
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(lambda index: run([echo, f'run {index}'], mute=True), range(count)))
+    elapsed = time.perf_counter() - start
+    assert [(f'run {index}', 0) for index in range(count)] == results
+    return count / elapsed
+
+
+def test_concurrent_runs():
+    _run_many(200, 16)
+
+
+def test_concurrent_find_executable(monkeypatch):
+    monkeypatch.setattr(_find_exe, '_KNOWN_EXECUTABLES', {})
+    exe_dir = pathlib.Path('bin').absolute()
+    exe_dir.mkdir()
+    for index in range(50):
+        pathlib.Path(exe_dir, f'tool_{index}.exe').touch()
+    barrier = threading.Barrier(16)
+
+    def _find(_):
+        barrier.wait()
+        return [find_executable(f'tool_{index}', str(exe_dir)) for index in range(50)]
+
+    with concurrent.futures.ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(_find, range(16)))
+    expected = [pathlib.Path(exe_dir, f'tool_{index}.exe') for index in range(50)]
+    assert all(result == expected for result in results)
+    assert 50 == len(_find_exe._KNOWN_EXECUTABLES)
+
+
+@pytest.mark.long
+def test_stress():
+    _run_many(5000, 64)
+
+
+def test_runs_overlap():
+    # nothing serializes the runs: 8 processes sleeping one second each take about one second, not eight
+    cmd = [pathlib.Path(sys.executable), '-c', 'import time; time.sleep(1)']
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: run(cmd, mute=True), range(8)))
+    assert all(0 == result.return_code for result in results)
+    assert time.monotonic() - start < 4
+
+
+@pytest.mark.long
+@pytest.mark.skipif((os.cpu_count() or 1) < 4, reason='measures scaling over at least 4 cores')
+def test_throughput_scaling():
+    single = _run_many(300, 1)
+    threaded = {threads: _run_many(300, threads) for threads in (4, 16, 64)}
+    print(f'runs per second: {single:.0f} with 1 thread, ' +
+          ', '.join(f'{rate:.0f} with {threads} threads' for threads, rate in threaded.items()))
+    # spawning is CPU-bound: with 4 cores or more, 4 threads should at least go half as fast again as one
+    assert threaded[4] > single * 1.5
@@ -0,0 +1,66 @@
+# coding=utf-8
+
+import pathlib
+import sys
+
+import pytest
+
+from elib_run import LineTimings, run
+
+_PYTHON = pathlib.Path(sys.executable)
+
+
+@pytest.fixture(name='timings')
+def _timings():
+    timings = LineTimings()
+    for line_time in (0.5, 0.5005, 0.6, 3.6, 3.65, 13.65):
+        timings.append(line_time)
+    return timings
+
+
+def test_timings(timings):
+    assert 6 == len(timings)
+    assert 3.6 == timings[3]
+    assert 'LineTimings(6 lines)' == repr(timings)
+    assert [0.5, 0.0005, 0.0995, 3.0, 0.05, 10.0] == pytest.approx(list(timings.gaps()))
+
+
+def test_longest_silences(timings):
+    silences = timings.longest_silences(2)
+    assert [5, 3] == [silence.line for silence in silences]
+    assert pytest.approx(3.65) == silences[0].start
+    assert pytest.approx(10) == silences[0].duration
+    assert pytest.approx(0.6) == silences[1].start
+    assert 6 == len(timings.longest_silences(10))
+
+
+def test_histogram(timings):
+    assert [
+        (0.001, 1), (0.01, 0), (0.1, 2), (1.0, 1), (10.0, 2), (60.0, 0), (float('inf'), 0)
+    ] == timings.histogram()
+    assert [(1.0, 4)] == timings.histogram([1.0])
+
+
+def test_lines_between(timings):
+    assert range(2, 4) == timings.lines_between(0.6, 3.65)
+    assert range(0, 0) == timings.lines_between(0, 0.1)
+
+
+def test_empty():
+    timings = LineTimings()
+    assert [] == list(timings.gaps())
+    assert [] == timings.longest_silences()
+    assert all(count == 0 for _, count in timings.histogram())
+
+
+def test_run_timestamps():
+    code = 'import time; print("first", flush=True); time.sleep(0.5); print("second"); print("third")'
+    result = run([_PYTHON, '-c', code], timestamps=True, filters='third')
+    assert 2 == len(result.timings)
+    silence = result.timings.longest_silences(1)[0]
+    assert 1 == silence.line
+    assert silence.duration >= 0.4
+
+
+def test_run_no_timestamps():
+    assert run([_PYTHON, '-c', 'print("line")']).timings is None
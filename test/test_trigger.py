@@ -0,0 +1,35 @@
+# coding=utf-8
+
+import pytest
+
+# noinspection PyProtectedMember
+from elib_run._run._trigger import Trigger
+
+
+@pytest.mark.parametrize(
+    'pattern,line,expected',
+    (
+        ['ready', 'ready to serve', True],
+        ['ready', 'not ready', False],
+        ['.*ready', 'not ready', True],
+        [r'FATAL: \d+', 'FATAL: 12', True],
+    )
+)
+def test_matches(pattern, line, expected):
+    assert expected is Trigger(pattern).matches(line)
+
+
+@pytest.mark.parametrize('pattern', (None, 1, b'ready', ['ready']))
+def test_wrong_pattern(pattern):
+    with pytest.raises(TypeError):
+        Trigger(pattern)
+
+
+def test_wrong_action():
+    with pytest.raises(ValueError):
+        Trigger('ready', action='explode')
+
+
+def test_callback_missing():
+    with pytest.raises(TypeError):
+        Trigger('ready', action='callback')